@@ -3,9 +3,12 @@ import asyncio
 from unicodedata import east_asian_width
 from wcwidth import wcwidth, wcswidth
 from dataclasses import dataclass
-import time, re, linecache, os
+import time, re, os, sys, mmap, struct, zlib, operator, functools, json
+from array import array
+from collections import OrderedDict
+from itertools import accumulate, repeat
 from typing import Optional, List, Dict
-from typing import Iterable, Optional, Tuple
+from typing import Callable, Iterable, Optional, Tuple
 from prompt_toolkit import ANSI
 from prompt_toolkit.application import get_app
 from prompt_toolkit.formatted_text import to_formatted_text
@@ -577,6 +580,40 @@ class SessionSelectionState:
         return -1
 
 
+SEARCH_CHUNK_LINES = 2000       # 搜索时每次合并匹配的行数
+
+def search_lines(lines: List[str], first_lineno: int, regex: "re.Pattern", limit: int = 100) -> List[Tuple[int, str]]:
+    """
+    在行列表中从后向前搜索与 regex 匹配的行，按去除ANSI标记后的纯文本匹配，最多返回 limit 行。
+
+    每次将 SEARCH_CHUNK_LINES 行合并后整体匹配（此时以 MULTILINE 模式匹配，使 ^ 和 $ 仍对应各行的首尾），未匹配的部分无需逐行处理。
+
+    :param lines: 要搜索的行
+    :param first_lineno: lines[0] 的绝对行号
+    :param regex: 已编译的正则表达式
+    :param limit: 最多返回的行数
+    :return: (绝对行号, 纯文本行内容) 的列表，行号大的在前
+    """
+    from .session import Session
+    plain = Session.PLAIN_TEXT_REGX.sub
+    block_regex = re.compile(regex.pattern, regex.flags | re.MULTILINE)
+    result = []
+    end = len(lines)
+    while end > 0 and len(result) < limit:
+        start = max(0, end - SEARCH_CHUNK_LINES)
+        block = lines[start:end]
+        if block_regex.search(plain("", "\n".join(block))):
+            for idx in range(len(block) - 1, -1, -1):
+                text = plain("", block[idx])
+                if regex.search(text):
+                    result.append((first_lineno + start + idx, text))
+                    if len(result) >= limit:
+                        break
+        end = start
+
+    return result
+
+
 class BufferBase:
     def __init__(self, name, newline = "\n", max_buffered_lines = 10000) -> None:
         self.name = name
@@ -584,6 +621,7 @@ class BufferBase:
         self.max_buffered_lines = max_buffered_lines
         self.start_lineno = -1
         self.selection = SessionSelectionState(-1, -1, -1, -1)
+        self.generation = 0                     # 缓冲区内容被整体替换（如载入其他文件）时递增，显示控件据此清空渲染缓存
 
         self.mouse_point = Point(-1, -1)
 
@@ -594,21 +632,60 @@ class BufferBase:
     def lineCount(self) -> int:
         return 0
 
+    @property
+    def first_lineno(self) -> int:
+        "缓冲区首行（即 getLine(0)）的绝对行号。绝对行号在行被移出缓冲区后保持不变，选择区域使用绝对行号记录"
+        return 0
+
+    @property
+    def next_lineno(self) -> int:
+        "下一次写入的内容所在行的绝对行号。最后一行尚未结束时，即为最后一行的行号"
+        return self.first_lineno + self.lineCount
+
     def getLine(self, lineno: int) -> str:
         return ""
 
+    def getAbsLine(self, lineno: int) -> str:
+        "按绝对行号获取行内容，该行已被移出缓冲区时返回空字符串"
+        return self.getLine(lineno - self.first_lineno)
+
+    def getLineColor(self, lineno: int) -> Optional[str]:
+        """
+        获取指定行开始时生效的ANSI颜色/样式（SGR）序列，即之前各行累积下来的颜色状态。
+        返回空字符串表示默认样式，返回None表示该缓冲区不记录颜色状态（此时由显示控件向前查找颜色）。
+        """
+        return None
+
+    def memory_usage(self) -> int:
+        "缓冲区内容占用的内存字节数（估算值）"
+        return 0
+
+    def searcher(self, regex: "re.Pattern", limit: int = 100) -> Callable[[], List[Tuple[int, str]]]:
+        """
+        获取在缓冲区中搜索 regex 的函数，结果参见 search_lines。
+        缓冲区内容的快照在调用本函数时获取，返回的函数仅使用该快照，因此可以在后台线程中执行。
+        """
+        lines = [self.getLine(i) for i in range(self.lineCount)]
+        return functools.partial(search_lines, lines, self.first_lineno, regex, limit)
+
+    def jump_to(self, lineno: int, context: int = 3):
+        "分屏显示，并使上半部分从绝对行号为 lineno 的行之前 context 行开始显示"
+        self.start_lineno = max(0, lineno - self.first_lineno - context)
+
     # 获取指定某行到某行的内容。当start未设置时，从首行开始。当end未设置时，到最后一行结束。
     # 注意判断首位顺序逻辑，以及给定参数是否越界
     def selection_range_at_line(self, lineno: int) -> Optional[Tuple[int, int]]:
+        # lineno 为显示行号，选择区域记录的是绝对行号
+        lineno += self.first_lineno
         if self.selection.is_valid():
             if self.selection.rows > 1:
                 
                 if lineno == self.selection.actual_start_row:
-                    return (self.selection.actual_start_col, len(self.getLine(lineno)))
+                    return (self.selection.actual_start_col, len(self.getAbsLine(lineno)))
                 elif lineno == self.selection.actual_end_row:
                     return (0, self.selection.actual_end_col)
                 elif lineno > self.selection.actual_start_row and lineno < self.selection.actual_end_row:
-                    return (0, len(self.getLine(lineno)))
+                    return (0, len(self.getAbsLine(lineno)))
 
             elif self.selection.rows == 1:
                 if lineno == self.selection.start_row:
@@ -625,6 +702,18 @@ class BufferBase:
 
 
 class SessionBuffer(BufferBase):
+    """
+    会话显示缓冲区。
+
+    使用固定容量（max_buffered_lines）的环形缓冲区保存行内容，追加和移出行均为 O(1) 操作。max_buffered_lines 为0时表示不限制行数（早期版本为不保留任何行）。
+    缓冲区容量固定，因此向上翻页查看（start_lineno >= 0）时超出容量的行同样被移出，此时 start_lineno 随之减小，使查看的内容保持不动，直至其本身被移出。
+    早期版本在翻页查看期间暂停移出，行数可以超出 max_buffered_lines。
+    每行具有不变的绝对行号（从会话开始计数），缓冲区首行的绝对行号为 first_lineno，因此行被移出时无需调整选择区域。
+    追加内容时同时跟踪ANSI颜色/样式（SGR）状态，并为每行记录该行开始时生效的颜色状态（以状态编号保存），显示时无需向前查找。
+    """
+
+    SGR_REGX = re.compile(r"\x1b\[([\d;]*)m")
+
     def __init__(
         self, 
         name, 
@@ -634,9 +723,118 @@ class SessionBuffer(BufferBase):
 
         super().__init__(name, newline, max_buffered_lines)
 
-        self._lines : List[str] = []
+        self._capacity = max(0, max_buffered_lines)
+        self._first = 0             # 缓冲区首行的绝对行号
+        self._total = 0             # 下一行的绝对行号
         self._isnewline = True
 
+        # SGR 状态。各行的颜色状态以编号保存，编号对应的SGR序列保存在 _colors 中，0 表示默认样式
+        self._colors : List[str] = [""]
+        self._color_ids : Dict[str, int] = {"": 0}
+        self._color = 0
+        self._fg, self._bg, self._attrs = None, None, set()
+
+        self._reset_storage()
+
+    # 以下 _reset_storage, _store, _extend_last, _evict, getLine, _lineColorId 为存储相关实现，其他存储方式的缓冲区可以覆盖这些方法
+    def _reset_storage(self):
+        self._ring : List[str] = [""] * self._capacity
+        self._ring_colors = array("I", [0]) * self._capacity
+
+    def _slot(self, lineno: int) -> int:
+        "绝对行号在 _ring 中的位置"
+        if self._capacity:
+            return lineno % self._capacity
+        return lineno - self._first
+
+    def _store(self, line: str, color: int):
+        "保存新的一行及该行开始时的颜色状态编号，该行的绝对行号为 self._total"
+        if self._capacity:
+            self._ring[self._total % self._capacity] = line
+            self._ring_colors[self._total % self._capacity] = color
+        else:
+            self._ring.append(line)
+            self._ring_colors.append(color)
+
+    def _extend_last(self, text: str):
+        "将文本追加到最后一行"
+        self._ring[self._slot(self._total - 1)] += text
+
+    def _evict(self):
+        "移出首行，此时 self._first 已指向新的首行。环形缓冲区中首行已被新行覆盖，无需处理"
+        pass
+
+    def _lineColorId(self, lineno: int) -> int:
+        "显示行号为 lineno 的行开始时的颜色状态编号"
+        return self._ring_colors[self._slot(self._first + lineno)]
+
+    def _apply_sgr(self, text: str):
+        "根据文本中的SGR序列更新当前颜色状态"
+        if "\x1b[" not in text:
+            return
+
+        fg, bg, attrs = self._fg, self._bg, self._attrs
+        for match in self.SGR_REGX.finditer(text):
+            params = match.group(1).split(";")
+            idx = 0
+            while idx < len(params):
+                code = int(params[idx]) if params[idx] else 0
+                if code == 0:
+                    fg, bg = None, None
+                    attrs.clear()
+                elif code in (38, 48):
+                    # 256色: 38;5;n，真彩色: 38;2;r;g;b
+                    mode = params[idx + 1] if idx + 1 < len(params) else ""
+                    count = 3 if mode == "5" else 5 if mode == "2" else 1
+                    color = ";".join(params[idx:idx + count]) if count > 1 else None
+                    if code == 38:
+                        fg = color
+                    else:
+                        bg = color
+                    idx += count - 1
+                elif 30 <= code <= 37 or 90 <= code <= 97:
+                    fg = str(code)
+                elif code == 39:
+                    fg = None
+                elif 40 <= code <= 47 or 100 <= code <= 107:
+                    bg = str(code)
+                elif code == 49:
+                    bg = None
+                elif 1 <= code <= 9:
+                    attrs.add(code)
+                elif code == 22:
+                    attrs.discard(1)
+                    attrs.discard(2)
+                elif 23 <= code <= 29:
+                    attrs.discard(code - 20)
+                idx += 1
+
+        self._fg, self._bg = fg, bg
+
+        codes = [str(attr) for attr in sorted(attrs)]
+        if fg: codes.append(fg)
+        if bg: codes.append(bg)
+        sgr = f"\x1b[{';'.join(codes)}m" if codes else ""
+
+        color = self._color_ids.get(sgr, None)
+        if color is None:
+            color = len(self._colors)
+            self._colors.append(sgr)
+            self._color_ids[sgr] = color
+        self._color = color
+
+    def _push(self, line: str):
+        self._store(line, self._color)
+        self._apply_sgr(line)
+        self._total += 1
+
+        if self._capacity and (self._total - self._first > self._capacity):
+            # 最早的一行被移出。若正在向上翻页查看，则保持显示内容不动
+            self._first += 1
+            self._evict()
+            if self.start_lineno > 0:
+                self.start_lineno -= 1
+
     def append(self, line: str):
         """
         追加文本到缓冲区。
@@ -647,38 +845,32 @@ class SessionBuffer(BufferBase):
         if line.endswith(self.newline):
             line = line.rstrip(self.newline)
             newline_after_append = True
-            
+
         if not self.newline in line:
-            if self._isnewline:
-                self._lines.append(line)
+            if self._isnewline or self._total == self._first:
+                self._push(line)
             else:
-                self._lines[-1] += line
+                self._extend_last(line)
+                self._apply_sgr(line)
 
         else:
             lines = line.split(self.newline)
-            if self._isnewline:
-                self._lines.extend(lines)
+            if self._isnewline or self._total == self._first:
+                self._push(lines[0])
             else:
-                self._lines[-1] += lines[0]
-                self._lines.extend(lines[1:])
-
-        self._isnewline = newline_after_append
+                self._extend_last(lines[0])
+                self._apply_sgr(lines[0])
 
-        ## limit buffered lines
-        if self.start_lineno < 0 and len(self._lines) > self.max_buffered_lines:
-            diff = len(self._lines) - self.max_buffered_lines
-            del self._lines[:diff]
-            ## adjust selection
-            if self.selection.start_row >= 0:
-                self.selection.start_row -= diff
-                self.selection.end_row -= diff
+            for ln in lines[1:]:
+                self._push(ln)
 
-        get_app().invalidate()
+        self._isnewline = newline_after_append
 
     def clear(self):
         self.exit_selection()
         self._isnewline = True
-        self._lines.clear()
+        self._first = self._total
+        self._reset_storage()
         self.nosplit()
 
     def forceNewline(self):
@@ -686,15 +878,119 @@ class SessionBuffer(BufferBase):
 
     @property
     def lineCount(self):
-        return len(self._lines)
+        return self._total - self._first
+
+    @property
+    def first_lineno(self):
+        return self._first
+
+    @property
+    def next_lineno(self):
+        return self._total if self._isnewline else self._total - 1
         
     def getLine(self, lineno: int):
-        if lineno < 0 or lineno >= len(self._lines):
+        if lineno < 0 or lineno >= self._total - self._first:
+            return ""
+        return self._ring[self._slot(self._first + lineno)]
+
+    def getLineColor(self, lineno: int) -> Optional[str]:
+        if lineno < 0 or lineno >= self._total - self._first:
             return ""
-        return self._lines[lineno]
+        return self._colors[self._lineColorId(lineno)]
+
+    def searcher(self, regex: "re.Pattern", limit: int = 100) -> Callable[[], List[Tuple[int, str]]]:
+        # 环形列表按首行位置拆为两段复制，仅复制引用
+        count = self._total - self._first
+        start = self._slot(self._first)
+        if self._capacity and (start + count > self._capacity):
+            lines = self._ring[start:] + self._ring[:start + count - self._capacity]
+        else:
+            lines = self._ring[start:start + count]
+        return functools.partial(search_lines, lines, self._first, regex, limit)
+
+    def memory_usage(self) -> int:
+        size = sys.getsizeof(self._ring) + sys.getsizeof(self._ring_colors)
+        for lineno in range(self._first, self._total):
+            size += sys.getsizeof(self._ring[self._slot(lineno)])
+        return size
+
+
+class CompactSessionBuffer(SessionBuffer):
+    """
+    紧凑存储的会话显示缓冲区。
+
+    所有行以UTF-8编码连续保存在一个 bytearray 中，并使用 array('I') 记录每行的起始偏移，仅在 getLine 时解码。
+    相比每行一个 str 对象的 SessionBuffer，可以大幅减少长时间挂机、多会话时的内存占用，代价是每次显示时需要解码。
+    移出的行不会立即从 bytearray 中删除，当已移出的行数超过保留行数时，一次性进行压缩，因此追加的均摊开销仍为 O(1)。
+    """
+    def _reset_storage(self):
+        self._arena = bytearray()
+        self._offsets = array("I")
+        self._line_colors = array("I")
+        self._head = 0              # 首行在 _offsets 中的位置
+
+    def _store(self, line: str, color: int):
+        self._offsets.append(len(self._arena))
+        self._line_colors.append(color)
+        self._arena += line.encode("utf-8", "surrogatepass")
+
+    def _extend_last(self, text: str):
+        # 最后一行总是位于 _arena 末尾
+        self._arena += text.encode("utf-8", "surrogatepass")
+
+    def _evict(self):
+        self._head += 1
+        if self._head >= self._capacity:
+            cut = self._offsets[self._head]
+            del self._arena[:cut]
+            self._offsets = array("I", [offset - cut for offset in self._offsets[self._head:]])
+            self._line_colors = self._line_colors[self._head:]
+            self._head = 0
+
+    def getLine(self, lineno: int):
+        if lineno < 0 or lineno >= self._total - self._first:
+            return ""
+
+        idx = self._head + lineno
+        start = self._offsets[idx]
+        end = self._offsets[idx + 1] if idx + 1 < len(self._offsets) else len(self._arena)
+        return self._arena[start:end].decode("utf-8", "surrogatepass")
+
+    def _lineColorId(self, lineno: int) -> int:
+        return self._line_colors[self._head + lineno]
+
+    def searcher(self, regex: "re.Pattern", limit: int = 100) -> Callable[[], List[Tuple[int, str]]]:
+        # 复制字节内容与偏移，解码在搜索线程中进行
+        arena = bytes(self._arena)
+        offsets = self._offsets[self._head:]
+        first = self._first
+
+        def search():
+            ends = offsets[1:].tolist() + [len(arena)]
+            lines = [arena[start:end].decode("utf-8", "surrogatepass") for start, end in zip(offsets, ends)]
+            return search_lines(lines, first, regex, limit)
+
+        return search
+
+    def memory_usage(self) -> int:
+        return sys.getsizeof(self._arena) + sys.getsizeof(self._offsets) + sys.getsizeof(self._line_colors)
 
 
 class LogFileBuffer(BufferBase):
+    """
+    记录文件显示缓冲区，用于在记录页显示记录文件（#log show）。
+
+    文件通过 mmap 映射后按需读取，不整体载入内存。各行起始位置的偏移量索引在首次访问时建立，getLine 为 O(1) 操作。
+    对仍在增长的记录文件，每次获取行数时仅为新增部分扩展索引。
+    较大文件的索引会保存在同目录下的 文件名.idx 中，下次打开同一文件时直接载入，文件内容被覆写时索引自动重建。
+    """
+
+    INDEX_MAGIC = b"PYMUDIX1"
+    INDEX_HEADER = struct.Struct("<8sQI")       # 标识，已索引的文件大小，文件开头内容的CRC32
+    INDEX_HEAD_BYTES = 4096                     # 用于判断文件是否被覆写的开头字节数
+    INDEX_MIN_SIZE = 1 << 20                    # 超过该大小的文件才保存索引文件
+    SCAN_CHUNK = 1 << 24                        # 建立索引时每次扫描的字节数
+
     def __init__(
         self,
         name,
@@ -702,36 +998,190 @@ class LogFileBuffer(BufferBase):
         ) -> None:
 
         super().__init__(name)
-        self._lines : Dict[int, str] = {}
+        self._file = None
+        self._mmap = None
+        self._size = 0                          # 已映射的文件大小
+        self._offsets = None                    # 各行起始偏移量，最后一项为已索引部分之后下一行的起始位置
+        self._indexed = 0                       # 已建立索引的文件大小
+        self._saved_size = 0                    # 索引文件中已保存的索引对应的文件大小
+        self.filepath = None
         self.loadfile(filepath)
         
     def loadfile(self, filepath: Optional[str] = None):
+        self._close()
         if filepath and os.path.exists(filepath):
             self.filepath = filepath
         else:
             self.filepath = None
 
     def clear(self):
+        self._close()
         self.filepath = None
 
+    @property
+    def index_path(self) -> Optional[str]:
+        "索引文件路径"
+        return f"{self.filepath}.idx" if self.filepath else None
+
+    def _close(self, save = True):
+        if save and (self._offsets is not None):
+            self._saveIndex()
+
+        # 关闭后行号重新从0开始，已渲染的行不再有效
+        self.generation += 1
+
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+
+        self._file = None
+        self._mmap = None
+        self._size = 0
+        self._offsets = None
+        self._indexed = 0
+        self._saved_size = 0
+
+    def _headCrc(self, size: int) -> int:
+        return zlib.crc32(self._mmap[:min(size, self.INDEX_HEAD_BYTES)]) if self._mmap is not None else 0
+
+    def _loadIndex(self):
+        "载入索引文件，文件已被覆写或索引文件无效时忽略"
+        try:
+            with open(self.index_path, "rb") as fp:
+                data = fp.read()
+            magic, indexed, crc = self.INDEX_HEADER.unpack_from(data)
+            if (magic != self.INDEX_MAGIC) or (indexed > self._size) or (crc != self._headCrc(indexed)):
+                return
+
+            offsets = array("Q")
+            offsets.frombytes(data[self.INDEX_HEADER.size:])
+            if offsets and offsets[-1] <= indexed:
+                self._offsets = offsets
+                self._indexed = indexed
+                self._saved_size = indexed
+        except (OSError, ValueError, struct.error):
+            pass
+
+    def _saveIndex(self):
+        "保存索引文件，仅大文件且索引有扩展时保存"
+        if (self._indexed < self.INDEX_MIN_SIZE) or (self._indexed == self._saved_size):
+            return
+
+        try:
+            with open(self.index_path, "wb") as fp:
+                fp.write(self.INDEX_HEADER.pack(self.INDEX_MAGIC, self._indexed, self._headCrc(self._indexed)))
+                fp.write(self._offsets.tobytes())
+            self._saved_size = self._indexed
+        except OSError:
+            pass
+
+    def _scan(self, start: int, end: int):
+        "为文件 [start, end) 区间扩展行索引"
+        offsets = self._offsets
+        pos = start
+        while pos < end:
+            chunk_end = min(end, pos + self.SCAN_CHUNK)
+            parts = self._mmap[pos:chunk_end].split(b"\n")
+            # 除最后一段外，每段之后均有一个换行符，下一行从换行符之后开始。以下均在C层面迭代，不逐行执行Python代码
+            starts = accumulate(map(operator.add, map(len, parts[:-1]), repeat(1)))
+            offsets.extend(map(operator.add, starts, repeat(pos)))
+            pos = chunk_end
+        self._indexed = end
+
+    def _refresh(self):
+        "检查文件大小，映射并为新增内容扩展索引"
+        if not self.filepath:
+            return
+
+        try:
+            if self._file is None:
+                self._file = open(self.filepath, "rb")
+            size = os.fstat(self._file.fileno()).st_size
+        except OSError:
+            self._close()
+            return
+
+        if size < self._size:
+            # 文件被截断（如以覆写模式重新开始记录），原映射及索引均已失效，重新建立索引
+            self._close(save = False)
+            self._refresh()
+            return
+
+        if size > self._size:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+            self._size = size
+
+        if self._offsets is None:
+            self._offsets = array("Q", (0, ))
+            self._indexed = 0
+            if self._size:
+                self._loadIndex()
+
+        if self._indexed < self._size:
+            self._scan(self._indexed, self._size)
+            if self._saved_size == 0:
+                self._saveIndex()
+
     @property
     def lineCount(self):
-        if not self.filepath or not os.path.exists(self.filepath):
+        self._refresh()
+        if not self._offsets:
             return 0
 
-        with open(self.filepath, 'r', encoding = 'utf-8', errors = 'ignore') as fp:
-            return sum(1 for _ in fp)
+        # 文件末尾没有换行符时，最后的不完整行也作为一行
+        count = len(self._offsets)
+        if self._offsets[-1] >= self._size:
+            count -= 1
+        return count
 
     def getLine(self, lineno: int):
-        if not self.filepath or not os.path.exists(self.filepath):
+        if self._offsets is None:
+            self._refresh()
+
+        if (self._mmap is None) or (lineno < 0) or (lineno >= len(self._offsets)):
             return ""
 
-        return linecache.getline(self.filepath, lineno).rstrip(self.newline)
+        start = self._offsets[lineno]
+        end = self._offsets[lineno + 1] if lineno + 1 < len(self._offsets) else self._size
+        return self._mmap[start:end].decode("utf-8", errors = "ignore").rstrip("\r\n")
+
+    def memory_usage(self) -> int:
+        return self._offsets.itemsize * len(self._offsets) if self._offsets is not None else 0
+
+    def searcher(self, regex: "re.Pattern", limit: int = 100) -> Callable[[], List[Tuple[int, str]]]:
+        # 搜索线程另行映射文件，不受显示时重新映射的影响。行偏移复制一份，每次解码 SEARCH_CHUNK_LINES 行进行匹配
+        count = self.lineCount
+        if count == 0:
+            return lambda: []
+
+        filepath = self.filepath
+        offsets = self._offsets[:count + 1]
+        size = self._size
+
+        def search():
+            result = []
+            with open(filepath, "rb") as fp, mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+                end = count
+                while end > 0 and len(result) < limit:
+                    start = max(0, end - SEARCH_CHUNK_LINES)
+                    stop = offsets[end] if end < len(offsets) else size
+                    lines = mm[offsets[start]:stop].decode("utf-8", errors = "ignore").split("\n")
+                    result.extend(search_lines(lines[:end - start], start, regex, limit - len(result)))
+                    end = start
+            return result
+
+        return search
 
     def __del__(self):
-        self._lines.clear()
+        self._close()
 
 class PyMudBufferControl(UIControl):
+    RENDER_CACHE_SIZE = 2000        # 行渲染缓存的最大行数
+    ASTRAL_REGX = re.compile("[\U00010000-\U0010FFFF]")
+
     def __init__(self, buffer: Optional[BufferBase]) -> None:
         self.buffer = buffer
 
@@ -751,6 +1201,11 @@ class PyMudBufferControl(UIControl):
         self._color_line_index = 0
 
         self._last_click_timestamp = 0
+        self._width_trans = None    # 美化校正的字符转换表，首次使用时生成
+
+        # 行渲染缓存，键为 (绝对行号, 宽度, beautify, tabstop)，值为 (原始行内容, 渲染结果)
+        self._render_cache : OrderedDict = OrderedDict()
+        self._render_buffer = None
 
     def reset(self) -> None:
         # Default reset. (Doesn't have to be implemented.)
@@ -766,53 +1221,54 @@ class PyMudBufferControl(UIControl):
         return False
 
     def width_correction(self, line: str) -> str:
-        new_str = []
-        for idx, ch in enumerate(line):
-            if (east_asian_width(ch) in "FWA") and (wcwidth(ch) == 1):
-                
-                if ch in self.FULL_BLOCKS:
-                    new_str.append(ch)
-                    new_str.append(ch)
-                elif ch in self.SINGLE_LINES:
-                    new_str.append(ch)
-                    new_str.append("─")
-                elif ch in self.DOUBLE_LINES:
-                    new_str.append(ch)
-                    new_str.append("═")
-                elif ch in self.THICK_LINES:
-                    new_str.append(ch)
-                    new_str.append("━")
-                else:
-                    new_str.append(ch)
-                    new_str.append(" ")
-
-                # 恢复为统一右侧添加补充显示字符，以下为往左添加字符的代码，暂保留注释
-                # else:
-                #     right = str.rstrip(line[idx+1:])
-                #     right_len = fragment_list_width(to_formatted_text(ANSI(right)))
-                #     if (idx == len(line) - 1) or (right_len == 0):
-                #         if ch in self.SINGLE_LINES_LEFT:
-                #             new_str.append("─")
-                #             new_str.append(ch)
-                #         elif ch in self.DOUBLE_LINES_LEFT:
-                #             new_str.append("═")
-                #             new_str.append(ch)
-                #         elif ch in self.THICK_LINES_LEFT:
-                #             new_str.append("━")
-                #             new_str.append(ch)
-                #         elif ch in self.TABLE_LINES:
-                #             new_str.append(" ")
-                #             new_str.append(ch)
-                #         else:
-                #             new_str.append(ch)
-                #             new_str.append(' ')
-                #     else:
-                #         new_str.append(ch)
-                #         new_str.append(' ')
-            else:
-                new_str.append(ch)
+        # 纯ASCII的行不需校正。BMP字符使用由宽度表生成的转换表一次替换，BMP以外的字符再逐个判断
+        if line.isascii():
+            return line
+
+        if self._width_trans is None:
+            self._width_trans = {ord(ch): self.char_correction(ch) for ch in ambiguous_width_chars()}
+
+        line = line.translate(self._width_trans)
+        if self.ASTRAL_REGX.search(line):
+            line = self.ASTRAL_REGX.sub(lambda m: self.char_correction(m.group()) if is_ambiguous_width(m.group()) else m.group(), line)
 
-        return "".join(new_str)
+        return line
+
+    def char_correction(self, ch: str) -> str:
+        "需要美化校正的单个字符的替换内容"
+        # 恢复为统一右侧添加补充显示字符，以下为往左添加字符的代码，暂保留注释
+        # else:
+        #     right = str.rstrip(line[idx+1:])
+        #     right_len = fragment_list_width(to_formatted_text(ANSI(right)))
+        #     if (idx == len(line) - 1) or (right_len == 0):
+        #         if ch in self.SINGLE_LINES_LEFT:
+        #             new_str.append("─")
+        #             new_str.append(ch)
+        #         elif ch in self.DOUBLE_LINES_LEFT:
+        #             new_str.append("═")
+        #             new_str.append(ch)
+        #         elif ch in self.THICK_LINES_LEFT:
+        #             new_str.append("━")
+        #             new_str.append(ch)
+        #         elif ch in self.TABLE_LINES:
+        #             new_str.append(" ")
+        #             new_str.append(ch)
+        #         else:
+        #             new_str.append(ch)
+        #             new_str.append(' ')
+        #     else:
+        #         new_str.append(ch)
+        #         new_str.append(' ')
+        if ch in self.FULL_BLOCKS:
+            return ch + ch
+        elif ch in self.SINGLE_LINES:
+            return ch + "─"
+        elif ch in self.DOUBLE_LINES:
+            return ch + "═"
+        elif ch in self.THICK_LINES:
+            return ch + "━"
+        else:
+            return ch + " "
     
     def return_correction(self, line: str):
         return line.replace("\r", "").replace("\x00", "")
@@ -843,6 +1299,53 @@ class PyMudBufferControl(UIControl):
 
         return line
 
+    def render_line(self, buffer: BufferBase, i: int, line: str) -> StyleAndTextTuples:
+        "渲染缓冲区中的第 i 行（内容为 line），进行颜色、显示校正并生成 FormattedText，不含选择区域"
+        # 颜色校正，缓冲区记录了各行开始时的颜色状态时直接使用
+        SEARCH_LINES = 50
+        color = buffer.getLineColor(i)
+        if color is not None:
+            line = f"{color}{line}"
+
+        elif len(self.AVAI_COLOR_REGX.findall(line)) == 0:
+            lineno = i - 1
+            search = 0
+            while lineno >= 0 and search < SEARCH_LINES:
+                search += 1
+
+                lastline = buffer.getLine(lineno)
+                allcolors = self.ALL_COLOR_REGX.findall(lastline)
+                
+                if len(allcolors) == 0:
+                    lineno = lineno - 1
+
+                elif len(allcolors) == 1:
+                    colors = self.AVAI_COLOR_REGX.findall(lastline)
+                    
+                    if len(colors) == 1:
+                        line = f"{colors[0]}{line}"
+                        break
+
+                    else:
+                        break
+
+                else:
+                    break
+
+        
+        # 其他校正
+        line = self.line_correction(line)
+        #line = self.return_correction(line)
+
+        # 处理ANSI标记（生成FormmatedText）
+        fragments = to_formatted_text(ANSI(line))
+        #fragments = explode_text_fragments(fragments)
+
+        # if Settings.client["beautify"]:
+        #     fragments = self.fragment_correction(fragments)
+
+        return fragments
+
     def create_content(self, width: int, height: int) -> UIContent:
         """
         Generate the content for this user control.
@@ -857,47 +1360,30 @@ class PyMudBufferControl(UIControl):
                 cursor_position = None
             )
 
-        def get_line(i: int) -> StyleAndTextTuples:
-            line = buffer.getLine(i)
-            # 颜色校正
-            SEARCH_LINES = 50
-            thislinecolors = len(self.AVAI_COLOR_REGX.findall(line))
-            if thislinecolors == 0:
-                lineno = i - 1
-                search = 0
-                while lineno >= 0 and search < SEARCH_LINES:
-                    search += 1
-
-                    lastline = buffer.getLine(lineno)
-                    allcolors = self.ALL_COLOR_REGX.findall(lastline)
-                    
-                    if len(allcolors) == 0:
-                        lineno = lineno - 1
-
-                    elif len(allcolors) == 1:
-                        colors = self.AVAI_COLOR_REGX.findall(lastline)
-                        
-                        if len(colors) == 1:
-                            line = f"{colors[0]}{line}"
-                            break
+        # 切换显示的缓冲区，或缓冲区内容被整体替换（如 LogFileBuffer 载入其他文件）时清空渲染缓存
+        render_buffer = (buffer, buffer.generation)
+        if render_buffer != self._render_buffer:
+            self._render_cache.clear()
+            self._render_buffer = render_buffer
 
-                        else:
-                            break
+        cache = self._render_cache
+        first_lineno = buffer.first_lineno
+        settings_key = (width, Settings.client["beautify"], Settings.client["tabstop"])
 
-                    else:
-                        break
-
-            
-            # 其他校正
-            line = self.line_correction(line)
-            #line = self.return_correction(line)
-
-            # 处理ANSI标记（生成FormmatedText）
-            fragments = to_formatted_text(ANSI(line))
-            #fragments = explode_text_fragments(fragments)
-
-            # if Settings.client["beautify"]:
-            #     fragments = self.fragment_correction(fragments)
+        def get_line(i: int) -> StyleAndTextTuples:
+            raw = buffer.getLine(i)
+
+            # 渲染缓存。仅最后一行会被修改，因此同时校验原始行内容，内容变化时重新渲染
+            key = (first_lineno + i, ) + settings_key
+            cached = cache.get(key)
+            if cached and cached[0] == raw:
+                cache.move_to_end(key)
+                fragments = cached[1]
+            else:
+                fragments = self.render_line(buffer, i, raw)
+                cache[key] = (raw, fragments)
+                if len(cache) > self.RENDER_CACHE_SIZE:
+                    cache.popitem(last = False)
 
             # 选择内容标识
             selected_fragment = " class:selected "
@@ -908,11 +1394,11 @@ class PyMudBufferControl(UIControl):
             if selection_at_line:
                 from_, to = selection_at_line
                 total_display = fragment_list_width(fragments)
-                if to == len(buffer.getLine(i)):
+                if to == len(raw):
                     to = total_display
 
-
-                fragments = explode_text_fragments(fragments)
+                # 在缓存结果的副本上标识选择区域
+                fragments = explode_text_fragments(list(fragments))
 
                 if from_ == 0 and to == 0 and len(fragments) == 0:
                     # When this is an empty line, insert a space in order to
@@ -965,9 +1451,11 @@ class PyMudBufferControl(UIControl):
             if buffer:
                 # Set the selection position.
                 buffer.mouse_point = position
+                # 选择区域使用绝对行号记录
+                row = position.y + buffer.first_lineno
                 if mouse_event.event_type == MouseEventType.MOUSE_DOWN:
                     buffer.exit_selection()
-                    buffer.selection.start_row = position.y
+                    buffer.selection.start_row = row
                     buffer.selection.start_col = position.x
 
                 elif (
@@ -976,7 +1464,7 @@ class PyMudBufferControl(UIControl):
                 ):
                     # Click and drag to highlight a selection
                     if buffer.selection.start_row >= 0 and not (position.y == 0 and position.x == 0):
-                        buffer.selection.end_row = position.y
+                        buffer.selection.end_row = row
                         buffer.selection.end_col = position.x
                     
 
@@ -988,7 +1476,7 @@ class PyMudBufferControl(UIControl):
                     # will be repositioned automatically.)
                     
                     if buffer.selection.start_row >= 0 and position.y >= 0:
-                        buffer.selection.end_row = position.y
+                        buffer.selection.end_row = row
                         buffer.selection.end_col = position.x
 
                     if not buffer.selection.is_valid():
@@ -1003,9 +1491,9 @@ class PyMudBufferControl(UIControl):
                     self._last_click_timestamp = time.time()
 
                     if double_click:
-                        buffer.selection.start_row = position.y
+                        buffer.selection.start_row = row
                         buffer.selection.start_col = 0
-                        buffer.selection.end_row = position.y
+                        buffer.selection.end_row = row
                         buffer.selection.end_col = len(buffer.getLine(position.y))
 
                     get_app().layout.focus("input")
@@ -1061,6 +1549,155 @@ class DotDict(dict):
         self.update(state)
 
 
+class TrackedDotDict(DotDict):
+    """
+    记录内容变化的 DotDict，用于会话变量的增量保存。
+
+    通过赋值、update、setdefault、pop、del、clear 等方式修改的键均被记录，可以使用 take_changes 取出自上次取出以来被修改及被删除的键。
+    直接修改变量值内部的内容（如向列表类型变量的值中添加元素）无法被记录，此时可重新赋值该变量，或使用 #save 进行完整保存。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        object.__setattr__(self, "_TrackedDotDict__changed", set())
+        object.__setattr__(self, "_TrackedDotDict__deleted", set())
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.__changed.add(key)
+        self.__deleted.discard(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.__changed.discard(key)
+        self.__deleted.add(key)
+
+    def pop(self, key, *args):
+        if key in self:
+            self.__changed.discard(key)
+            self.__deleted.add(key)
+        return super().pop(key, *args)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.__changed.discard(key)
+        self.__deleted.add(key)
+        return key, value
+
+    def setdefault(self, key, default = None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        self.__deleted.update(self.keys())
+        self.__changed.clear()
+        super().clear()
+
+    def __reduce__(self):
+        # 复制（copy/deepcopy）与 pickle 时经构造函数重建，副本的变化记录为空
+        return (self.__class__, (dict(self), ))
+
+    def changes_count(self) -> int:
+        "自上次 take_changes 以来被修改及被删除的键的个数"
+        return len(self.__changed) + len(self.__deleted)
+
+    def take_changes(self) -> Tuple[set, set]:
+        "取出并清除自上次取出以来被修改的键的集合与被删除的键的集合"
+        changed, deleted = self.__changed, self.__deleted
+        object.__setattr__(self, "_TrackedDotDict__changed", set())
+        object.__setattr__(self, "_TrackedDotDict__deleted", set())
+        return changed, deleted
+
+    def restore_changes(self, changed: Iterable, deleted: Iterable):
+        "将 take_changes 取出但未能保存的变化记录放回。取出之后又被修改或删除的键以当前记录为准"
+        current = self.__changed | self.__deleted
+        self.__changed.update(key for key in changed if key not in current)
+        self.__deleted.update(key for key in deleted if key not in current)
+
+
+# 字符显示宽度表。基本多文种平面（U+0000 - U+FFFF）的字符宽度在首次使用时一次性计算，其余字符仍直接使用 wcwidth 计算。
+# 表中每个字符一个字节: 低2位为 wcwidth 显示宽度（3 表示不可打印，即 wcwidth 返回 -1），
+# WIDTH_AMBIGUOUS 位表示该字符东亚宽度为 F/W/A 但 wcwidth 宽度为1，即在控制台中显示不对齐、需要美化校正的字符。
+WIDTH_AMBIGUOUS = 0x04
+_WIDTH_TABLE: Optional[bytearray] = None
+_AMBIGUOUS_CHARS: Optional[str] = None
+
+def _build_width_table():
+    global _WIDTH_TABLE, _AMBIGUOUS_CHARS
+
+    table = bytearray(0x10000)
+    ambiguous = []
+    for cp in range(0x10000):
+        ch = chr(cp)
+        width = wcwidth(ch)
+        value = 3 if width < 0 else width
+        if width == 1 and east_asian_width(ch) in "FWA":
+            value |= WIDTH_AMBIGUOUS
+            ambiguous.append(ch)
+        table[cp] = value
+
+    _AMBIGUOUS_CHARS = "".join(ambiguous)
+    _WIDTH_TABLE = table
+
+def width_table() -> bytearray:
+    "获取BMP字符显示宽度表，首次调用时生成"
+    if _WIDTH_TABLE is None:
+        _build_width_table()
+    return _WIDTH_TABLE
+
+def ambiguous_width_chars() -> str:
+    "获取所有需要美化校正（东亚宽度为 F/W/A 但 wcwidth 宽度为1）的BMP字符"
+    if _AMBIGUOUS_CHARS is None:
+        _build_width_table()
+    return _AMBIGUOUS_CHARS
+
+def is_ambiguous_width(ch: str) -> bool:
+    "判断字符是否需要美化校正，即东亚宽度为 F/W/A 但 wcwidth 宽度为1"
+    cp = ord(ch)
+    if cp < 0x10000:
+        return bool(width_table()[cp] & WIDTH_AMBIGUOUS)
+    return (wcwidth(ch) == 1) and (east_asian_width(ch) in "FWA")
+
+def char_width(ch: str) -> int:
+    "字符的显示宽度，与 wcwidth 相同，不可打印字符返回 -1"
+    cp = ord(ch)
+    if cp < 0x10000:
+        width = width_table()[cp] & 0x03
+        return -1 if width == 3 else width
+    return wcwidth(ch)
+
+# 零宽连接符（ZWJ）与变体选择符（VS15/VS16）会改变前后字符组成的序列宽度，无法逐字符查表累加
+_SEQUENCE_CHARS = frozenset("\u200d\ufe0e\ufe0f")
+
+def needs_wcswidth(text: str) -> bool:
+    "判断字符串是否含有非BMP字符、ZWJ或VS15/VS16，此时须整体使用 wcswidth 计算宽度，不能逐字符累加"
+    return (max(text, default = "\0") >= "\U00010000") or not _SEQUENCE_CHARS.isdisjoint(text)
+
+def str_width(text: str) -> int:
+    "字符串的显示宽度，与 wcswidth 相同，含有不可打印字符时返回 -1。纯ASCII可打印字符串直接返回长度"
+    if text.isascii() and text.isprintable():
+        return len(text)
+
+    if needs_wcswidth(text):
+        # emoji 序列等情况交由 wcswidth 处理
+        return wcswidth(text)
+
+    table = width_table()
+    total = 0
+    for ch in text:
+        width = table[ord(ch)] & 0x03
+        if width == 3:
+            return -1
+        total += width
+
+    return total
+
+
 # 构建一个DStr类型，替代str类型进行显示对齐操作。该类型在str的基础上，len方法返回其显示宽度，ljust/rjust/center均以显示宽度返回对齐的字符串。
 
 class DStr(str):
@@ -1068,7 +1705,7 @@ class DStr(str):
     
     def __len__(self):
         """返回字符串的显示宽度，而不是字符数量"""
-        return wcswidth(self.__str__())
+        return str_width(self.__str__())
     
     def ljust(self, width, fillchar=' '):
         """左对齐字符串，使用显示宽度进行计算"""
@@ -1162,3 +1799,456 @@ class ValuedEvent:
             # 如果事件已设置但future尚未完成，手动完成它
             self._future.set_result(self._value)
         return await self._future
+
+
+# 多模式字符串匹配自动机，用于在一次扫描中找出一行中包含的所有字面字符串（例如非正则触发器的匹配模式）
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式字符串匹配自动机。
+
+    对给定的若干字面字符串构建自动机后，search 只需对文本扫描一次，即可找出文本中出现的所有字符串，
+    代价与字符串的个数无关。
+
+    :param words: 要匹配的字符串集合，空字符串将被忽略
+    """
+    def __init__(self, words: Iterable[str]):
+        self.words = frozenset(w for w in words if w)
+        self._goto: List[Dict[str, int]] = [dict()]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[str, ...]] = [()]
+
+        # 构建字典树
+        for word in self.words:
+            state = 0
+            for ch in word:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append(dict())
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] = (word,)
+
+        # 广度优先构建失败指针，并合并输出
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and (ch not in self._goto[fail]):
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                if self._out[self._fail[nxt]]:
+                    self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self):
+        return len(self.words)
+
+    def search(self, text: str) -> set:
+        """
+        扫描文本，返回文本中出现的所有字符串的集合。
+
+        :param text: 要扫描的文本
+        """
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        state = 0
+        for ch in text:
+            if state == 0:
+                state = root.get(ch, 0)
+            else:
+                nxt = goto[state].get(ch)
+                while nxt is None:
+                    state = fail[state]
+                    if state == 0:
+                        nxt = root.get(ch, 0)
+                        break
+                    nxt = goto[state].get(ch)
+                state = nxt
+
+            if out[state]:
+                found.update(out[state])
+
+        return found
+
+
+class GroupIndex:
+    """
+    对象组索引。组名以 . 分隔层次（如 group1.group2 为 group1 的子组），索引以前缀树形式保存各组内的对象。
+
+    查询某组（及其子组）的对象时只需遍历该组对应的子树，代价与组内对象个数相关，而与对象总数无关。
+    同一组内的对象保持加入的先后顺序。
+    """
+    __slots__ = ("_root", )
+
+    class _Node:
+        __slots__ = ("children", "members")
+
+        def __init__(self):
+            self.children: Dict[str, "GroupIndex._Node"] = {}
+            self.members: Dict[int, object] = {}
+
+    def __init__(self):
+        self._root = GroupIndex._Node()
+
+    def _find(self, group: str, create = False) -> Optional["GroupIndex._Node"]:
+        node = self._root
+        for name in group.split("."):
+            child = node.children.get(name)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[name] = GroupIndex._Node()
+            node = child
+        return node
+
+    def add(self, group: str, obj):
+        "将对象加入组"
+        self._find(group, True).members[id(obj)] = obj
+
+    def discard(self, group: str, obj):
+        "将对象从组中移除，对象不在组中时不做处理"
+        node = self._find(group)
+        if node:
+            node.members.pop(id(obj), None)
+
+    def members(self, group: str, subgroup = False) -> list:
+        "返回组内的所有对象。subgroup 为 True 时，同时包含所有子组内的对象"
+        node = self._find(group)
+        if node is None:
+            return []
+
+        if not subgroup:
+            return list(node.members.values())
+
+        result = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            result.extend(node.members.values())
+            stack.extend(reversed(list(node.children.values())))
+        return result
+
+    def clear(self):
+        "清空索引"
+        self._root = GroupIndex._Node()
+
+
+class GMCPMessage:
+    """
+    收到的一条 GMCP 消息。消息内容保存为原始字符串，首次访问 value 时才进行 json 解析，解析结果被缓存。
+
+    :param name: GMCP 消息的 name
+    :param raw: GMCP 消息的原始字符串数据
+    """
+    __slots__ = ("name", "raw", "_value")
+
+    _UNDECODED = object()
+
+    def __init__(self, name: str, raw: str):
+        self.name = name
+        self.raw = raw
+        self._value = GMCPMessage._UNDECODED
+
+    @property
+    def decoded(self) -> bool:
+        "消息是否已经解析"
+        return self._value is not GMCPMessage._UNDECODED
+
+    @property
+    def value(self):
+        "json 解析后的消息内容，解析失败时为原始字符串"
+        if self._value is GMCPMessage._UNDECODED:
+            try:
+                self._value = json.loads(self.raw, strict = False)
+            except Exception:
+                self._value = self.raw
+        return self._value
+
+    def __repr__(self) -> str:
+        return f"<GMCPMessage> {self.name}: {self.raw}"
+
+
+class GMCPState:
+    """
+    会话的 GMCP 状态树。收到的 GMCP 数据以 name 按 . 分隔的各级为路径（如 Char.Vitals 对应 state["Char"]["Vitals"]），合并保存在嵌套字典中。
+
+    - 收到消息时仅保存原始字符串，只有在读取状态或有订阅需要时才解析并合并，无人使用的 GMCP 数据不产生 json 解析的开销
+    - 消息内容为字典时，与已有的状态逐级合并，因此服务器只发送部分字段（如 Char.Vitals 中仅变化的 hp）时，状态树中仍保留其余字段。其他类型的消息内容直接替换原有状态
+    - 可以订阅某个路径（可以比消息 name 更深，如 Char.Vitals.hp），该路径的值被消息改变时调用订阅函数
+    - 某 name 待合并的消息超过 MAX_PENDING 条时，解析并合并这些消息，以限制内存占用，且不丢失其中的增量。
+      非字典内容的消息会完全替换原有状态，收到时即丢弃此前待合并的消息，这些消息无需解析
+
+    示例:
+        .. code:: Python
+
+            hp = session.gmcp_state.get("Char.Vitals.hp")
+            vitals = session.gmcp_state["Char.Vitals"]
+
+            def onHpChanged(path, value):
+                session.info(f"hp = {value}")
+
+            session.gmcp_state.subscribe("Char.Vitals.hp", onHpChanged)
+    """
+
+    MAX_PENDING = 64        # 每个 name 下待合并消息的最大条数，超过时解析并合并入状态树，以限制内存占用
+
+    def __init__(self):
+        self._tree = dict()
+        self._messages: Dict[str, GMCPMessage] = {}         # 各 name 最近收到的消息
+        self._pending: Dict[str, List[Tuple[int, GMCPMessage]]] = {}    # 各 name 已收到但尚未合并入状态树的消息（及其收到的序号）
+        self._seq = 0
+        self._subscribers: Dict[str, List[Callable]] = {}   # 各路径的订阅函数
+        self._watches: Dict[str, int] = {}                  # 各路径被关注（如 GMCPTrigger）的次数
+        self._below: Dict[str, set] = {}                    # 各路径下（不含本身）被关注或订阅的更深路径
+
+    def feed(self, name: str, raw: str) -> GMCPMessage:
+        """
+        保存收到的 GMCP 消息，此时不进行解析。由会话调用，脚本中无需调用。
+
+        :param name: GMCP 消息的 name
+        :param raw: GMCP 消息的原始字符串数据
+        :return: 对应的 GMCPMessage 对象
+        """
+        pending = self._pending.get(name)
+        if pending:
+            last = pending[-1]
+            if last[0] == self._seq and last[1].raw == raw:
+                # 与紧邻的上一条消息完全相同（服务器重复推送未变化的数据），合并结果不变，无需再次保存
+                return last[1]
+
+        msg = GMCPMessage(name, raw)
+        self._messages[name] = msg
+
+        if pending is None:
+            pending = self._pending[name] = []
+        elif not raw.lstrip().startswith("{"):
+            # 非字典内容直接替换原有状态，之前待合并的消息不再需要
+            pending.clear()
+
+        self._seq += 1
+        pending.append((self._seq, msg))
+        if len(pending) > self.MAX_PENDING:
+            # 字典内容的消息为增量，不能丢弃，只能按收到的顺序（含相互重叠的其他 name 的消息）合并入状态树
+            self._sync(name)
+
+        return msg
+
+    @staticmethod
+    def _update(node: dict, value: dict):
+        for key, val in value.items():
+            old = node.get(key)
+            if isinstance(old, dict) and isinstance(val, dict):
+                GMCPState._update(old, val)
+            else:
+                node[key] = val
+
+    def _apply(self, msg: GMCPMessage):
+        "将一条消息合并入状态树"
+        keys = msg.name.split(".")
+        node = self._tree
+        for key in keys[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                child = node[key] = dict()
+            node = child
+
+        last = keys[-1]
+        value = msg.value
+        old = node.get(last)
+        if isinstance(old, dict) and isinstance(value, dict):
+            self._update(old, value)
+        elif isinstance(value, dict):
+            # 复制一份，避免之后的合并修改消息本身的内容
+            node[last] = new = dict()
+            self._update(new, value)
+        else:
+            node[last] = value
+
+    def _merge(self, names: Iterable[str]):
+        "将各 name 下待合并的消息按收到的先后顺序合并入状态树"
+        items = []
+        for name in names:
+            items.extend(self._pending.pop(name, ()))
+
+        items.sort(key = operator.itemgetter(0))
+        for _, msg in items:
+            self._apply(msg)
+
+    @staticmethod
+    def _overlaps(a: str, b: str) -> bool:
+        "两个路径是否相同或互为上下级"
+        return a == b or a.startswith(b + ".") or b.startswith(a + ".")
+
+    def _sync(self, path: str):
+        """
+        合并所有可能影响 path 的值的待合并消息。
+        为保证先后顺序，与这些消息的 name 相互重叠（相同或互为上下级）的其他待合并消息也一并合并，与之无关的消息不解析。
+        """
+        if self._pending:
+            paths = [path]
+            names = []
+            rest = list(self._pending.keys())
+            found = True
+            while found:
+                found = False
+                for name in rest:
+                    if any(self._overlaps(name, p) for p in paths):
+                        paths.append(name)
+                        names.append(name)
+                        found = True
+                rest = [name for name in rest if name not in names]
+
+            self._merge(names)
+
+    def get(self, path: str, default = None):
+        """
+        读取状态树中某路径的值，路径不存在时返回 default。
+
+        :param path: 以 . 分隔的路径，如 Char.Vitals 或 Char.Vitals.hp
+        :param default: 路径不存在时的返回值
+        """
+        self._sync(path)
+        node = self._tree
+        for key in path.split("."):
+            if not isinstance(node, dict) or key not in node:
+                return default
+            node = node[key]
+        return node
+
+    def __getitem__(self, path: str):
+        _missing = GMCPMessage._UNDECODED
+        value = self.get(path, _missing)
+        if value is _missing:
+            raise KeyError(path)
+        return value
+
+    def __contains__(self, path: str) -> bool:
+        return self.get(path, GMCPMessage._UNDECODED) is not GMCPMessage._UNDECODED
+
+    def message(self, name: str) -> Optional[GMCPMessage]:
+        "返回某 name 最近收到的 GMCP 消息，未收到时返回 None"
+        return self._messages.get(name)
+
+    def names(self) -> List[str]:
+        "返回所有已收到的 GMCP 消息的 name"
+        return list(self._messages.keys())
+
+    def tree(self) -> dict:
+        "返回合并了所有消息后的完整状态树。返回的是内部字典本身，请勿修改"
+        self._merge(list(self._pending.keys()))
+        return self._tree
+
+    def _watched(self, path: str) -> bool:
+        return (path in self._watches) or (path in self._subscribers)
+
+    def _index(self, path: str):
+        keys = path.split(".")
+        for i in range(1, len(keys)):
+            self._below.setdefault(".".join(keys[:i]), set()).add(path)
+
+    def _unindex(self, path: str):
+        keys = path.split(".")
+        for i in range(1, len(keys)):
+            parent = ".".join(keys[:i])
+            below = self._below.get(parent)
+            if below is not None:
+                below.discard(path)
+                if not below:
+                    del self._below[parent]
+
+    def watch(self, path: str):
+        """
+        关注路径，被关注的路径可由 affected 返回。会话在添加 GMCPTrigger 时关注其 name。
+        同一路径可被多次关注，需调用相同次数的 unwatch 才取消关注。关注与 subscribe 订阅相互独立。
+        """
+        watched = self._watched(path)
+        self._watches[path] = self._watches.get(path, 0) + 1
+        if not watched:
+            self._index(path)
+
+    def unwatch(self, path: str):
+        "取消一次对路径的关注。路径的订阅函数不受影响"
+        count = self._watches.get(path, 0)
+        if count > 1:
+            self._watches[path] = count - 1
+        elif count == 1:
+            del self._watches[path]
+            if not self._watched(path):
+                self._unindex(path)
+
+    def subscribe(self, path: str, callback: Callable):
+        """
+        订阅路径。收到的消息改变该路径的值时，以 callback(path, value) 的形式调用订阅函数，value 为合并后该路径的值。
+
+        :param path: 以 . 分隔的路径，可以是消息的 name，也可以是其下更深的路径
+        :param callback: 订阅函数
+        """
+        if not self._watched(path):
+            self._index(path)
+
+        callbacks = self._subscribers.setdefault(path, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def unsubscribe(self, path: str, callback: Callable):
+        "取消订阅。路径没有订阅函数且未被关注时，不再返回该路径"
+        callbacks = self._subscribers.get(path)
+        if callbacks is not None:
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                del self._subscribers[path]
+                if not self._watched(path):
+                    self._unindex(path)
+
+    def subscribers(self, path: str) -> List[Callable]:
+        "返回路径的所有订阅函数"
+        return list(self._subscribers.get(path, ()))
+
+    @staticmethod
+    def _touches(value, keys: List[str]) -> bool:
+        "判断消息内容 value 是否会改变其下 keys 所指向的值"
+        for key in keys:
+            if not isinstance(value, dict):
+                return True
+            if key not in value:
+                return False
+            value = value[key]
+        return True
+
+    def affected(self, msg: GMCPMessage) -> List[str]:
+        """
+        返回关注的路径中，值被该消息改变的路径，包括消息 name 本身（若被关注）及其下的更深路径。
+        只有存在比消息 name 更深的关注路径时，才需要解析消息内容。
+        """
+        name = msg.name
+        result = []
+        if self._watched(name):
+            result.append(name)
+
+        below = self._below.get(name)
+        if below:
+            start = len(name) + 1
+            value = msg.value
+            for path in below:
+                if self._touches(value, path[start:].split(".")):
+                    result.append(path)
+
+        return result
+
+    def clear_subscriptions(self):
+        "取消所有关注的路径及订阅"
+        self._subscribers.clear()
+        self._watches.clear()
+        self._below.clear()
+
+    def clear(self):
+        "清空状态树及收到的消息，订阅保持不变"
+        self._tree = dict()
+        self._messages.clear()
+        self._pending.clear()
@@ -158,7 +158,18 @@ TRANSLATION = {
         "msg_module_configurations"     : "模块 {0} 中包含的配置包括: {1}。",
         "msg_submodule_no_config"       : "模块 {0} 为子模块，不包含配置。",
         "msg_module_not_loaded"         : "本会话中不存在指定名称 {0} 的模块，可能是尚未加载到本会话中。",
+        "msg_buffer_title"              : "各会话缓冲区情况:",
+        "msg_buffer_info"               : "会话 {0}: 存储方式 {1}, 当前 {2} 行 / 上限 {3} 行, 首行绝对行号 {4}, 占用内存约 {5:.2f} MB",
+        "buffer_ring"                   : "环形列表",
+        "buffer_compact"                : "紧凑字节",
+        "unlimited"                     : "不限",
+        "msg_find_usage"                : "使用方法: #find [-n 个数] 正则表达式",
+        "msg_find_invalid"              : "搜索的正则表达式 {0} 无效: {1}",
+        "msg_find_nohit"                : "未找到与 {0} 匹配的行。",
+        "msg_find_title"                : "与 {0} 匹配的最近 {1} 行（已分屏显示第一行，Ctrl+Z 取消分屏）:",
+        "msg_find_log"                  : "在记录文件中找到 {0} 处与 {1} 匹配的行，已跳转到最近的第 {2} 行。",
         "msg_variables_saved"           : "会话变量信息已保存到 {0}。",
+        "msg_var_save_fail"             : "会话变量保存到 {0} 失败，错误消息为： {1}。",
         "msg_alias_created"             : "创建Alias {0} 成功: {1}",
         "msg_trigger_created"           : "创建Trigger {0} 成功: {1}",
         "msg_timer_created"             : "创建Timer {0} 成功: {1}",
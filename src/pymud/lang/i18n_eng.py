@@ -158,7 +158,18 @@ TRANSLATION = {
         "msg_module_configurations"     : "Module {0} contains configurations: {1}.",
         "msg_submodule_no_config"       : "Module {0} is a submodule, contains no configurations.",
         "msg_module_not_loaded"         : "No module named {0} exists in this session, may not be loaded to this session yet.",
+        "msg_buffer_title"              : "Session buffers:",
+        "msg_buffer_info"               : "Session {0}: storage {1}, {2} lines / limit {3}, first absolute line number {4}, about {5:.2f} MB of memory",
+        "buffer_ring"                   : "ring list",
+        "buffer_compact"                : "compact bytes",
+        "unlimited"                     : "unlimited",
+        "msg_find_usage"                : "Usage: #find [-n count] regular-expression",
+        "msg_find_invalid"              : "Invalid search regular expression {0}: {1}",
+        "msg_find_nohit"                : "No line matches {0}.",
+        "msg_find_title"                : "The latest {1} lines matching {0} (the first one is shown in the split view, press Ctrl+Z to leave it):",
+        "msg_find_log"                  : "Found {0} lines matching {1} in the log file, jumped to the latest one at line {2}.",
         "msg_variables_saved"           : "Session variable information saved to {0}.",
+        "msg_var_save_fail"             : "Failed to save session variables to {0}, error message: {1}.",
         "msg_alias_created"             : "Alias {0} created successfully: {1}",
         "msg_trigger_created"           : "Trigger {0} created successfully: {1}",
         "msg_timer_created"             : "Timer {0} created successfully: {1}",
@@ -402,7 +413,7 @@ TRANSLATION = {
         This function should not be called directly in the code.
 
         Usage:
-            - #ti: Show all timers in current session
+            - #ti: Show all timers in current session, including the next fire time (next) of running timers
             - #ti {ti_id}: Show details of timer with ID {ti_id}
             - #ti {ti_id} {on/off/del}: Enable/disable/delete timer with ID {ti_id}
             - #ti {second} {code}: Create new timer with interval {second} seconds executing {code}
@@ -615,10 +626,11 @@ TRANSLATION = {
             - #save: Save the current session variables.
 
         Notes:
-            1. The file is saved in the current directory with the name {session_name}.mud.
+            1. The file is saved in the save subdirectory with the name {session_name}.db. The {session_name}.mud file saved by older versions is imported automatically when the session is created.
             2. The Python pickle module is used to save variables, so all variables should be type introspective.
             3. Although variables support all Python types, it is still recommended to use only serializable types in variables.
             4. namedtuple is not recommended because type matching will fail after loading, and two namedtuples with the same definition will not be considered the same type.
+            5. When var_autosave is on, changed variables are also saved incrementally every var_autosave_interval seconds. #save performs a full save, which also covers variables whose values were modified in place.
         
         Related commands:
             - #variable
@@ -836,6 +848,46 @@ TRANSLATION = {
             - #cls: Clear the current session buffer and display.
         ''',
 
+            "handle_buffer" :
+        '''
+        The execution function of the embedded command #buffer, used to display the storage type, line count and memory usage of each session buffer.
+        This function should not be called directly in the code.
+
+        Usage:
+            - #buffer: Display the buffer information of all sessions in this application.
+
+        Notes:
+            - The buffer storage type is determined by Settings.client["buffer_compact"]. This command can be used to compare the memory usage of the two storage types.
+            - The memory usage is an estimate and only includes the buffer content itself.
+
+        Related commands:
+            - #clear
+        ''',
+
+            "handle_find" :
+        '''
+        The execution function of the embedded commands #find / #grep, used to search the current session buffer and jump the split view to the latest matching line.
+        This function should not be called directly in the code.
+
+        Usage:
+            - #find {pattern}: Search lines matching the regular expression {pattern}, list the latest 20 matching lines and show the latest one in the split view.
+            - #find -n {count} {pattern}: Same as above, but list the latest {count} matching lines.
+
+        Examples:
+            - ``#find quest`` : Search lines containing "quest".
+            - ``#grep -n 5 ^\\[chat\\]`` : List the latest 5 lines starting with "[chat]".
+
+        Notes:
+            - Lines are matched as plain text with ANSI codes removed, and the search runs in a background thread.
+            - Line numbers are absolute line numbers counted from the start of the session.
+            - After jumping, use PageUp/PageDown to scroll, or Ctrl+Z to leave the split view.
+            - The command can also be used in the log tab to search the log file being shown.
+
+        Related commands:
+            - #log
+            - #buffer
+        ''',
+
             "handle_message" :
         '''
         The execution function of the embedded commands #message / #mess, used to pop up a dialog box to display the given information.
@@ -1,7 +1,182 @@
-import datetime, threading
+import datetime, threading, time
 from queue import SimpleQueue, Empty
 from pathlib import Path
 from .settings import Settings
+
+class LogService:
+    """
+    记录服务基类。记录器不直接写文件，而是将待记录信息提交给记录服务，由记录服务决定写入的方式和时机。
+    PyMudApp 持有一个记录服务实例（PyMudApp.log_service），该应用内所有会话的记录器共享该服务。
+
+    可以使用 ThreadedLogService（默认，后台单线程写入）或 SyncLogService（在调用线程中同步写入，适用于测试）。
+    """
+
+    def submit(self, logger: "Logger", msg: str):
+        "提交一条待记录信息"
+        raise NotImplementedError
+
+    def flush(self, logger: "Logger" = None, timeout = None) -> bool:
+        """
+        等待此前提交的信息写入文件并刷新。
+
+        :param logger: 要等待的记录器，为None时等待所有记录器
+        :param timeout: 最长等待时间，单位为秒，为None时一直等待
+        :return: 在超时前完成时返回True，否则返回False
+        """
+        return True
+
+    def shutdown(self, timeout = None):
+        "写入所有待记录信息后停止服务。停止后再提交信息时，服务会重新启动"
+        pass
+
+
+class SyncLogService(LogService):
+    "同步记录服务。信息在提交时即在调用线程中写入并刷新文件，不使用后台线程。"
+
+    def submit(self, logger: "Logger", msg: str):
+        if logger._write((msg, )):
+            logger._flushStream()
+
+
+class ThreadedLogService(LogService):
+    """
+    后台线程记录服务。所有记录器共用一个后台线程，该线程每次取出全部待记录信息，按记录器分组后各自合并一次写入文件。
+    单个记录器的信息保持提交顺序。文件刷新（flush）在记录器待刷新内容达到 Settings.client["log_flush_size"] 个字符，
+    或距该记录器上次刷新超过 Settings.client["log_flush_interval"] 秒时进行。
+    """
+
+    def __init__(self):
+        self._queue = SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._previous = None           # 已请求停止但可能尚未退出的线程
+
+    def _ensureThread(self):
+        thread = self._thread
+        if (thread is None) or (not thread.is_alive()):
+            with self._lock:
+                thread = self._thread
+                if (thread is None) or (not thread.is_alive()):
+                    previous, self._previous = self._previous, None
+                    self._thread = t = threading.Thread(target = self._run, args = (previous, ), name = "pymud-logger")
+                    t.daemon = True
+                    t.start()
+
+    def submit(self, logger: "Logger", msg: str):
+        # 先入队再检查线程：若入队时 shutdown 已放入停止标记，此时线程引用已清除，会启动新线程处理该信息
+        self._queue.put_nowait((logger, msg))
+        self._ensureThread()
+
+    def flush(self, logger: "Logger" = None, timeout = None) -> bool:
+        if self._thread is None:
+            # 没有运行中的线程时，仅需等待 shutdown 超时仍未退出的线程
+            previous = self._previous
+            if previous is not None:
+                previous.join(timeout)
+                return not previous.is_alive()
+            return True
+
+        done = threading.Event()
+        self._queue.put_nowait((logger, done))
+        self._ensureThread()
+        return done.wait(timeout)
+
+    def shutdown(self, timeout = None):
+        with self._lock:
+            thread = self._thread
+            if thread is not None:
+                # 开始停止时即清除线程引用，之后提交的信息和刷新请求由新线程处理。新线程先等待本线程退出，因此不会同时写入，也保持写入顺序
+                self._thread = None
+                self._previous = thread
+                self._queue.put_nowait((None, None))
+            else:
+                thread = self._previous
+
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self, previous: threading.Thread = None):
+        """
+        Monitor the queue for records of all loggers.
+
+        This method runs on a separate, internal thread shared by all loggers of the service.
+        Pending records are drained in batches, grouped by logger and written with a single call per logger;
+        each stream is flushed on a size or time threshold.
+        The thread will terminate if it sees a (None, None) sentinel in the queue.
+        """
+        if previous is not None:
+            previous.join()
+
+        dirty = set()               # 已写入但尚未刷新的记录器
+        running = True
+        while running:
+            interval = Settings.client.get("log_flush_interval", 0.2)
+            flush_size = Settings.client.get("log_flush_size", 65536)
+
+            batches = dict()
+            waiters = []
+            try:
+                try:
+                    timeout = None
+                    if dirty:
+                        timeout = max(0.0, min(logger._last_flush for logger in dirty) + interval - time.monotonic())
+
+                    item = self._queue.get(block = True, timeout = timeout)
+                    while True:
+                        logger, msg = item
+                        if logger is None and msg is None:
+                            running = False
+                            break
+                        elif isinstance(msg, threading.Event):
+                            waiters.append(item)
+                        else:
+                            batches.setdefault(logger, []).append(msg)
+
+                        item = self._queue.get_nowait()
+
+                except Empty:
+                    pass
+
+                # 单个记录器写入出错时丢弃该批信息，不影响其他记录器，也不使线程退出
+                for logger, batch in batches.items():
+                    try:
+                        size = logger._write(batch)
+                    except Exception:
+                        logger._dropped += len(batch)
+                        size = 0
+
+                    if size:
+                        logger._pending += size
+                        dirty.add(logger)
+
+                now = time.monotonic()
+                flush_all = (not running) or any(logger is None for logger, _ in waiters)
+                flush_loggers = set(logger for logger, _ in waiters)
+                for logger in list(dirty):
+                    if flush_all or (logger in flush_loggers) or (logger._pending >= flush_size) or (now - logger._last_flush >= interval):
+                        try:
+                            logger._flushStream()
+                        except Exception:
+                            pass
+                        logger._pending = 0
+                        logger._last_flush = now
+                        dirty.discard(logger)
+
+            finally:
+                for _, waiter in waiters:
+                    waiter.set()
+
+
+_default_service = None
+
+def default_log_service() -> LogService:
+    "返回不属于任何应用的记录器所使用的默认记录服务"
+    global _default_service
+    if _default_service is None:
+        _default_service = ThreadedLogService()
+    return _default_service
+
+
 class Logger:
     """
     PyMUD 的记录器类型，可用于会话中向文件记录数据。记录文件保存在当前目录下的 log 子目录中
@@ -14,11 +189,14 @@ class Logger:
     :param encoding: 记录文件的编码格式，默认为 "utf-8"
     :param errors: 当编码模式失败时的处理方式，默认为 "ignore"
     :param raw: 记录带ANSI标记的原始内容，还是记录纯文本内容，默认为True，即记录带ANSI标记的原始内容。
+    :param service: 写入记录所使用的记录服务，为None时使用 default_log_service() 。会话中创建的记录器使用 PyMudApp.log_service
     """
 
+    CLOSE_TIMEOUT = 5               # 关闭记录时等待已提交信息写入的最长时间，单位为秒
+
     # _esc_regx = re.compile(r"\x1b\[[\d;]+[abcdmz]", flags = re.IGNORECASE)
 
-    def __init__(self, name, mode = 'a', encoding = "utf-8", errors = "ignore", raw = False):
+    def __init__(self, name, mode = 'a', encoding = "utf-8", errors = "ignore", raw = False, service: LogService = None):
         self._name = name
         self._enabled = False
         self._raw = raw
@@ -27,20 +205,46 @@ class Logger:
         self._errors = errors
         self._lock = threading.RLock()
         self._stream = None
-        
-        self._queue = SimpleQueue()
+        self._service = service or default_log_service()
+        self._newline = True
+        self._pending = 0                   # 已写入但尚未刷新的字符数，由记录服务维护
+        self._last_flush = 0.0
+
+        self._queued = 0
+        self._written = 0
+        self._dropped = 0
 
     @property
     def name(self):
         "记录器名称，仅在创建时设置，过程中只读"
         return self._name
 
+    @property
+    def service(self) -> LogService:
+        "记录器使用的记录服务，仅在创建时设置，过程中只读"
+        return self._service
+
+    @property
+    def queued(self) -> int:
+        "只读属性，已通过 log 提交记录的信息条数"
+        return self._queued
+
+    @property
+    def written(self) -> int:
+        "只读属性，已写入记录文件的信息条数"
+        return self._written
+
+    @property
+    def dropped(self) -> int:
+        "只读属性，因写入文件失败而丢弃的信息条数"
+        return self._dropped
+
     @property
     def enabled(self):
         """
         使能属性。
-        从false切换到true时，会打开文件，创建后台线程进行记录。
-        从true切换到false时，会终止后台记录线程，并关闭记录文件。
+        从false切换到true时，会打开文件，后续记录信息通过记录服务写入。
+        从true切换到false时，会等待已提交的信息写入完成，并关闭记录文件。
         """
         return self._enabled
 
@@ -68,19 +272,16 @@ class Logger:
                 filename = logdir.joinpath(filename)
                 #filename = os.path.abspath(filename)
                 self._stream = open(filename, mode = mode, encoding = self._encoding, errors = self._errors)
-                self._thread = t = threading.Thread(target=self._monitor)
-                t.daemon = True
-                t.start()
+                self._newline = True
+                self._pending = 0
+                self._enabled = True
 
             else:
-                self._queue.put_nowait(None)
-                if self._thread:
-                    self._thread.join()
-                    self._thread = None
+                self._enabled = False
+                # 记录服务无法及时完成时不无限等待，关闭文件后未写入的信息计入丢弃数
+                self._service.flush(self, self.CLOSE_TIMEOUT)
                 self._closeFile()
 
-            self._enabled = enabled
-
     @property
     def raw(self):
         "属性，设置和获取是否记录带有ANSI标记的原始记录"
@@ -118,50 +319,66 @@ class Logger:
 
     def log(self, msg):
         """
-        向记录器记录信息。记录的信息会通过队列发送到独立的记录线程。
+        向记录器记录信息。记录的信息会提交给记录服务写入文件。
         当记录器未使能时，使用该函数调用也不会记录。
         
         :param msg: 要记录的信息
         """
-        if self._enabled:
-            self._queue.put_nowait(msg)
+        if self._enabled and msg:
+            self._queued += 1
+            self._service.submit(self, msg)
 
-    def _monitor(self):
+    def flush(self, timeout = None) -> bool:
         """
-        Monitor the queue for records, and ask the handler
-        to deal with them.
+        等待此前通过 log 提交的所有信息写入记录文件并刷新。可在程序退出前调用，确保记录完整。
 
-        This method runs on a separate, internal thread.
-        The thread will terminate if it sees a sentinel object in the queue.
+        :param timeout: 最长等待时间，单位为秒，为None时一直等待
+        :return: 在超时前完成时返回True，否则返回False
         """
-        newline = True
-        while self._stream:
-            try:
-                data = self._queue.get(block = True)
-                if data:
-                    self._lock.acquire()
+        if self._enabled:
+            return self._service.flush(self, timeout)
 
-                    if newline:
-                        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        header = f"{now} {self._name}: "
-                        self._stream.write(header)
-                        newline = False
+        return True
 
-                    if data.endswith("\n"):
-                        data = data.rstrip("\n").rstrip("\r") + "\n"
-                        newline = True
+    def _write(self, batch) -> int:
+        "将一批信息格式化后一次写入文件，返回写入的字符数"
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        header = f"{now} {self._name}: "
+        newline = self._newline
+        parts = []
+        for data in batch:
+            if newline:
+                parts.append(header)
+                newline = False
 
-                    if not self._raw:
-                        from .session import Session
-                        data = Session.PLAIN_TEXT_REGX.sub("", data)
-                        #data = self._esc_regx.sub("", data)
+            if data.endswith("\n"):
+                data = data.rstrip("\n").rstrip("\r") + "\n"
+                newline = True
 
-                    self._stream.write(data)
+            parts.append(data)
 
-                    self._stream.flush()
-                    self._lock.release()
+        self._newline = newline
+        text = "".join(parts)
 
-                else:
-                    break
-            except Empty:
-                break
+        if not self._raw:
+            from .session import Session
+            text = Session.PLAIN_TEXT_REGX.sub("", text)
+
+        with self._lock:
+            try:
+                self._stream.write(text)
+                self._written += len(batch)
+            except (AttributeError, OSError, ValueError):
+                # 文件已关闭或写入失败
+                self._dropped += len(batch)
+                return 0
+
+        return len(text)
+
+    def _flushStream(self):
+        with self._lock:
+            try:
+                if self._stream:
+                    self._stream.flush()
+            except (OSError, ValueError):
+                pass
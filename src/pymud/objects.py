@@ -2,8 +2,8 @@
 MUD会话(session)中, 支持的对象列表
 """
 
-import asyncio, logging, re, ast, json, codecs
-from typing import Type, Union, List, Tuple
+import asyncio, logging, re, ast, json, codecs, functools, heapq, time
+from typing import Type, Union, List, Tuple, Optional
 from collections.abc import Iterable
 from collections import namedtuple
 from typing import Any
@@ -11,6 +11,116 @@ from .settings import Settings
 from .decorators import print_exception
 from .extras import ValuedEvent
 
+try:
+    from re import _parser as _sre_parse, _constants as _sre_const      # Python 3.11+
+except ImportError:
+    import sre_parse as _sre_parse, sre_constants as _sre_const         # type: ignore
+
+def _collect_literals(parsed, runs: List[str]) -> None:
+    "遍历正则表达式解析树，将所有必然出现的连续字面字符串加入runs中"
+    run = []
+    for op, av in parsed:
+        if op is _sre_const.LITERAL:
+            run.append(chr(av))
+            continue
+
+        if run:
+            runs.append("".join(run))
+            run = []
+
+        if op is _sre_const.SUBPATTERN:
+            # 分组内容必然出现，但局部忽略大小写的分组不能作为字面匹配
+            sub_flags, sub = av[-3], av[-1]
+            if not (sub_flags & re.IGNORECASE):
+                _collect_literals(sub, runs)
+        elif op in (_sre_const.MAX_REPEAT, _sre_const.MIN_REPEAT):
+            # 至少重复1次的内容必然出现
+            if av[0] >= 1:
+                _collect_literals(av[2], runs)
+
+    if run:
+        runs.append("".join(run))
+
+def required_literal(pattern: str, flags: int = 0) -> Optional[str]:
+    """
+    分析正则表达式，返回任何匹配成功的行中都必然包含的最长字面字符串，用于匹配前的快速预筛选。
+
+    当正则表达式忽略大小写、无法分析或者不包含必然出现的字面字符串时，返回 None，此时不进行预筛选。
+
+    :param pattern: 正则表达式
+    :param flags: 正则表达式编译标志
+    """
+    if flags & re.IGNORECASE:
+        return None
+
+    try:
+        parsed = _sre_parse.parse(pattern, flags)
+        if parsed.state.flags & re.IGNORECASE:
+            return None
+
+        runs = []
+        _collect_literals(parsed, runs)
+    except Exception:
+        return None
+
+    if runs:
+        return max(runs, key = len)
+
+    return None
+
+def _is_space_item(op, av) -> bool:
+    "判断正则表达式解析树中的单个元素是否只能匹配空白字符"
+    if op is _sre_const.LITERAL:
+        return chr(av).isspace()
+    if op is _sre_const.IN:
+        return all(((item_op is _sre_const.CATEGORY) and (item_av is _sre_const.CATEGORY_SPACE)) or ((item_op is _sre_const.LITERAL) and chr(item_av).isspace()) for item_op, item_av in av)
+    if op in (_sre_const.MAX_REPEAT, _sre_const.MIN_REPEAT):
+        sub = list(av[2])
+        return (av[0] >= 1) and (len(sub) > 0) and _is_space_item(*sub[0])
+    return False
+
+def leading_verb(pattern: str, flags: int = 0) -> Optional[str]:
+    """
+    分析正则表达式，若任何匹配成功的命令（使用 match 从行首匹配）的首个单词（行首至第一个空白字符）都相同，则返回该单词，用于按首单词建立别名/命令索引。
+
+    当正则表达式忽略大小写、无法分析或首个单词不确定时，返回 None。
+
+    :param pattern: 正则表达式
+    :param flags: 正则表达式编译标志
+    """
+    if flags & re.IGNORECASE:
+        return None
+
+    try:
+        parsed = _sre_parse.parse(pattern, flags)
+        if parsed.state.flags & re.IGNORECASE:
+            return None
+
+        items = list(parsed)
+        idx = 0
+        while (idx < len(items)) and (items[idx][0] is _sre_const.AT) and (items[idx][1] in (_sre_const.AT_BEGINNING, _sre_const.AT_BEGINNING_STRING)):
+            idx += 1
+
+        verb = []
+        while (idx < len(items)) and (items[idx][0] is _sre_const.LITERAL):
+            ch = chr(items[idx][1])
+            if ch.isspace():
+                return "".join(verb)
+            verb.append(ch)
+            idx += 1
+
+        if idx < len(items):
+            op, av = items[idx]
+            if (op is _sre_const.AT) and (av in (_sre_const.AT_END, _sre_const.AT_END_STRING)):
+                return "".join(verb)
+            if _is_space_item(op, av):
+                return "".join(verb)
+
+    except Exception:
+        pass
+
+    return None
+
 class CodeLine:
     """
     PyMUD中可执行的代码块（单行），不应由脚本直接调用。
@@ -81,9 +191,60 @@ class CodeLine:
         else:
             return "dontcare", hasvar, tuple()
 
+    # 模板中各参数的类型
+    _SLOT_TEXT, _SLOT_WILDCARD, _SLOT_LINE, _SLOT_RAW, _SLOT_SYSVAR, _SLOT_VAR = range(6)
+    _WILDCARDS = {f"%{i}": i for i in range(1, 10)}
+
     def __init__(self, _code: str) -> None:
         self.__code = _code
         self.__syncmode, self.__hasvar, self.code = CodeLine.create_line(_code)
+        self.__slots, self.__texts, self.__refs = CodeLine.create_template(_code, self.code)
+        self.__static = all(kind == CodeLine._SLOT_TEXT for kind, _ in self.__slots)
+
+    @classmethod
+    def create_template(cls, line: str, code_params: tuple):
+        """
+        将代码行预编译为变量替换模板，返回 (slots, texts, refs)。
+
+        - slots: 每个非空参数对应一个 (类型, 值)，类型为 _SLOT_TEXT/_SLOT_WILDCARD/_SLOT_LINE/_SLOT_RAW/_SLOT_SYSVAR/_SLOT_VAR
+        - texts: 原始代码文本中各变量之间的文本片段，比 refs 多一项
+        - refs:  各变量在 slots 中的序号
+
+        展开时仅需按 slots 求值，再将 texts 与变量值交错拼接即可，不再需要逐项 str.replace。
+        """
+        var_eval = Settings.client["var_eval"]
+        slots, texts, refs = [], [], []
+        searched, emitted = 0, 0
+
+        for item in code_params:
+            if len(item) == 0: continue
+
+            if item in cls._WILDCARDS:
+                slot = (cls._SLOT_WILDCARD, cls._WILDCARDS[item])
+            elif item == "%line":
+                slot = (cls._SLOT_LINE, item)
+            elif item == "%raw":
+                slot = (cls._SLOT_RAW, item)
+            elif item[0] == "%":
+                slot = (cls._SLOT_SYSVAR, item)
+            elif item[0] == var_eval:
+                slot = (cls._SLOT_VAR, item[1:])
+            else:
+                slot = (cls._SLOT_TEXT, item)
+
+            slots.append(slot)
+
+            # 在原始文本中定位该参数。参数中的引号已被去除，找不到时不做文本替换
+            pos = line.find(item, searched)
+            if pos >= 0:
+                searched = pos + len(item)
+                if slot[0] != cls._SLOT_TEXT:
+                    texts.append(line[emitted:pos])
+                    refs.append(len(slots) - 1)
+                    emitted = searched
+
+        texts.append(line[emitted:])
+        return tuple(slots), tuple(texts), tuple(refs)
 
     @property
     def length(self):
@@ -105,49 +266,52 @@ class CodeLine:
         session.exec_code(self, *args, **kwargs)
 
     def expand(self, session, *args, **kwargs):
-        new_code_str = self.__code
-        new_code = []
+        slots = self.__slots
+        if self.__static:
+            return self.__code, [value for _, value in slots]
 
-        line = kwargs.get("line", None) or session.getVariable("%line", "None")
-        raw  = kwargs.get("raw", None) or session.getVariable("%raw", "None")
+        line, raw = None, None
         wildcards = kwargs.get("wildcards", ())
+        new_code = []
+
+        for kind, value in slots:
+            if kind == CodeLine._SLOT_TEXT:
+                item_val = value
 
-        for item in self.code:
-            if len(item) == 0: continue
             # %1~%9，特指捕获中的匹配内容
-            if item in (f"%{i}" for i in range(1, 10)):
-                idx = int(item[1:])
-                if idx <= len(wildcards):
-                    item_val = wildcards[idx-1]
+            elif kind == CodeLine._SLOT_WILDCARD:
+                if value <= len(wildcards):
+                    item_val = wildcards[value-1]
                 else:
                     item_val = "None"
-                new_code.append(item_val)
-                new_code_str = new_code_str.replace(item, f"{item_val}", 1)
 
             # 系统变量，%开头
-            elif item == "%line":
-                new_code.append(line)
-                new_code_str = new_code_str.replace(item, f"{line}", 1)
+            elif kind == CodeLine._SLOT_LINE:
+                if line is None:
+                    line = kwargs.get("line", None) or session.getVariable("%line", "None")
+                item_val = line
 
-            elif item == "%raw":
-                new_code.append(raw)
-                new_code_str = new_code_str.replace(item, f"{raw}", 1)
+            elif kind == CodeLine._SLOT_RAW:
+                if raw is None:
+                    raw  = kwargs.get("raw", None) or session.getVariable("%raw", "None")
+                item_val = raw
 
-            elif item[0] == "%":
-                item_val = session.getVariable(item, "")
-                new_code.append(item_val)
-                new_code_str = new_code_str.replace(item, f"{item_val}", 1)
+            elif kind == CodeLine._SLOT_SYSVAR:
+                item_val = session.getVariable(value, "")
 
             # 非系统变量，默认为@开头，在变量明前加@引用
-            elif item[0] == Settings.client["var_eval"]:
-                item_val = session.getVariable(item[1:], "")
-                new_code.append(item_val)
-                new_code_str = new_code_str.replace(item, f"{item_val}", 1)
-
             else:
-                new_code.append(item)
+                item_val = session.getVariable(value, "")
+
+            new_code.append(item_val)
+
+        texts = self.__texts
+        parts = [texts[0]]
+        for ref, text in zip(self.__refs, texts[1:]):
+            parts.append(f"{new_code[ref]}")
+            parts.append(text)
 
-        return new_code_str, new_code
+        return "".join(parts), new_code
 
     async def async_execute(self, session, *args, **kwargs):           
         return await session.exec_code_async(self, *args, **kwargs)
@@ -203,30 +367,56 @@ class CodeBlock:
 
             return tuple(codes)
 
-    def __init__(self, code) -> None:
-        self.__code = code
-        self.codes = CodeBlock.create_block(code)
+    @staticmethod
+    @functools.lru_cache(maxsize = 1024)
+    def _compile(code: str) -> tuple:
+        """
+        解析代码并判定同步模式，返回 (codes, syncmode)。
 
-        self.__syncmode = "dontcare"
+        解析结果按代码文本缓存（LRU，最多1024条）。解析得到的 CodeLine 对象创建后不再改变，因此可以在多个代码块之间共享。
+        """
+        codes = CodeBlock.create_block(code)
 
-        for code in self.codes:
+        syncmode = "dontcare"
+
+        for code in codes:
             if isinstance(code, CodeLine):
                 if code.syncMode == "dontcare":
                     continue
                 elif code.syncMode == "sync":
-                    if self.__syncmode in ("dontcare", "sync"):
-                        self.__syncmode = "sync"
-                    elif self.__syncmode == "async":
-                        self.__syncmode = "conflict"
+                    if syncmode in ("dontcare", "sync"):
+                        syncmode = "sync"
+                    elif syncmode == "async":
+                        syncmode = "conflict"
                         break
 
                 elif code.syncMode == "async":
-                    if self.__syncmode in ("dontcare", "async"):
-                        self.__syncmode = "async"
-                    elif self.__syncmode == "sync":
-                        self.__syncmode = "conflict"
+                    if syncmode in ("dontcare", "async"):
+                        syncmode = "async"
+                    elif syncmode == "sync":
+                        syncmode = "conflict"
                         break
 
+        return codes, syncmode
+
+    @classmethod
+    def cache_info(cls):
+        """
+        代码块解析缓存的统计信息，返回 functools 形式的命名元组 (hits, misses, maxsize, currsize)。
+
+        重复执行相同文本的代码（如 exec_command, #3 xxx 等）时，将直接使用缓存的解析结果，不再重新解析。
+        """
+        return cls._compile.cache_info()
+
+    @classmethod
+    def cache_clear(cls):
+        "清除代码块解析缓存。修改 Settings.client['var_eval'] 等影响解析结果的设置后，可调用该方法。"
+        cls._compile.cache_clear()
+
+    def __init__(self, code) -> None:
+        self.__code = code
+        self.codes, self.__syncmode = CodeBlock._compile(code)
+
     @property
     def syncmode(self):
         """
@@ -331,6 +521,8 @@ class BaseObject:
             assert(Settings.gettext("exception_session_type_fail"))
             
         self._enabled   = True              # give a default value
+        self._priority  = 100
+        self._group     = None
         self.log        = logging.getLogger(f"pymud.{self.__class__.__name__}")
         self.id         = kwargs.get("id", self.session.getUniqueID(self.__class__.__abbr__))
         self.group      = kwargs.get("group", "")                  # 组
@@ -367,6 +559,37 @@ class BaseObject:
     @enabled.setter
     def enabled(self, en: bool):
         self._enabled = en
+        self._dispatch_changed()
+
+    @property
+    def group(self) -> str:
+        "可读写属性，对象所属的组名，以 . 分隔子组"
+        return self._group
+
+    @group.setter
+    def group(self, value: str):
+        old = self._group
+        self._group = value
+        if (old is not None) and (old != value):
+            session = getattr(self, "session", None)
+            if session is not None:
+                session._regroupObject(self, old)
+
+    @property
+    def priority(self) -> int:
+        "可读写属性，优先级，越小优先级越高"
+        return self._priority
+
+    @priority.setter
+    def priority(self, value: int):
+        self._priority = value
+        self._dispatch_changed()
+
+    def _dispatch_changed(self):
+        "通知所属会话，本对象影响匹配分发顺序的属性（使能、优先级）已发生变化，会话缓存的分发表将失效。"
+        session = getattr(self, "session", None)
+        if session is not None:
+            session._invalidateDispatch(self)
 
     def create_task(self, coro, *args, name = None):
         """
@@ -455,6 +678,8 @@ class BaseObject:
         group = f'group = "{self.group}" ' if self.group else ''
         return f'<{self.__class__.__name__}> id = "{self.id}" {group}enabled = {self.enabled}'
 
+_UNDECODED = object()          # GMCPTrigger 调用时未传入解析后的数据
+
 class GMCPTrigger(BaseObject):
     """
     GMCP触发器 GMCPTrigger 类型，继承自 BaseObject。
@@ -463,6 +688,9 @@ class GMCPTrigger(BaseObject):
     
     但 GMCPTrigger 必定以指定name为触发，触发时，其值直接传递给对象本身
 
+    name 也可以是消息 name 之下更深的路径（如 Char.Vitals.hp），此时在收到的消息改变该路径的值时触发，
+    传递的值为 session.gmcp_state 中合并后该路径的值。
+
     :param session: 本对象所属的会话
     :param name: 触发对应的 GMCP 的 name
     """
@@ -486,13 +714,20 @@ class GMCPTrigger(BaseObject):
         #self.reset()
         return await self.event.wait()
 
-    def __call__(self, value: str) -> Any:
-        try:
-            #value_exp = value.replace("\\x1b", "\u001b")
-            value_exp = json.loads(value, strict = False)
-            #value_exp = ast.literal_eval(value)
-        except Exception as e:
-            value_exp = value
+    def __call__(self, value: str, value_exp: Any = _UNDECODED) -> Any:
+        """
+        触发本对象。由会话在收到对应的 GMCP 数据时调用。
+
+        :param value: GMCP 原始字符串数据
+        :param value_exp: 解析后的数据。会话调用时传入 gmcp_state 中已解析（或合并后）的值，未传入时使用 json 解析 value
+        """
+        if value_exp is _UNDECODED:
+            try:
+                #value_exp = value.replace("\\x1b", "\u001b")
+                value_exp = json.loads(value, strict = False)
+                #value_exp = ast.literal_eval(value)
+            except Exception as e:
+                value_exp = value
 
         self.line  = value
         self.value = value_exp
@@ -526,6 +761,11 @@ class MatchObject(BaseObject):
         :isRegExp: 是否是正则表达式，默认为 True
         :keepEval: 是否持续匹配，默认为 False
         :raw: 是否匹配含有VT100 ANSI标记的原始数据，默认为 False
+
+    单行匹配模式下，对象的 prefilter 属性为匹配成功时行中必然包含的字面字符串，由 patterns 自动分析得到。
+    会话在调用 match 之前先用其进行预筛选，行中不包含该字符串时将直接跳过。无法分析时为 None，此时总是调用 match。
+    被跳过的对象的 state 与匹配失败时相同，为 NOTSET。
+    verb 属性为匹配成功的命令必然具有的首个单词，会话据此为别名和命令建立索引。无法确定时为 None。
     """
 
     __abbr__ = "mob"
@@ -567,10 +807,15 @@ class MatchObject(BaseObject):
     @patterns.setter
     def patterns(self, patterns: Union[str, Union[Tuple[str], List[str]]]):
         self._patterns = patterns
+        self.prefilter = None
+        self.verb = None
 
         if isinstance(patterns, str):
             self.multiline = False
             self.linesToMatch = 1
+            if not self.isRegExp:
+                # 非正则模式下，匹配成功即等同于行中包含 patterns
+                self.prefilter = patterns or None
         elif isinstance(patterns, Iterable):
             self.multiline = True
             self.linesToMatch = len(patterns)
@@ -582,6 +827,8 @@ class MatchObject(BaseObject):
                 self.multiline = False
                 self.linesToMatch = 1
                 self._regExp = re.compile(patterns, flag)   # 此处可考虑增加flags
+                self.prefilter = required_literal(patterns, flag)
+                self.verb = leading_verb(patterns, flag)
             else:
                 self._regExps = []
                 for line in patterns:
@@ -591,6 +838,9 @@ class MatchObject(BaseObject):
                 self.multiline = True
                 self._mline = 0
 
+        # 匹配模式变化后，会话缓存的预筛选自动机需重建
+        self._dispatch_changed()
+
     def match(self, line: str, docallback = True) -> BaseObject.State:
         """
         匹配函数。由 Session 调用。
@@ -685,6 +935,12 @@ class MatchObject(BaseObject):
         
         return self.state
     
+    def reset_state(self):
+        """
+        将匹配状态置为 NOTSET，与 match 未匹配成功时的结果相同。由会话在预筛选判定本对象不可能匹配、跳过 match 时调用。
+        """
+        self.state = BaseObject.State(self.NOTSET, self.id, "\n".join(self.lines), tuple(self.wildcards))
+
     async def matched(self) -> BaseObject.State:
         """
         匹配函数的异步模式，等待匹配成功之后才返回。返回值 BaseObject.state
@@ -1023,10 +1279,104 @@ class SimpleCommand(Command):
  
         return result
 
+class TimerScheduler:
+    """
+    会话的定时器调度器，由会话创建，不应在脚本中直接使用。
+
+    会话中所有运行中定时器的下次到期时间保存在一个最小堆中，仅使用一个事件循环定时回调等待最早的到期时间，到期时批量触发所有已到期的定时器。
+    定时器的下次到期时间由本次到期时间加上 timeout 得到，回调执行所用的时间不会累积到定时间隔中。
+    定时器复位后，其在堆中的项不立即删除，而是在到期或积累较多时统一清除。
+    """
+    def __init__(self, session) -> None:
+        self.session = session
+        self._heap = []             # (到期时间, 序号, 定时器, 定时器代次)
+        self._seq = 0
+        self._stale = 0             # 堆中已失效项的数量
+        self._handle = None
+        self._handle_when = None
+
+    def __len__(self) -> int:
+        return len(self._heap) - self._stale
+
+    def schedule(self, timer, deadline: float):
+        "安排定时器在 deadline（事件循环时间）到期"
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline, self._seq, timer, timer._generation))
+        timer._deadline = deadline
+        self._arm()
+
+    def cancel(self, timer):
+        "定时器已复位，其在堆中的项失效"
+        self._stale += 1
+        if self._stale > 64 and self._stale * 2 > len(self._heap):
+            self._heap = [item for item in self._heap if item[2]._generation == item[3]]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def clear(self):
+        "清除所有定时项"
+        if self._handle:
+            self._handle.cancel()
+        self._handle = None
+        self._heap.clear()
+        self._stale = 0
+
+    def _arm(self):
+        heap = self._heap
+        while heap and (heap[0][2]._generation != heap[0][3]):
+            heapq.heappop(heap)
+            self._stale = max(0, self._stale - 1)
+
+        if not heap:
+            if self._handle:
+                self._handle.cancel()
+                self._handle = None
+            return
+
+        when = heap[0][0]
+        if self._handle:
+            if self._handle_when <= when:
+                return
+            self._handle.cancel()
+
+        self._handle = self.session.loop.call_at(when, self._fire)
+        self._handle_when = when
+
+    def _fire(self):
+        self._handle = None
+        heap = self._heap
+        loop = self.session.loop
+        # 事件循环会提前至多一个时钟分辨率执行 call_at 回调，此范围内的到期时间也视为已到期，否则会反复安排同一时间的回调
+        now = loop.time() + getattr(loop, "_clock_resolution", 0)
+
+        due = []
+        while heap and heap[0][0] <= now:
+            item = heapq.heappop(heap)
+            if item[2]._generation == item[3]:
+                due.append(item)
+            else:
+                self._stale = max(0, self._stale - 1)
+
+        for deadline, _, timer, generation in due:
+            # 同批次中先触发的定时器回调可能已复位该定时器
+            if timer._generation != generation:
+                continue
+
+            next_deadline = timer._expire(deadline)
+            if next_deadline is not None:
+                self._seq += 1
+                heapq.heappush(heap, (next_deadline, self._seq, timer, timer._generation))
+                timer._deadline = next_deadline
+
+        self._arm()
+
+
 class Timer(BaseObject):
     """
     定时器 Timer 类型，继承自 MatchObject。PYMUD 支持同时任意多个定时器。
 
+    同一会话的所有定时器由会话的 TimerScheduler 统一调度，不再为每个定时器创建单独的任务。
+
     :param session: 对象所属会话
     
     Timer 中使用的 kwargs 均继承自 BaseObject，包括:
@@ -1039,47 +1389,65 @@ class Timer(BaseObject):
     __abbr__ = "ti"
 
     def __init__(self, session, *args, **kwargs):
-        self._task = None
+        self._deadline = None           # 下次到期的事件循环时间，未运行时为None
+        self._generation = 0            # 每次复位时加1，用于使调度器中的旧项失效
         self._halt = False
         super().__init__(session, *args, **kwargs)
 
+        # BaseObject 在设置 timeout 之前设置 enabled，因此在此处启动
+        if self._enabled:
+            self.startTimer()
+
     def __del__(self):
         self.reset()
 
     def startTimer(self):
         "启动定时器"
-        if not isinstance(self._task, asyncio.Task):
+        if (self._deadline is None) and hasattr(self, "timeout"):
             self._halt = False
-            self._task = asyncio.create_task(self.onTimerTask())
-
-        asyncio.ensure_future(self._task)
+            self.session._timer_scheduler.schedule(self, self.session.loop.time() + self.timeout)
 
-    async def onTimerTask(self):
-        "定时任务的调用方法，脚本中无需调用"
+    def _expire(self, deadline: float) -> Optional[float]:
+        "定时到期时由调度器调用，脚本中无需调用。返回下次到期时间，不再继续时返回None"
+        self._deadline = None
+        generation = self._generation
 
-        while self._enabled:
-            await asyncio.sleep(self.timeout)
-
-            if callable(self._onSuccess):
+        if callable(self._onSuccess):
+            try:
                 if asyncio.iscoroutinefunction(self._onSuccess):
                     self.create_task(self._onSuccess(self.id))
                 else:
                     self._onSuccess(self.id)
+            except Exception as e:
+                print_exception(self.session, e, self._onSuccess)
 
-            if self.oneShot or self._halt:
-                break
+        if self.oneShot or self._halt or (not self._enabled) or (generation != self._generation):
+            return None
 
+        # 下次到期时间基于本次到期时间计算，避免回调执行时间造成漂移。若已错过，则从当前时间重新计时
+        next_deadline = deadline + self.timeout
+        now = self.session.loop.time()
+        if next_deadline < now:
+            next_deadline = now + self.timeout
 
-    def reset(self):
-        "复位定时器，清除所创建的定时任务"
-        try:
-            self._halt = True
-            if isinstance(self._task, asyncio.Task) and (not self._task.done()):
-                self._task.cancel()
+        return next_deadline
 
-            self._task = None
-        except asyncio.CancelledError:
-            pass
+    @property
+    def next_fire_time(self) -> Optional[float]:
+        "只读属性，定时器下次到期的时间（time.time()时间戳），未运行时为None"
+        if self._deadline is None:
+            return None
+        return time.time() + (self._deadline - self.session.loop.time())
+
+    def reset(self):
+        "复位定时器，清除所安排的定时"
+        self._halt = True
+        self._generation += 1
+        if self._deadline is not None:
+            self._deadline = None
+            scheduler = getattr(getattr(self, "session", None), "_timer_scheduler", None)
+            if scheduler:
+                scheduler.cancel(self)
 
     @property
     def enabled(self):
@@ -1089,14 +1457,21 @@ class Timer(BaseObject):
     @enabled.setter
     def enabled(self, en: bool):
         self._enabled = en
+        self._dispatch_changed()
         if not en:
             self.reset()
         else:
             self.startTimer()
 
+    def _next_fire_desc(self) -> str:
+        next_fire = self.next_fire_time
+        if next_fire is None:
+            return ""
+        return f' next = {time.strftime("%H:%M:%S", time.localtime(next_fire))}'
+
     def __detailed__(self) -> str:
         group = f'group = "{self.group}" ' if self.group else ''
-        return f'<{self.__class__.__name__}> id = "{self.id}" {group}enabled = {self.enabled} timeout = {self.timeout}'
+        return f'<{self.__class__.__name__}> id = "{self.id}" {group}enabled = {self.enabled} timeout = {self.timeout}{self._next_fire_desc()}'
     
     def __repr__(self) -> str:
         return self.__detailed__()
@@ -1119,5 +1494,5 @@ class SimpleTimer(Timer):
 
     def __detailed__(self) -> str:
         group = f'group = "{self.group}" ' if self.group else ''
-        return f'<{self.__class__.__name__}> id = "{self.id}" {group}enabled = {self.enabled} timeout = {self.timeout} code = "{self._code}"'
+        return f'<{self.__class__.__name__}> id = "{self.id}" {group}enabled = {self.enabled} timeout = {self.timeout}{self._next_fire_desc()} code = "{self._code}"'
 
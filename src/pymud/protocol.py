@@ -1,4 +1,4 @@
-import logging, datetime
+import logging, datetime, zlib
 from asyncio import BaseTransport, Protocol
 from .settings import Settings
 
@@ -180,6 +180,8 @@ class MudClientProtocol(Protocol):
         self._state_machine = "normal"                                      # 状态机标识, normal,
         self._bytes_received_count = 0                                      # 收到的所有字节数（含命令）
         self._bytes_count = 0                                               # 收到的字节数（不含协商），即写入streamreader的字节数
+        self._bytes_inflated_count = 0                                      # MCCP2 解压缩后得到的字节数
+        self._mccp2_decompressor = None                                     # MCCP2 流式解压缩对象，为None时表示未启用压缩
         self.connected = True
         
         self.log.info(f'已建立连接到: {self}.')
@@ -221,95 +223,165 @@ class MudClientProtocol(Protocol):
 
     def data_received(self, data: bytes) -> None:
         self._last_received = datetime.datetime.now()
+        self._bytes_received_count += len(data)
 
-        for byte in data:
-            byte = bytes([byte,])
-            self._bytes_received_count += 1
-            
-            # 状态机为 正常，接下来可能接收到命令包括 IAC 或 正常字符
-            if self._state_machine == "normal":  
-                if byte == IAC:         # 若接收到IAC，状态机切换到等待命令
-                    self._state_machine = "waitcommand"
-                    self.session.go_ahead()
-                else:                   # 否则收到为正常数据，传递给reader
-                    self.session.feed_data(byte)
-            
-            # 状态机为 等待命令，接下来应该收到的字节仅可能包括： WILL/WONT/DO/DONT/SB
-            elif self._state_machine == "waitcommand":
-                if byte in (WILL, WONT, DO, DONT):              # 此时，后续选项仅1个字节
-                    self._iac_command = byte
-                    self._state_machine = "waitoption"   # 后续为选项
-                elif byte == SB:
-                    self._iac_command = byte
-                    self._iac_sub_neg_data = IAC+SB              # 保存完整子协商命令
-                    self._state_machine = "waitsubnegotiation"   # 后续为子协商，以 IAC SE终止
-                elif byte == NOP:                                # 空操作 TODO 确认空操作是否为IAC NOP，没有其他
-                    self.log.debug(f"收到服务器NOP指令: IAC NOP")
-                    self._state_machine = "normal"
-                    # 对NOP信号和GA信号处理相同
-                    self.session.go_ahead()
-                elif byte == GA:
-                    self.log.debug(f"收到服务器GA指令: IAC GA")
-                    self._state_machine = "normal"
-                    # 对NOP信号和GA信号处理相同，让缓冲区全部发送出去
-                    self.session.go_ahead()
-                else:                                            # 错误数据，无法处置，记录错误，并恢复状态机到normal
-                    self.log.error(f"与服务器协商过程中，收到未处理的非法命令: {byte}")
-                    self._state_machine = "normal"
-
-            elif self._state_machine == "waitoption":            # 后续可以接受选项
-                if byte in _option_name_str.keys():
-                    iac_handler = self._iac_handlers[byte]       # 根据选项选择对应的处理函数
-                    if iac_handler and callable(iac_handler):
-                        self.log.debug(f"收到IAC选项协商: IAC {name_command(self._iac_command)} {name_option(byte)}, 并传递至处理函数 {iac_handler.__name__}")
-                        iac_handler(self._iac_command)           # 执行IAC协商
-                    else:
-                        self.log.debug(f"收到不支持(尚未定义处理函数)的IAC协商: IAC {name_command(self._iac_command)} {name_option(byte)}, 将使用默认处理（不接受）")
-                        self._iac_default_handler(self._iac_command, byte)
-                    self._state_machine = "normal"               # 状态机恢复到正常状态
-                else:
-                   self.log.warning(f"收到不识别(不在定义范围内)的IAC协商: IAC {name_command(self._iac_command)} {name_option(byte)}, 将使用默认处理（不接受）")
-                   self._iac_default_handler(self._iac_command, byte)
-                   self._state_machine = "normal"                # 状态机恢复到正常状态
-            
-            elif self._state_machine == "waitsubnegotiation":    # 当收到了IAC SB
-                # 此时，下一个字节应为可选选项，至少不应为IAC
-                if byte != IAC:
-                    self._iac_sub_neg_option = byte              # 保存子协商选项
-                    self._iac_sub_neg_data += byte               # 保存子协商全部内容
-                    self._state_machine = "waitsbdata"           # 下一状态，等待子协商数据
-                else:     
-                    self.log.error('子协商中在等待选项码的字节中错误收到了IAC')                                       
-                    self._state_machine = "normal"               # 此时丢弃所有前面的状态
-            
-            elif self._state_machine == "waitsbdata":           
-                self._iac_sub_neg_data += byte                   # 保存子协商全部内容
-                if byte == IAC:
-                    # 在子协商过程中，如果收到IAC，则下一个字节可能是其他，或者SE。
-                    #   当下一个字节为其他时，IAC是子协商中的一个字符
-                    #   当下一个字节为SE时，表示子协商命令结束
-                    # 基于上述理由，在子协商状态下，状态机的转换规则为：
-                    #   1. 子协商中收到IAC后，状态切换为 waitse
-                    #   2. 在waitse之后，如果收到SE，则子协商结束，回复到normal
-                    #   3. 在waitse之后，如果收到的不是SE，则回复到waitsubnegotiation状态
-                    self._state_machine = "waitse"
-                else:
-                    # 子协商过程中，收到的所有非IAC字节，都是子协商的具体内容
-                    pass
-
-            elif self._state_machine == "waitse":
-                self._iac_sub_neg_data += byte                   # 保存子协商全部内容
-                if byte == SE:                                   # IAC SE 表示子协商已接收完毕
-                    self._state_machine = "normal"
-                    if self._iac_sub_neg_option in _option_name_str.keys():
-                        iac_subneg_handler = self._iac_subneg_handlers[self._iac_sub_neg_option]       # 根据选项子协商选择对应的处理函数
-                        if iac_subneg_handler and callable(iac_subneg_handler):
-                            self.log.debug(f"收到{name_option(self._iac_sub_neg_option)}选项子协商: {self._iac_sub_neg_data}, 并传递至处理函数 {iac_subneg_handler.__name__}")
-                            iac_subneg_handler(self._iac_sub_neg_data)
-                        else:
-                            self.log.debug(f"收到不支持(尚未定义处理函数)的{name_option(self._iac_sub_neg_option)}选项子协商: {self._iac_sub_neg_data}, 将丢弃数据不处理.")
+        while data:
+            decompressor = self._mccp2_decompressor
+            if decompressor is None:
+                # 未压缩时直接解析。若解析过程中开始了 MCCP2 压缩，返回剩余的压缩数据
+                data = self._parse_data(data)
+            else:
+                data = self._mccp2_inflate(decompressor, data)
+
+    def _mccp2_inflate(self, decompressor, data: bytes) -> bytes:
+        "MCCP2 流式解压缩并解析数据。若压缩流已结束，返回流结束后的剩余未压缩数据。"
+        try:
+            inflated = decompressor.decompress(data)
+        except zlib.error as e:
+            # 压缩数据出错时无法恢复，停止解压缩并通知服务器不再使用 MCCP2
+            self.log.error(f"MCCP2 解压缩数据时发生错误: {e}, 将停止MCCP2压缩.")
+            self._mccp2_decompressor = None
+            self.session.write(IAC + DONT + MCCP2)
+            return b""
+
+        rest = b""
+        if decompressor.eof:
+            # 服务器结束压缩流，之后的数据为未压缩数据
+            self.log.debug("MCCP2 压缩流已结束, 恢复为未压缩数据接收.")
+            rest = decompressor.unused_data
+            self._mccp2_decompressor = None
+
+        if inflated:
+            self._bytes_inflated_count += len(inflated)
+            self._parse_data(inflated)
+
+        return rest
+
+    def _parse_data(self, data: bytes) -> bytes:
+        "解析未压缩的数据。若数据中途开始了 MCCP2 压缩，则返回其后尚未解析的压缩数据，否则返回空字节串。"
+        pos, length = 0, len(data)
+        while pos < length:
+            state = self._state_machine
+            if state == "normal":
+                # 正常状态下，使用 find 成块查找下一个 IAC，其间的正常数据一次性传递给会话，不再逐字节处理
+                iac_pos = data.find(IAC, pos)
+                if iac_pos < 0:
+                    self._feed_text(data[pos:] if pos else data)
+                    break
+
+                if iac_pos > pos:
+                    self._feed_text(data[pos:iac_pos])
+
+                # 若接收到IAC，状态机切换到等待命令
+                self._state_machine = "waitcommand"
+                self.session.go_ahead()
+                pos = iac_pos + 1
+
+            elif state == "waitsbdata":
+                # 子协商数据同样成块查找 IAC，之前的所有字节都是子协商的具体内容
+                iac_pos = data.find(IAC, pos)
+                if iac_pos < 0:
+                    self._iac_sub_neg_data += data[pos:]
+                    break
+
+                self._iac_sub_neg_data += data[pos:iac_pos + 1]
+                self._state_machine = "waitse"
+                pos = iac_pos + 1
+
+            else:
+                # IAC 序列中的其余状态，仍按字节由状态机处理
+                self._handle_iac_byte(data[pos:pos + 1])
+                pos += 1
+
+                # IAC SB MCCP2 IAC SE 之后的全部数据均为压缩数据
+                if self._mccp2_decompressor is not None:
+                    return data[pos:]
+
+        return b""
+
+    def _feed_text(self, text: bytes) -> None:
+        "将一段不含 IAC 的正常数据按行分割后，一次性批量传递给会话"
+        self._bytes_count += len(text)
+        self.session.feed_lines(text.split(b"\n"))
+
+    def _handle_iac_byte(self, byte: bytes) -> None:
+        "IAC 序列的状态机处理，每次处理1个字节。"
+        # 状态机为 等待命令，接下来应该收到的字节仅可能包括： WILL/WONT/DO/DONT/SB
+        if self._state_machine == "waitcommand":
+            if byte in (WILL, WONT, DO, DONT):              # 此时，后续选项仅1个字节
+                self._iac_command = byte
+                self._state_machine = "waitoption"   # 后续为选项
+            elif byte == SB:
+                self._iac_command = byte
+                self._iac_sub_neg_data = IAC+SB              # 保存完整子协商命令
+                self._state_machine = "waitsubnegotiation"   # 后续为子协商，以 IAC SE终止
+            elif byte == NOP:                                # 空操作 TODO 确认空操作是否为IAC NOP，没有其他
+                self.log.debug(f"收到服务器NOP指令: IAC NOP")
+                self._state_machine = "normal"
+                # 对NOP信号和GA信号处理相同
+                self.session.go_ahead()
+            elif byte == GA:
+                self.log.debug(f"收到服务器GA指令: IAC GA")
+                self._state_machine = "normal"
+                # 对NOP信号和GA信号处理相同，让缓冲区全部发送出去
+                self.session.go_ahead()
+            else:                                            # 错误数据，无法处置，记录错误，并恢复状态机到normal
+                self.log.error(f"与服务器协商过程中，收到未处理的非法命令: {byte}")
+                self._state_machine = "normal"
+
+        elif self._state_machine == "waitoption":            # 后续可以接受选项
+            if byte in _option_name_str.keys():
+                iac_handler = self._iac_handlers[byte]       # 根据选项选择对应的处理函数
+                if iac_handler and callable(iac_handler):
+                    self.log.debug(f"收到IAC选项协商: IAC {name_command(self._iac_command)} {name_option(byte)}, 并传递至处理函数 {iac_handler.__name__}")
+                    iac_handler(self._iac_command)           # 执行IAC协商
                 else:
-                    self._state_machine = "waitsbdata"
+                    self.log.debug(f"收到不支持(尚未定义处理函数)的IAC协商: IAC {name_command(self._iac_command)} {name_option(byte)}, 将使用默认处理（不接受）")
+                    self._iac_default_handler(self._iac_command, byte)
+                self._state_machine = "normal"               # 状态机恢复到正常状态
+            else:
+               self.log.warning(f"收到不识别(不在定义范围内)的IAC协商: IAC {name_command(self._iac_command)} {name_option(byte)}, 将使用默认处理（不接受）")
+               self._iac_default_handler(self._iac_command, byte)
+               self._state_machine = "normal"                # 状态机恢复到正常状态
+        
+        elif self._state_machine == "waitsubnegotiation":    # 当收到了IAC SB
+            # 此时，下一个字节应为可选选项，至少不应为IAC
+            if byte != IAC:
+                self._iac_sub_neg_option = byte              # 保存子协商选项
+                self._iac_sub_neg_data += byte               # 保存子协商全部内容
+                self._state_machine = "waitsbdata"           # 下一状态，等待子协商数据
+            else:     
+                self.log.error('子协商中在等待选项码的字节中错误收到了IAC')                                       
+                self._state_machine = "normal"               # 此时丢弃所有前面的状态
+        
+        elif self._state_machine == "waitsbdata":           
+            self._iac_sub_neg_data += byte                   # 保存子协商全部内容
+            if byte == IAC:
+                # 在子协商过程中，如果收到IAC，则下一个字节可能是其他，或者SE。
+                #   当下一个字节为其他时，IAC是子协商中的一个字符
+                #   当下一个字节为SE时，表示子协商命令结束
+                # 基于上述理由，在子协商状态下，状态机的转换规则为：
+                #   1. 子协商中收到IAC后，状态切换为 waitse
+                #   2. 在waitse之后，如果收到SE，则子协商结束，回复到normal
+                #   3. 在waitse之后，如果收到的不是SE，则回复到waitsubnegotiation状态
+                self._state_machine = "waitse"
+            else:
+                # 子协商过程中，收到的所有非IAC字节，都是子协商的具体内容
+                pass
+
+        elif self._state_machine == "waitse":
+            self._iac_sub_neg_data += byte                   # 保存子协商全部内容
+            if byte == SE:                                   # IAC SE 表示子协商已接收完毕
+                self._state_machine = "normal"
+                if self._iac_sub_neg_option in _option_name_str.keys():
+                    iac_subneg_handler = self._iac_subneg_handlers[self._iac_sub_neg_option]       # 根据选项子协商选择对应的处理函数
+                    if iac_subneg_handler and callable(iac_subneg_handler):
+                        self.log.debug(f"收到{name_option(self._iac_sub_neg_option)}选项子协商: {self._iac_sub_neg_data}, 并传递至处理函数 {iac_subneg_handler.__name__}")
+                        iac_subneg_handler(self._iac_sub_neg_data)
+                    else:
+                        self.log.debug(f"收到不支持(尚未定义处理函数)的{name_option(self._iac_sub_neg_option)}选项子协商: {self._iac_sub_neg_data}, 将丢弃数据不处理.")
+            else:
+                self._state_machine = "waitsbdata"
 
     # public properties
     @property
@@ -898,12 +970,12 @@ class MudClientProtocol(Protocol):
         """
         处理MUD客户端压缩协议的协商V2 https://mudhalla.net/tintin/protocols/mccp/
         server - IAC WILL MCCP2
-        client - IAC DONT MCCP2
-        当前不接收客户端压缩(未实现）
+        client - IAC DO MCCP2 / IAC DONT MCCP2 (由 Settings.server["MCCP2"] 确定)
+        server - IAC SB MCCP2 IAC SE, 之后服务器发送的所有数据均为 zlib 压缩数据
         """
         nohandle = False
         if cmd == WILL:
-            # 1. 回复不同意MCCP2协商
+            # 1. 根据设置回复是否同意MCCP2协商
             if Settings.server["MCCP2"]:
                 self.session.write(IAC + DO + MCCP2)
                 self.log.debug(f'发送选项协商, 同意MCCP V2协商 IAC DO MCCP2')
@@ -923,25 +995,42 @@ class MudClientProtocol(Protocol):
         if nohandle:
             self.log.warning(f"收到服务器的未处理的MCCP V2协商: IAC {name_command(cmd)} MCCP2")
 
+    def handle_mccp2_sb(self, data: bytes):
+        """
+        处理MCCP2的子协商
+        server - IAC SB MCCP2 IAC SE
+        收到子协商之后，服务器发送的所有数据均为压缩数据，直至压缩流结束。此处创建流式解压缩对象，由 data_received 进行解压缩。
+        """
+        if Settings.server["MCCP2"]:
+            self._mccp2_decompressor = zlib.decompressobj()
+            self.log.debug("收到MCCP2子协商 IAC SB MCCP2 IAC SE, 此后服务器数据将以压缩方式接收.")
+        else:
+            self.log.warning("未同意MCCP2协商, 但收到服务器MCCP2子协商, 将忽略.")
+
     def handle_mccp3(self, cmd):
         """
         处理MUD客户端压缩协议的协商V3 https://mudhalla.net/tintin/protocols/mccp/
         server - IAC WILL MCCP3
-        client - IAC DONT MCCP3
-        当前不接收客户端压缩(未实现）
+        client - IAC DO MCCP3 / IAC DONT MCCP3 (由 Settings.server["MCCP3"] 确定)
+        client - IAC SB MCCP3 IAC SE, 之后客户端发送的所有数据均由 Session.write 进行 zlib 压缩
         """
         nohandle = False
         if cmd == WILL:
-            # 1. 回复不同意MCCP2协商
+            # 1. 根据设置回复是否同意MCCP3协商
             if Settings.server["MCCP3"]:
                 self.session.write(IAC + DO + MCCP3)
                 self.log.debug(f'发送选项协商, 同意MCCP V3协商 IAC DO MCCP3')
+                # 2. 发送子协商，随后开始压缩
+                self.session.write(IAC + SB + MCCP3 + IAC + SE)
+                self.session.start_mccp3()
+                self.log.debug(f'发送MCCP3子协商 IAC SB MCCP3 IAC SE, 此后客户端数据将以压缩方式发送.')
             else:
                 self.session.write(IAC + DONT + MCCP3)
                 self.log.debug(f'发送选项协商, 不同意MCCP V3协商 IAC DONT MCCP3')
 
         elif cmd == WONT:
-            nohandle = True
+            # 服务器不再接受压缩数据时，结束压缩
+            self.session.stop_mccp3()
         elif cmd == DO:
             nohandle = True
         elif cmd == DONT:
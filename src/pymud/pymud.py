@@ -1,5 +1,6 @@
 import platform
-import asyncio, functools, os, webbrowser, threading
+import asyncio, functools, os, re, webbrowser, threading, time
+from typing import Optional
 from functools import partial
 from datetime import datetime
 from prompt_toolkit.clipboard import InMemoryClipboard
@@ -29,6 +30,7 @@ from .objects import CodeBlock
 from .extras import BufferBase, LogFileBuffer, PyMudBufferControl, EasternMenuContainer, VSplitWindow, DotDict, MenuItem
 from .modules import Plugin
 from .session import Session
+from .logger import ThreadedLogService
 from .settings import Settings
 from .dialogs import MessageDialog, WelcomeDialog, QueryDialog, NewSessionDialog, LogSelectionDialog
 
@@ -60,6 +62,9 @@ class PyMudApp:
     *替代配置按不同的dict使用dict.update进行更新覆盖，因此可以仅指定需替代的部分。*
     """
 
+    PANES = ("status", )
+    "界面中可以单独标记刷新、并缓存显示内容的区域。会话内容与顶部会话标签在每次刷新时均重新生成，无需标记"
+
     def __init__(self, cfg_data = None) -> None:
         """
         构造PyMudApp对象实例，并加载替代配置。
@@ -106,6 +111,14 @@ class PyMudApp:
         self.current_session = None
         self.status_display = STATUS_DISPLAY(Settings.client["status_display"])
 
+        # 界面刷新合并，按 Settings.client["max_fps"] 限制刷新频率
+        self._dirty = set(self.PANES)           # 待刷新的区域
+        self._redraw_handle = None              # 已安排的刷新
+        self._last_redraw = 0.0
+        self._status_text = ""                  # 状态窗口内容缓存，仅在 status 区域需要刷新时重新生成
+        self.redraw_requested = 0               # 刷新请求次数
+        self.redraw_suppressed = 0              # 被合并或忽略（非当前会话）的刷新请求次数
+
         self.keybindings = KeyBindings()
         self.keybindings.add(Keys.PageUp, is_global = True)(self.page_up)
         self.keybindings.add(Keys.PageDown, is_global = True)(self.page_down)
@@ -159,6 +172,7 @@ class PyMudApp:
         self.set_status(Settings.text["welcome"])
 
         self.loggers = dict()           # 所有记录字典K
+        self.log_service = ThreadedLogService()     # 所有记录器共享的记录服务，可替换为 SyncLogService 以同步写入
         self.showLog = False            # 是否显示记录页
         self.logFileShown = ''          # 记录页显示的记录文件名
         self.logSessionBuffer = LogFileBuffer("LOGBUFFER")
@@ -177,7 +191,7 @@ class PyMudApp:
     async def onSystemTimerTick(self):
         while True:
             await asyncio.sleep(1)
-            self.app.invalidate()
+            self.invalidate()
 
             # Create a copy of values to avoid RuntimeError when dict is modified during iteration
             for callback in list(self._onTimerCallbacks.values()):
@@ -486,8 +500,49 @@ class PyMudApp:
 
         return menus
 
-    def invalidate(self):
-        "刷新显示界面"
+    def invalidate(self, pane: Optional[str] = None, session: Optional[Session] = None):
+        """
+        刷新显示界面。多次刷新请求会被合并，刷新频率不超过 Settings.client["max_fps"] 次/秒。
+
+        :param pane: 需要刷新的区域，为 PANES 之一（目前仅有 status 状态窗口）。不指定时刷新全部区域
+        :param session: 发起刷新的会话。指定时，若该会话不是当前会话，则不进行刷新
+
+        刷新请求次数和被合并、忽略的次数分别记录在 redraw_requested 和 redraw_suppressed 中，可用于调整 max_fps。
+        """
+        self.redraw_requested += 1
+
+        if (session is not None) and (session is not self.current_session):
+            self.redraw_suppressed += 1
+            return
+
+        if pane is None:
+            self._dirty.update(self.PANES)
+        else:
+            self._dirty.add(pane)
+
+        if self._redraw_handle is not None:
+            self.redraw_suppressed += 1
+            return
+
+        max_fps = Settings.client.get("max_fps", 0)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环线程中（或循环尚未运行），直接交由 prompt_toolkit 处理
+            loop = None
+
+        delay = 0
+        if max_fps and max_fps > 0:
+            delay = self._last_redraw + 1.0 / max_fps - time.monotonic()
+
+        if (loop is None) or (delay <= 0):
+            self._redraw()
+        else:
+            self._redraw_handle = loop.call_later(delay, self._redraw)
+
+    def _redraw(self):
+        self._redraw_handle = None
+        self._last_redraw = time.monotonic()
         self.app.invalidate()
 
     def scroll(self, lines = 1):
@@ -619,12 +674,12 @@ class PyMudApp:
             if not raw:
                 #if b.selection.start_row == b.selection.end_row:
                 if b.selection.rows == 1:
-                    if b.selection.actual_end_col - b.selection.actual_start_col >= len(b.getLine(b.selection.start_row)):
+                    if b.selection.actual_end_col - b.selection.actual_start_col >= len(b.getAbsLine(b.selection.start_row)):
                         # 单行且选中了整行，此时不校正显示位置匹配
-                        line = b.getLine(b.selection.actual_start_row)
+                        line = b.getAbsLine(b.selection.actual_start_row)
                     else:
                         # 单行且选中了部分内容，此时校正显示位置匹配
-                        line = self.consoleView.line_correction(b.getLine(b.selection.actual_start_row))
+                        line = self.consoleView.line_correction(b.getAbsLine(b.selection.actual_start_row))
 
                     start = max(0, b.selection.actual_start_col)
                     end = min(len(line)+1, b.selection.actual_end_col)
@@ -638,7 +693,7 @@ class PyMudApp:
                     # 多行只认行
                     lines = []
                     for row in range(b.selection.actual_start_row, b.selection.actual_end_row + 1):
-                        line = b.getLine(row)
+                        line = b.getAbsLine(row)
                         line_plain = Session.PLAIN_TEXT_REGX.sub("", line).replace("\r", "").replace("\x00", "")
                         lines.append(line_plain)
                     copy_text = "\n".join(lines)
@@ -650,7 +705,7 @@ class PyMudApp:
                 #if b.selection.start_row == b.selection.end_row:
                 if b.selection.rows == 1:
                     # 单行情况
-                    line = b.getLine(b.selection.actual_start_row)
+                    line = b.getAbsLine(b.selection.actual_start_row)
                     self.app.clipboard.set_text(line)
                     self.set_status(Settings.gettext("msg_copy", line))
                     if self.current_session:
@@ -660,7 +715,7 @@ class PyMudApp:
                     # 多行只认行
                     lines = []
                     for row in range(b.selection.actual_start_row, b.selection.actual_end_row + 1):
-                        line = b.getLine(row)
+                        line = b.getAbsLine(row)
                         lines.append(line)
                     copy_raw_text = "\n".join(lines)
                     self.app.clipboard.set_text(copy_raw_text)
@@ -767,7 +822,29 @@ class PyMudApp:
 
             #self.logSessionBuffer.cursor_position = len(self.logSessionBuffer.text)
             self.consoleView.buffer = self.logSessionBuffer
-            self.app.invalidate()
+            self.invalidate()
+
+    async def search_log(self, pattern: str, limit = 20):
+        "在记录页当前显示的记录文件中搜索，并使分屏显示跳转到最近的匹配行，结果显示在状态栏"
+        b = self.logSessionBuffer
+        if not pattern:
+            self.set_status(Settings.gettext("msg_find_usage"))
+            return
+
+        try:
+            regex = re.compile(pattern)
+        except re.error as e:
+            self.set_status(Settings.gettext("msg_find_invalid", pattern, e))
+            return
+
+        hits = await asyncio.get_running_loop().run_in_executor(None, b.searcher(regex, limit))
+        if hits:
+            b.jump_to(hits[0][0])
+            self.set_status(Settings.gettext("msg_find_log", len(hits), pattern, hits[0][0] + 1))
+        else:
+            self.set_status(Settings.gettext("msg_find_nohit", pattern))
+
+        self.invalidate()
 
     def activate_session(self, key):
         "激活指定名称的session，并将该session设置为当前session"
@@ -777,7 +854,7 @@ class PyMudApp:
             self.current_session = session
             self.consoleView.buffer = session.buffer
             #self.set_status(Settings.text["session_changed"].format(session.name))
-            self.app.invalidate()
+            self.invalidate()
 
     def close_session(self, name = None, prompt = True):
         "关闭当前会话。若当前会话处于连接状态，将弹出对话框以确认。"
@@ -811,6 +888,7 @@ class PyMudApp:
 
                 name = session.name
                 session.closeLoggers()
+                session.closeVariableStore()
                 session.clean()
                 session = None
                 #self.consoleView.buffer = SessionBuffer()
@@ -933,7 +1011,7 @@ class PyMudApp:
     # 暂未实现该功能
     def act_change_layout(self, layout):
         self.status_display = layout
-        self.app.invalidate()
+        self.invalidate()
 
     def act_exit(self):
         """菜单: 退出"""
@@ -1085,6 +1163,10 @@ class PyMudApp:
 
     def get_statuswindow_text(self):
         "状态窗口: status_maker 的内容"
+        if "status" not in self._dirty:
+            return self._status_text
+
+        self._dirty.discard("status")
         text = ""
 
         try:
@@ -1093,6 +1175,7 @@ class PyMudApp:
         except Exception as e:
             text = f"{e}"
 
+        self._status_text = text
         return text
 
     def set_status(self, msg):
@@ -1102,7 +1185,7 @@ class PyMudApp:
         :param msg: 要显示的消息
         """
         self.status_message = msg
-        self.app.invalidate()
+        self.invalidate("status")
 
     def _quickHandleSession(self, group, name):
         '''
@@ -1248,6 +1331,9 @@ class PyMudApp:
                     self.act_exit()
                 elif (cmd_line == "#close") and self.showLog:
                     self.act_close_session()
+                elif cmd_line.split(" ")[0] in ("#find", "#grep") and self.showLog:
+                    parts = cmd_line.split(maxsplit = 1)
+                    asyncio.ensure_future(self.search_log(parts[1] if len(parts) > 1 else ""))
                 else:
                     self.set_status(Settings.gettext("msg_no_session"))
 
@@ -1374,6 +1460,9 @@ class PyMudApp:
             if isinstance(plugin, Plugin):
                 plugin.onAppDestroy(self)
 
+        # 确保各记录器中尚未写入的内容写入文件
+        self.log_service.shutdown(timeout = 1)
+
         if len(self._background_tasks) > 0:
             await asyncio.wait(self._background_tasks, timeout = 5, return_when = asyncio.ALL_COMPLETED)
 
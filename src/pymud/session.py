@@ -1,17 +1,17 @@
-import asyncio, logging, re, math, os, pickle, datetime, sysconfig, time, dataclasses
+import asyncio, logging, re, math, os, datetime, sysconfig, time, dataclasses, zlib, codecs
 from pathlib import Path
 from collections.abc import Iterable
 from collections import OrderedDict
 from prompt_toolkit.utils import get_cwidth
-from wcwidth import wcswidth
 from typing import Union, Optional, Any, List, Tuple, Dict, Type
 from .logger import Logger
-from .extras import DotDict, SessionBuffer, DStr
+from .storage import VariableStore
+from .extras import DotDict, TrackedDotDict, GroupIndex, GMCPState, SessionBuffer, CompactSessionBuffer, DStr, AhoCorasick, str_width, char_width, needs_wcswidth
 from .protocol import MudClientProtocol
 from .modules import ModuleInfo, Plugin
-from .objects import BaseObject, Trigger, Alias, Command, Timer, SimpleAlias, SimpleTrigger, SimpleTimer, GMCPTrigger, CodeBlock, CodeLine
+from .objects import BaseObject, Trigger, Alias, Command, Timer, TimerScheduler, SimpleAlias, SimpleTrigger, SimpleTimer, GMCPTrigger, CodeBlock, CodeLine
 from .settings import Settings
-from .decorators import exception
+from .decorators import exception, print_exception
 
 class Session:
     """
@@ -33,6 +33,12 @@ class Session:
     #_esc_regx = re.compile(r"\x1b\[[\d;]+[abcdmz]", flags = re.IGNORECASE)
     PLAIN_TEXT_REGX = re.compile("\x1b\\[[0-9;]*[a-zA-Z]", flags = re.IGNORECASE | re.ASCII)
 
+    VERB_REGX = re.compile(r"\S*")
+    "命令的首个单词（行首至第一个空白字符），用于查找别名/命令索引"
+
+    AC_MIN_PATTERNS = 16
+    "使能触发器的预筛选字面字符串不少于该数量时，使用 Aho-Corasick 自动机一次扫描完成预筛选，否则逐个使用 in 判断"
+
     _sys_commands = (
         "help",
         "exit",
@@ -44,6 +50,8 @@ class Session:
         "warning",      # 输出黄色warning
         "error",        # 输出红色error
         "clear",        # 清除屏幕
+        "buffer",       # 显示缓冲区信息
+        "find",         # 搜索缓冲区内容
 
         "test",         # 测试输出信息
 
@@ -103,12 +111,14 @@ class Session:
         "t-"  : "ignore",
         "show": "test",
         "echo": "test",
+        "grep": "find",
     }
 
     def __init__(self, app, name, host, port, encoding = None, after_connect = None, loop = None, **kwargs):
         self.pyversion = sysconfig.get_python_version()   
         self.loop = loop or asyncio.get_running_loop()    
         self.syslog = logging.getLogger("pymud.Session")
+        self._timer_scheduler = TimerScheduler(self)         # 本会话所有定时器的调度器
 
         from .pymud import PyMudApp
         if isinstance(app, PyMudApp):
@@ -117,6 +127,7 @@ class Session:
         self.name = name
         self._transport = None
         self._protocol  = None
+        self._mccp3_compressor = None                       # MCCP3 客户端压缩对象，为None时表示不压缩
         self.state      = "INITIALIZED"
         self._eof       = False
         self._uid       = 0
@@ -139,7 +150,8 @@ class Session:
 
         self.last_command = ""
         
-        self.buffer     = SessionBuffer(self.name, newline = self.newline_cli, max_buffered_lines = Settings.client["buffer_lines"])
+        buffer_class    = CompactSessionBuffer if Settings.client.get("buffer_compact", False) else SessionBuffer
+        self.buffer     = buffer_class(self.name, newline = self.newline_cli, max_buffered_lines = Settings.client["buffer_lines"])
         self.buffer_pos_end   = 0                           # 标注最后位置光标指针
         self.buffer_pos_view  = 0                           # 标注查看位置光标指针
         self.buffer_pos_view_line = -1
@@ -161,6 +173,8 @@ class Session:
         self.after_connect = after_connect
 
         self._modules = OrderedDict()
+        self._variable_store = None
+        self._last_var_save = time.monotonic()
 
         # 将变量加载和脚本加载调整到会话创建时刻
         if Settings.client["var_autoload"]:
@@ -178,14 +192,24 @@ class Session:
                 if os.path.exists(file):
                     os.remove(file)
 
-            if os.path.exists(new_loc_file):
-                with open(new_loc_file, "rb") as fp:
-                    try:
-                        vars = pickle.load(fp)
-                        self._variables.update(vars)
-                        self.info(Settings.gettext("msg_var_autoload_success", file))
-                    except Exception as e:
-                        self.warning(Settings.gettext("msg_var_autoload_fail", file, e))
+            store = self.variable_store
+            file = store.filename
+            try:
+                vars = store.load()
+                # 老版本使用 pickle 整体保存的.mud文件，在变量存储为空时导入，导入后改名为 .mud.bak 保留
+                if (not vars) and os.path.exists(new_loc_file):
+                    file = new_loc_file
+                    vars = store.import_pickle(new_loc_file)
+                    os.replace(new_loc_file, f"{new_loc_file}.bak")
+
+                if vars:
+                    self._variables.update(vars)
+                    self._variables.take_changes()
+                    self.info(Settings.gettext("msg_var_autoload_success", file))
+            except Exception as e:
+                self.warning(Settings.gettext("msg_var_autoload_fail", file, e))
+
+        self.application.addTimerTickCallback(f"var_autosave.{self.name}", self._autosaveVariables)
 
         
         if self._auto_script:
@@ -201,15 +225,31 @@ class Session:
 
     def initialize(self):
         "初始化Session有关对象。 **无需脚本调用。**"
-        self._line_buffer = bytearray()
+        self._line_text = ""                                # 已解码但尚未收到换行符的不完整行
+        self._decoder = None                                # 增量解码器，跨数据包保留不完整的多字节字符
+        self._decoder_encoding = None                       # 增量解码器对应的编码
         
         self._triggers = DotDict()
         self._aliases  = DotDict()
         self._commands = DotDict()
         self._timers   = DotDict()
         self._gmcp     = DotDict()
-
-        self._variables = DotDict()
+        self._gmcp_state = GMCPState()                      # 收到的GMCP数据合并而成的状态树，按需解析
+        self._group_index = GroupIndex()                    # 按组名索引的对象，供组操作使用
+
+        self._variables = TrackedDotDict()                  # 会话变量，记录变化的键用于增量保存
+        self._find_output = []                              # #find 结果输出所在的行号范围 [start, end)，搜索时跳过
+
+        self._tri_table = None                              # 缓存的触发器分发表（已使能、按优先级排序），为None时表示需重建
+        self._tri_generation = 0                            # 触发器分发表重建次数
+        self._tri_matcher = None                            # 触发器预筛选字面字符串的多模式匹配自动机，随分发表一同重建
+        self._tri_literal_index = dict()
+        self._tri_unindexed = list()
+        self._ali_table = None                              # 缓存的别名分发表及其首单词索引，为None时表示需重建
+        self._cmd_table = None                              # 缓存的命令分发表及其首单词索引，为None时表示需重建
+        self._tri_matched = []                              # 上次分发时匹配成功的触发器、别名、命令，用于复位被预筛选跳过对象的状态
+        self._ali_matched = []
+        self._cmd_matched = []
 
         #self._tasks    = []
         self._tasks    = set()
@@ -232,6 +272,8 @@ class Session:
             
             self._transport = transport
             self._protocol  = protocol
+            self._mccp3_compressor = None
+            self._decoder   = None
             self._state     = "RUNNING"
             #self.initialize()
 
@@ -275,6 +317,8 @@ class Session:
 
     def onDisconnected(self, protocol):
         "当从服务器连接断开时执行的操作。包括保存变量(若设置)、打印断开时间、执行自定义事件(若设置)等。"
+        self._mccp3_compressor = None
+
         # 断开时自动保存变量数据
         if Settings.client["var_autosave"]:
             self.handle_save()
@@ -402,7 +446,7 @@ class Session:
         :return 指定名称的记录器 Logger 对象
         """
         if name not in self.application.loggers.keys():
-            logger = Logger(name, mode, encoding, encoding_errors, raw)
+            logger = Logger(name, mode, encoding, encoding_errors, raw, service = self.application.log_service)
             self._loggers[name] = logger
             self.application.loggers[name] = logger
 
@@ -469,6 +513,23 @@ class Session:
         """
         return self._variables
 
+    @property
+    def variable_store(self) -> VariableStore:
+        "会话变量的持久化存储，保存在 save 目录下的 {会话名}.db 文件中。首次访问时创建"
+        if self._variable_store is None:
+            muddir = Path.cwd().joinpath('save')
+            if not muddir.exists() or not muddir.is_dir():
+                muddir.mkdir()
+            self._variable_store = VariableStore(muddir.joinpath(f"{self.name}.db"))
+        return self._variable_store
+
+    def closeVariableStore(self):
+        "停止定时自动保存，等待变量保存完成后关闭变量存储。 **脚本中无需调用。**"
+        self.application.removeTimerTickCallback(f"var_autosave.{self.name}")
+        if self._variable_store is not None:
+            self._variable_store.close()
+            self._variable_store = None
+
     @property
     def globals(self):
         """
@@ -537,6 +598,19 @@ class Session:
         "本会话的GMCP辅助访问器"
         return self._gmcp
 
+    @property
+    def gmcp_state(self) -> GMCPState:
+        """
+        本会话的GMCP状态树，只读属性。收到的GMCP数据按 name 合并保存于此，读取时才进行解析。
+
+        示例:
+            .. code:: Python
+
+                hp = session.gmcp_state.get("Char.Vitals.hp")
+                session.gmcp_state.subscribe("Char.Vitals.hp", lambda path, value: session.info(value))
+        """
+        return self._gmcp_state
+
     def get_status(self):
         "返回状态窗口内容的真实函数。 **脚本中无需调用。**"
         text = Settings.gettext("msg_default_statuswindow", self.name, self.connected)
@@ -581,16 +655,75 @@ class Session:
             self._line_count += 1
             self.log.log(self.newline_cli)
 
+        # 由应用合并刷新请求，非当前会话不刷新显示。触发器可能修改了状态窗口中显示的变量，因此同时刷新状态窗口
+        self.application.invalidate(session = self)
+
+    async def search_buffer(self, pattern: Union[str, re.Pattern], limit: int = 100) -> List[Tuple[int, str]]:
+        """
+        在会话缓冲区中搜索匹配的行。搜索在后台线程中进行，不阻塞会话的数据处理与界面显示。
+
+        :param pattern: 正则表达式，可以为字符串或已编译的正则表达式。按去除ANSI标记后的纯文本匹配
+        :param limit: 最多返回的行数，默认100
+        :return: (绝对行号, 纯文本行内容) 的列表，最近的行在前。可以使用 self.buffer.jump_to(行号) 使分屏显示跳转到该行
+
+        示例:
+            .. code:: Python
+
+                hits = await session.search_buffer(r"任务.*在(\\S+)附近", 10)
+                for lineno, line in hits:
+                    session.info(f"{lineno}: {line}")
+        """
+        regex = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern)
+        buffer = self.buffer
+
+        # 跳过此前 #find 输出的结果行，否则重复搜索时结果行会被再次匹配
+        self._find_output = ranges = [(start, end) for start, end in self._find_output if end > buffer.first_lineno]
+        skipped = sum(end - start for start, end in ranges)
+
+        search = buffer.searcher(regex, limit + skipped)
+        hits = await self.loop.run_in_executor(None, search)
+        if ranges:
+            hits = [hit for hit in hits if not any(start <= hit[0] < end for start, end in ranges)][:limit]
+        return hits
+
     def feed_data(self, data) -> None:
         """
-        由协议对象调用，将收到的远程数据加入会话缓冲。永远只会传递1个字节的数据，以bytes形式。 **脚本中无需调用。**
+        由协议对象调用，将收到的远程数据加入会话缓冲。传递的是一段不含IAC的连续数据，以bytes形式。 **脚本中无需调用。**
         
-        :param data: 传入的数据， bytes 格式
+        :param data: 传入的数据， bytes 格式，可能包含多行
         """
-        self._line_buffer.extend(data)
+        self.feed_lines(data.split(b"\n"))
 
-        if (len(data) == 1) and (data[0] == ord("\n")):
-            self.go_ahead()
+    def feed_lines(self, lines: List[bytes]) -> None:
+        """
+        由协议对象调用，批量处理收到的远程数据。整批数据只解码、去除ANSI转义一次，然后对所有完整行依次执行触发器处理。 **脚本中无需调用。**
+
+        解码使用会话的增量解码器，被数据包或 IAC GA 截断的多字节字符会保留到下一批数据中继续解码，不会丢失。
+
+        :param lines: 以换行符分割的字节串列表，即 data.split(b"\\n") 的结果。除最后一个元素外，每个元素均为一个完整行（不含换行符）；最后一个元素为尚未收到换行符的不完整行（可以为空），将保留在接收缓冲中。
+        """
+        if not lines:
+            return
+
+        # 会话编码可以在连接过程中修改（如 GBK 与 UTF-8 切换），编码变化时重建解码器
+        decoder = self._decoder
+        if (decoder is None) or (self._decoder_encoding != self.encoding):
+            decoder = self._decoder = codecs.getincrementaldecoder(self.encoding)(Settings.server["encoding_errors"])
+            self._decoder_encoding = self.encoding
+
+        text = decoder.decode(lines[0] if len(lines) == 1 else b"\n".join(lines))
+        if self._line_text:
+            # 上一批数据中尚未完成的行，与本批数据合并
+            text = self._line_text + text
+
+        head, sep, self._line_text = text.rpartition("\n")
+        if sep:
+            # ANSI转义不会跨行，因此整批去除后再分割，与逐行处理结果一致
+            raw_lines = head.split("\n")
+            tri_lines = Session.PLAIN_TEXT_REGX.sub("", head).split("\n")
+
+            for raw_line, tri_line in zip(raw_lines, tri_lines):
+                self._process_line(raw_line + "\n", tri_line.rstrip("\r"))
 
     def feed_eof(self) -> None:
         """
@@ -607,20 +740,42 @@ class Session:
         由协议对象调用，处理收到远程 GMCP 数据。 **脚本中无需调用。**
 
         :param name: 收到的GMCP数据的 name
-        :param value: 收到的GMCP数据的 value。 该数据值类型为 字符串形式使用json读取后的结果
+        :param value: 收到的GMCP数据的 value，为未经解析的原始字符串
+
+        收到的数据先保存到 gmcp_state 状态树中，只有在有 GMCPTrigger 或订阅需要时才进行 json 解析。
+        除 id 与 name 相同的 GMCPTrigger 外，id 为 name 之下更深路径（如 Char.Vitals.hp）的 GMCPTrigger 在该路径的值被改变时也会触发。
 
-        **注** 当未通过GMCPTrigger对某个name的GMCP数据进行处理时，会通过session.info将该GMCP数据打印出来以供调试。
-        当已有GMCPTrigger处理该name的GMCP数据时，则不会再打印此信息。
+        **注** 当未通过GMCPTrigger或订阅对某个name的GMCP数据进行处理时，会通过session.info将该GMCP数据打印出来以供调试。
+        为避免频繁推送的GMCP数据反复打印，默认仅打印每个name第一次收到的数据，可以将 Settings.client["gmcp_echo_all"] 设置为True以打印全部数据。
         """
+        state = self._gmcp_state
+        first = state.message(name) is None
+        msg = state.feed(name, value)
 
         nothandle = True
-        if name in self._gmcp.keys():
-            gmcp = self._gmcp[name]
-            if isinstance(gmcp, GMCPTrigger) and gmcp.enabled:
-                gmcp(value)
+        gmcp = self._gmcp.get(name, None)
+        if isinstance(gmcp, GMCPTrigger) and gmcp.enabled:
+            gmcp(msg.raw, msg.value)
+            nothandle = False
+
+        for path in state.affected(msg):
+            if path != name:
+                gmcp = self._gmcp.get(path, None)
+                if isinstance(gmcp, GMCPTrigger) and gmcp.enabled:
+                    gmcp(msg.raw, state.get(path))
+                    nothandle = False
+
+            callbacks = state.subscribers(path)
+            if callbacks:
                 nothandle = False
+                data = state.get(path)
+                for callback in callbacks:
+                    try:
+                        callback(path, data)
+                    except Exception as e:
+                        print_exception(self, e)
 
-        if nothandle:
+        if nothandle and (first or Settings.client.get("gmcp_echo_all", False)):
             self.info(f"{name}: {value}", "GMCP")
 
     def feed_msdp(self, name, value) -> None:
@@ -650,10 +805,20 @@ class Session:
         
         触发器的响应在该函数中进行处理。
         """
-        raw_line = self._line_buffer.decode(self.encoding, Settings.server["encoding_errors"])
+        # 仅处理已解码的内容，被截断的多字节字符仍保留在增量解码器中
+        raw_line = self._line_text
+        self._line_text = ""
         tri_line = self.getPlainText(raw_line, trim_newline = True)
-        self._line_buffer.clear()
 
+        self._process_line(raw_line, tri_line)
+
+    def _process_line(self, raw_line: str, tri_line: str) -> None:
+        """
+        对一行已解码的数据进行触发器处理并放到显示缓冲中。 **脚本中无需调用。**
+
+        :param raw_line: 原始行内容，含ANSI转义及换行符
+        :param tri_line: 去除ANSI转义及行尾换行符后的纯文本，用于触发器匹配
+        """
         # MXP SUPPORT
         # 目前只有回复功能支持，还没有对内容进行解析，待后续完善
         if Settings.server["MXP"]:
@@ -675,24 +840,47 @@ class Session:
         if not self._ignore:
             # 修改实现，形成列表时即排除非使能状态触发器，加快响应速度
 
-            all_tris = [tri for tri in self._triggers.values() if isinstance(tri, Trigger) and tri.enabled]
-            all_tris.sort(key = lambda tri: tri.priority)
+            # 使用缓存的触发器分发表，仅在触发器增删、使能或优先级变化后才重建
+            table = self._getTriggerTable()
+            all_tris = table
+            if self._tri_matcher is not None:
+                # 由自动机对本行扫描一次找出出现的所有字面字符串，仅保留可能匹配的触发器，并保持优先级顺序
+                found = self._tri_matcher.search(tri_line)
+                if found:
+                    indexes = list(self._tri_unindexed)
+                    for literal in found:
+                        indexes.extend(self._tri_literal_index[literal])
+                    indexes.sort()
+                    all_tris = [table[idx] for idx in indexes]
+                else:
+                    all_tris = [table[idx] for idx in self._tri_unindexed]
 
+            stale, matched = self._tri_matched, []
+            stop = None
             for tri in all_tris:
-                if tri.raw:
-                    state = tri.match(raw_line, docallback = True)
-                else:
-                    state = tri.match(tri_line, docallback = True)
+                line = raw_line if tri.raw else tri_line
+                # 预筛选：行中不包含触发器必然匹配的字面字符串时，直接跳过，不再执行正则匹配
+                prefilter = tri.prefilter
+                if (prefilter is not None) and (prefilter not in line):
+                    continue
+
+                state = tri.match(line, docallback = True)
 
                 if state and state.result == Trigger.SUCCESS:
+                    matched.append(tri)
                     if tri.oneShot:                     # 仅执行一次的trigger，匹配成功后，删除该Trigger（从触发器列表中移除）
                         self._triggers.pop(tri.id)
+                        self._group_index.discard(tri.group, tri)
+                        self._tri_table = None
 
                     if not tri.keepEval:                # 非持续匹配的trigger，匹配成功后停止检测后续Trigger
+                        stop = tri
                         break
                     else:
                         pass
 
+            self._tri_matched = self._resetSkipped(stale, matched, table, stop)
+
         # 将数据写入缓存添加到此处
         if len(self.display_line) > 0:
             self.writetobuffer(self.display_line)
@@ -794,7 +982,27 @@ class Session:
         :param data: 向传输中写入的数据, 应为 bytes, bytearray, memoryview 类型
         """
         if self._transport and not self._transport.is_closing():
+            compressor = self._mccp3_compressor
+            if compressor:
+                # MCCP3 压缩状态下，每次写入均同步刷新，以保证服务器可以立即解压缩
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
             self._transport.write(data)
+
+    def start_mccp3(self) -> None:
+        """
+        由协议对象调用，开始MCCP3客户端压缩，此后所有写入服务器的数据均被压缩。 **脚本中无需调用。**
+        """
+        self._mccp3_compressor = zlib.compressobj()
+
+    def stop_mccp3(self) -> None:
+        """
+        由协议对象调用，结束MCCP3客户端压缩。 **脚本中无需调用。**
+        """
+        compressor = self._mccp3_compressor
+        if compressor:
+            self._mccp3_compressor = None
+            if self._transport and not self._transport.is_closing():
+                self._transport.write(compressor.flush(zlib.Z_FINISH))
     
     def writeline(self, line: str) -> None:
         """
@@ -878,12 +1086,8 @@ class Session:
         """
         awts = []
         if group:
-            for tri in self._triggers.values():
-                if inc_subgroup and tri.group.startswith(group):
-                        awts.append(self.create_task(tri.triggered()))
-
-                elif tri.group == group:
-                    awts.append(self.create_task(tri.triggered()))
+            for tri in self._groupMembers(group, inc_subgroup, Trigger):
+                awts.append(self.create_task(tri.triggered()))
 
         elif tri_list:
             for tri in tri_list:
@@ -1092,37 +1296,55 @@ class Session:
         keepEval = True
         notHandle = True
 
-        # fix bugs, commands filter for enabled and sorted for priority
-        avai_cmds = [cmd for cmd in self._commands.values() if isinstance(cmd, Command) and cmd.enabled]
-        avai_cmds.sort(key = lambda cmd: cmd.priority)
+        # 使用缓存的命令分发表（已使能，按优先级排序），并按首单词索引仅选出可能匹配的命令
+        cmd_table = self._getCommandTable()
+        avai_cmds = self._selectByVerb(cmd_table, cmdtext)
+
+        cmd_matched, stop = [], None
+        for command in avai_cmds:
+            prefilter = command.prefilter
+            if (prefilter is not None) and (prefilter not in cmdtext):
+                continue
 
-        for command in self._commands.values():
             state = command.match(cmdtext)
             if state and state.result == Command.SUCCESS:
+                cmd_matched.append(command)
                 notHandle = False
                 # 命令的任务名称采用命令id，以便于后续查错
                 self.create_task(command.execute(cmdtext), name = "task-{0}".format(command.id))
 
                 if not command.keepEval:
                     keepEval = False
+                    stop = command
                     break
 
+        self._cmd_matched = self._resetSkipped(self._cmd_matched, cmd_matched, cmd_table[0], stop)
+
         # 若持续匹配，再判断是否是别名
         if keepEval:
-            # fix bugs, aliases filter for enabled and sorted for priority, and add oneShot, keepEval judge
-            avai_alis = [ali for ali in self._aliases.values() if isinstance(ali, Alias) and ali.enabled]
-            avai_alis.sort(key = lambda ali: ali.priority)
+            # 使用缓存的别名分发表（已使能，按优先级排序），并按首单词索引仅选出可能匹配的别名
+            ali_table = self._getAliasTable()
+            avai_alis = self._selectByVerb(ali_table, cmdtext)
  
+            ali_matched, stop = [], None
             for alias in avai_alis:               
+                prefilter = alias.prefilter
+                if (prefilter is not None) and (prefilter not in cmdtext):
+                    continue
+
                 state = alias.match(cmdtext)
                 if state and state.result == Alias.SUCCESS:
+                    ali_matched.append(alias)
                     notHandle = False
                     if alias.oneShot:
                         self.delAlias(alias.id)
 
                     if not alias.keepEval:
+                        stop = alias
                         break
 
+            self._ali_matched = self._resetSkipped(self._ali_matched, ali_matched, ali_table[0], stop)
+
         # 都前面都未被处理，则直接发送
         if notHandle:
             self.writeline(cmdtext)
@@ -1137,37 +1359,55 @@ class Session:
         keepEval = True
         notHandle = True
 
-        # fix bugs, commands filter for enabled and sorted for priority
-        avai_cmds = [cmd for cmd in self._commands.values() if isinstance(cmd, Command) and cmd.enabled]
-        avai_cmds.sort(key = lambda cmd: cmd.priority)
+        # 使用缓存的命令分发表（已使能，按优先级排序），并按首单词索引仅选出可能匹配的命令
+        cmd_table = self._getCommandTable()
+        avai_cmds = self._selectByVerb(cmd_table, cmdtext)
 
+        cmd_matched, stop = [], None
         for command in avai_cmds:
+            prefilter = command.prefilter
+            if (prefilter is not None) and (prefilter not in cmdtext):
+                continue
+
             state = command.match(cmdtext)
             if state and state.result == Command.SUCCESS:
+                cmd_matched.append(command)
                 # 命令的任务名称采用命令id，以便于后续查错
                 result = await self.create_task(command.execute(cmdtext), name = "task-{0}".format(command.id))
                 notHandle = False
                 if not command.keepEval:
                     keepEval = False
+                    stop = command
                     break
 
+        self._cmd_matched = self._resetSkipped(self._cmd_matched, cmd_matched, cmd_table[0], stop)
+
         # 再判断是否是别名
         if keepEval:
 
-            # fix bugs, aliases filter for enabled and sorted for priority, and add oneShot, keepEval judge
-            avai_alis = [ali for ali in self._aliases.values() if isinstance(ali, Alias) and ali.enabled]
-            avai_alis.sort(key = lambda ali: ali.priority)
+            # 使用缓存的别名分发表（已使能，按优先级排序），并按首单词索引仅选出可能匹配的别名
+            ali_table = self._getAliasTable()
+            avai_alis = self._selectByVerb(ali_table, cmdtext)
  
+            ali_matched, stop = [], None
             for alias in avai_alis:               
+                prefilter = alias.prefilter
+                if (prefilter is not None) and (prefilter not in cmdtext):
+                    continue
+
                 state = alias.match(cmdtext)
                 if state and state.result == Alias.SUCCESS:
+                    ali_matched.append(alias)
                     notHandle = False
                     if alias.oneShot:
                         self.delAlias(alias.id)
 
                     if not alias.keepEval:
+                        stop = alias
                         break
 
+            self._ali_matched = self._resetSkipped(self._ali_matched, ali_matched, ali_table[0], stop)
+
         # 若均为处理则是普通命令，直接发送
         if notHandle:
             self.writeline(cmdtext)
@@ -1264,6 +1504,136 @@ class Session:
         """
         return "{0}_{1}".format(prefix, self.getUniqueNumber())
 
+    def _invalidateDispatch(self, obj = None):
+        """
+        令缓存的分发表失效，下次使用时重建。由对象增删、使能状态或优先级变化时调用。 **脚本中无需调用。**
+
+        :param obj: 发生变化的对象，为None时所有分发表均失效
+        """
+        if (obj is None) or isinstance(obj, Trigger):
+            self._tri_table = None
+        if (obj is None) or isinstance(obj, Alias):
+            self._ali_table = None
+        if (obj is None) or isinstance(obj, Command):
+            self._cmd_table = None
+
+    def _getTriggerTable(self) -> List[Trigger]:
+        "获取缓存的触发器分发表，其中仅包含已使能的触发器，并按优先级排序。分发表失效时将重建。"
+        table = self._tri_table
+        if table is None:
+            table = [tri for tri in self._triggers.values() if isinstance(tri, Trigger) and tri.enabled]
+            table.sort(key = lambda tri: tri.priority)
+            self._tri_table = table
+            self._tri_generation += 1
+
+            # 预筛选字面字符串（含非正则触发器的匹配模式）较多时，构建多模式匹配自动机
+            # _tri_literal_index 为字面字符串到分发表序号的索引，_tri_unindexed 为无法索引（无字面字符串或匹配原始行）的触发器序号
+            literal_index, unindexed = dict(), list()
+            for idx, tri in enumerate(table):
+                if tri.prefilter and not tri.raw:
+                    literal_index.setdefault(tri.prefilter, []).append(idx)
+                else:
+                    unindexed.append(idx)
+
+            if len(literal_index) >= self.AC_MIN_PATTERNS:
+                self._tri_matcher = AhoCorasick(literal_index.keys())
+                self._tri_literal_index = literal_index
+                self._tri_unindexed = unindexed
+            else:
+                self._tri_matcher = None
+
+        return table
+
+    def _resetSkipped(self, stale: list, matched: list, table: list, stop) -> list:
+        """
+        复位被跳过对象的状态。预筛选、自动机及首单词索引跳过的对象不调用 match，其 state 仍为之前匹配成功的结果。
+        为与逐个匹配时的结果保持一致，将此前匹配成功、本次在停止位置之前被跳过的对象的状态置为 NOTSET。
+
+        :param stale: 上次匹配成功的对象
+        :param matched: 本次匹配成功的对象
+        :param table: 本次使用的分发表（已使能、按优先级排序）
+        :param stop: 本次匹配成功并停止后续匹配的对象，为None时表示所有对象均参与了匹配
+        :return: 当前状态为匹配成功的对象列表，供下次调用时使用
+        """
+        if not stale:
+            return matched
+
+        end = table.index(stop) if (stop is not None) and (stop in table) else len(table)
+        result = list(matched)
+        for obj in stale:
+            if (obj in matched) or (obj.state.result != obj.SUCCESS):
+                continue
+
+            try:
+                pos = table.index(obj)
+            except ValueError:
+                # 已禁用或删除的对象本不参与匹配，状态保持不变
+                continue
+
+            if pos < end:
+                obj.reset_state()
+            else:
+                result.append(obj)
+
+        return result
+
+    def _buildVerbTable(self, objs: list):
+        """
+        为已使能并按优先级排序的别名或命令列表建立首单词索引。
+
+        :return: 元组 (objs, verb_index, unindexed_objs, unindexed)。verb_index 为首单词到列表序号的索引，unindexed_objs 与 unindexed 为首单词不确定的对象及其序号
+        """
+        verb_index, unindexed = dict(), list()
+        for idx, obj in enumerate(objs):
+            if obj.verb is None:
+                unindexed.append(idx)
+            else:
+                verb_index.setdefault(obj.verb, []).append(idx)
+
+        return objs, verb_index, [objs[idx] for idx in unindexed], unindexed
+
+    def _selectByVerb(self, table, cmdtext: str) -> list:
+        "根据命令的首个单词，从分发表中选出可能匹配的别名或命令，保持优先级顺序"
+        objs, verb_index, unindexed_objs, unindexed = table
+        if not verb_index:
+            return objs
+
+        indexes = verb_index.get(Session.VERB_REGX.match(cmdtext).group())
+        if not indexes:
+            return unindexed_objs
+
+        indexes = sorted(unindexed + indexes)
+        return [objs[idx] for idx in indexes]
+
+    def _getAliasTable(self):
+        "获取缓存的别名分发表（已使能、按优先级排序）及其首单词索引，失效时将重建"
+        table = self._ali_table
+        if table is None:
+            objs = [ali for ali in self._aliases.values() if isinstance(ali, Alias) and ali.enabled]
+            objs.sort(key = lambda ali: ali.priority)
+            table = self._ali_table = self._buildVerbTable(objs)
+
+        return table
+
+    def _getCommandTable(self):
+        "获取缓存的命令分发表（已使能、按优先级排序）及其首单词索引，失效时将重建"
+        table = self._cmd_table
+        if table is None:
+            objs = [cmd for cmd in self._commands.values() if isinstance(cmd, Command) and cmd.enabled]
+            objs.sort(key = lambda cmd: cmd.priority)
+            table = self._cmd_table = self._buildVerbTable(objs)
+
+        return table
+
+    @property
+    def trigger_generation(self) -> int:
+        """
+        只读属性，触发器分发表的重建次数。
+
+        触发器分发表在触发器增删、使能状态或优先级变化后失效，并在下一行数据处理时重建，每次重建该值加1。脚本可以据此判断分发表是否已被重建。
+        """
+        return self._tri_generation
+
     def enableGroup(self, group: str, enabled = True, subgroup = True, types: Union[Type, Union[Tuple, List]] = (Alias, Trigger, Command, Timer, GMCPTrigger)):
         """
         使能或禁用Group中所有对象, 返回组内各对象个数。
@@ -1279,34 +1649,29 @@ class Session:
         """
         counts = [0, 0, 0, 0, 0]
         if (Alias == types) or (isinstance(types, (list, tuple)) and (Alias in types)):
-            for ali in self._aliases.values():
-                if isinstance(ali, Alias) and ((ali.group == group) or (subgroup and ali.group.startswith(group + "."))):
-                    ali.enabled = enabled
-                    counts[0] += 1
+            for ali in self._groupMembers(group, subgroup, Alias):
+                ali.enabled = enabled
+                counts[0] += 1
 
         if (Trigger == types) or (isinstance(types, (list, tuple)) and (Trigger in types)):
-            for tri in self._triggers.values():
-                if isinstance(tri, Trigger) and ((tri.group == group) or (subgroup and tri.group.startswith(group + "."))):
-                    tri.enabled = enabled
-                    counts[1] += 1
+            for tri in self._groupMembers(group, subgroup, Trigger):
+                tri.enabled = enabled
+                counts[1] += 1
 
         if (Command == types) or (isinstance(types, (list, tuple)) and (Command in types)):
-            for cmd in self._commands.values():
-                if isinstance(cmd, Command) and ((cmd.group == group) or (subgroup and cmd.group.startswith(group + "."))):
-                    cmd.enabled = enabled
-                    counts[2] += 1
+            for cmd in self._groupMembers(group, subgroup, Command):
+                cmd.enabled = enabled
+                counts[2] += 1
 
         if (Timer == types) or (isinstance(types, (list, tuple)) and (Timer in types)):
-            for tmr in self._timers.values():
-                if isinstance(tmr, Timer) and ((tmr.group == group) or (subgroup and tmr.group.startswith(group + "."))):
-                    tmr.enabled = enabled
-                    counts[3] += 1
+            for tmr in self._groupMembers(group, subgroup, Timer):
+                tmr.enabled = enabled
+                counts[3] += 1
 
         if (GMCPTrigger == types) or (isinstance(types, (list, tuple)) and (GMCPTrigger in types)):
-            for gmcp in self._gmcp.values():
-                if isinstance(gmcp, GMCPTrigger) and ((gmcp.group == group) or (subgroup and gmcp.group.startswith(group + "."))):
-                    gmcp.enabled = enabled       
-                    counts[4] += 1 
+            for gmcp in self._groupMembers(group, subgroup, GMCPTrigger):
+                gmcp.enabled = enabled
+                counts[4] += 1
 
         return counts
 
@@ -1324,32 +1689,69 @@ class Session:
         """
         counts = [0, 0, 0, 0, 0]
         if (Alias == types) or (isinstance(types, (list, tuple)) and (Alias in types)):
-            ali_ids = [ali.id for ali in self._aliases.values() if isinstance(ali, Alias) and ((ali.group == group) or (subgroup and ali.group.startswith(group + ".")))]
+            ali_ids = [ali.id for ali in self._groupMembers(group, subgroup, Alias)]
             self.delAliases(ali_ids)
             counts[0] = len(ali_ids)
 
         if (Trigger == types) or (isinstance(types, (list, tuple)) and (Trigger in types)):
-            tri_ids = [tri.id for tri in self._triggers.values() if isinstance(tri, Trigger) and ((tri.group == group) or (subgroup and tri.group.startswith(group + ".")))]
+            tri_ids = [tri.id for tri in self._groupMembers(group, subgroup, Trigger)]
             self.delTriggers(tri_ids)
             counts[1] = len(tri_ids)
 
         if (Command == types) or (isinstance(types, (list, tuple)) and (Command in types)):
-            cmd_ids = [cmd.id for cmd in self._commands.values() if isinstance(cmd, Command) and ((cmd.group == group) or (subgroup and cmd.group.startswith(group + ".")))]
+            cmd_ids = [cmd.id for cmd in self._groupMembers(group, subgroup, Command)]
             self.delCommands(cmd_ids)
             counts[2] = len(cmd_ids)
 
         if (Timer == types) or (isinstance(types, (list, tuple)) and (Timer in types)):
-            tmr_ids = [tmr.id for tmr in self._timers.values() if isinstance(tmr, Timer) and ((tmr.group == group) or (subgroup and tmr.group.startswith(group + ".")))]
+            tmr_ids = [tmr.id for tmr in self._groupMembers(group, subgroup, Timer)]
             self.delTimers(tmr_ids)
             counts[3] = len(tmr_ids)
 
         if (GMCPTrigger == types) or (isinstance(types, (list, tuple)) and (GMCPTrigger in types)):
-            gmcp_ids = [gmcp.id for gmcp in self._gmcp.values() if isinstance(gmcp, GMCPTrigger) and ((gmcp.group == group) or (subgroup and gmcp.group.startswith(group + ".")))]
+            gmcp_ids = [gmcp.id for gmcp in self._groupMembers(group, subgroup, GMCPTrigger)]
             self.delGMCPs(gmcp_ids)
             counts[4] = len(gmcp_ids)
 
         return counts
 
+    def _typeDict(self, cls: type) -> Optional[dict]:
+        "返回保存 cls 类型对象的字典，判断顺序与 _addObject 一致"
+        if issubclass(cls, Alias):
+            return self._aliases
+        elif issubclass(cls, Command):
+            return self._commands
+        elif issubclass(cls, Trigger):
+            return self._triggers
+        elif issubclass(cls, Timer):
+            return self._timers
+        elif issubclass(cls, GMCPTrigger):
+            return self._gmcp
+        return None
+
+    def _groupMembers(self, group: str, subgroup: bool, cls: type) -> List[BaseObject]:
+        """
+        通过组索引获取组内（及子组内）指定类型的对象，按加入顺序返回。 **脚本中无需调用。**
+
+        对象可能未经 delObject 直接从会话字典中移除（如单次触发的触发器），或被相同 id 的新对象替换，
+        因此仅返回仍在会话中登记的对象，其余对象在此时从索引中清除。
+        """
+        result = []
+        for obj in self._group_index.members(group, subgroup):
+            objs = self._typeDict(type(obj))
+            if (objs is None) or (objs.get(obj.id) is not obj):
+                self._group_index.discard(obj.group, obj)
+            elif isinstance(obj, cls):
+                result.append(obj)
+        return result
+
+    def _regroupObject(self, obj: BaseObject, old: str):
+        "对象的 group 属性变化时，更新组索引。 **脚本中无需调用。**"
+        self._group_index.discard(old, obj)
+        objs = self._typeDict(type(obj))
+        if (objs is not None) and (objs.get(obj.id) is obj):
+            self._group_index.add(obj.group, obj)
+
     def _addObjects(self, objs: Union[Union[List[BaseObject], Tuple[BaseObject]], Dict[str, BaseObject]]):
         if isinstance(objs, list) or isinstance(objs, tuple):
             for item in objs:
@@ -1364,16 +1766,33 @@ class Session:
                     self._addObject(item)
 
     def _addObject(self, obj: BaseObject):
+        self._invalidateDispatch(obj)
         if isinstance(obj, Alias):
-            self._aliases[obj.id] = obj
+            objs = self._aliases
         elif isinstance(obj, Command):
-            self._commands[obj.id] = obj
+            objs = self._commands
         elif isinstance(obj, Trigger):
-            self._triggers[obj.id] = obj
+            objs = self._triggers
         elif isinstance(obj, Timer):
-            self._timers[obj.id] = obj
+            objs = self._timers
         elif isinstance(obj, GMCPTrigger):
-            self._gmcp[obj.id] = obj
+            objs = self._gmcp
+        else:
+            return
+
+        # 同id的原有对象被替换，将其从组索引中移除
+        old = objs.get(obj.id, None)
+        if old is not obj:
+            if isinstance(old, BaseObject):
+                self._group_index.discard(old.group, old)
+
+            if isinstance(obj, GMCPTrigger):
+                self._gmcp_state.watch(obj.id)
+                if isinstance(old, GMCPTrigger):
+                    self._gmcp_state.unwatch(old.id)
+
+        objs[obj.id] = obj
+        self._group_index.add(obj.group, obj)
 
     def addObject(self, obj: BaseObject):
         """
@@ -1396,6 +1815,12 @@ class Session:
         self._addObjects(objs)
 
     def _delObject(self, id, cls: type):
+        self._invalidateDispatch()
+        objs = self._typeDict(cls)
+        obj = objs.get(id, None) if objs is not None else None
+        if isinstance(obj, BaseObject):
+            self._group_index.discard(obj.group, obj)
+
         if cls == Alias:
             obj = self._aliases.pop(id, None)
             if isinstance(obj, BaseObject):
@@ -1419,6 +1844,7 @@ class Session:
             obj = self._gmcp.pop(id, None)
             if isinstance(obj, BaseObject):
                 obj.reset()
+                self._gmcp_state.unwatch(obj.id)
 
     def _delObjects(self, ids: Iterable, cls: type):
         "删除多个指定元素"
@@ -1454,6 +1880,8 @@ class Session:
         """
         if isinstance(obj, BaseObject):
             obj.reset()
+            self._invalidateDispatch(obj)
+            self._group_index.discard(obj.group, obj)
 
         if isinstance(obj, Alias):
             self._aliases.pop(obj.id, None)
@@ -1468,7 +1896,8 @@ class Session:
             obj.enabled = False
             self._timers.pop(obj.id, None)
         elif isinstance(obj, GMCPTrigger):
-            self._gmcp.pop(obj.id, None)
+            if isinstance(self._gmcp.pop(obj.id, None), GMCPTrigger):
+                self._gmcp_state.unwatch(obj.id)
 
         elif isinstance(obj, (list, tuple, dict)):
             self.delObjects(obj)
@@ -1784,6 +2213,78 @@ class Session:
         assert isinstance(name, str), Settings.gettext("msg_shall_be_string", "name")
         self._variables[name] = value
 
+    @staticmethod
+    def _isPersistentVariable(name: str) -> bool:
+        "变量是否需要保存。系统变量 %line, %raw, %copy 及以下划线开头的临时变量不保存"
+        return not (name.startswith("_") or name in ("%line", "%raw", "%copy"))
+
+    def saveVariables(self, full: bool = True, quiet: bool = False):
+        """
+        保存会话变量（系统变量和临时变量除外）到变量存储 variable_store。序列化在调用时完成，写入在存储的后台线程中进行。
+
+        :param full: 为True时（默认）进行完整保存，与已保存内容比较后写入所有有变化的变量，并删除已不存在的变量。
+            为False时仅保存自上次保存以来通过赋值、update、del 等方式修改或删除的变量，代价只与变化的变量个数有关。
+        :param quiet: 为True时，保存成功后不显示提示信息
+        :return: 写入完成的 concurrent.futures.Future。增量保存时若没有需要保存的变量，返回None
+        """
+        store = self.variable_store
+        variables = self._variables
+        changes = variables.take_changes()
+        self._last_var_save = time.monotonic()
+
+        try:
+            if full:
+                saved = {name: value for name, value in variables.items() if self._isPersistentVariable(name)}
+                future = store.save(saved, replace = True)
+            else:
+                changed, deleted = changes
+                saved = {name: variables[name] for name in changed if (name in variables) and self._isPersistentVariable(name)}
+                deleted = [name for name in deleted if self._isPersistentVariable(name)]
+                if not (saved or deleted):
+                    return None
+                future = store.save(saved, deleted)
+        except Exception:
+            # 序列化失败时放回变化记录，下次保存时重试
+            variables.restore_changes(*changes)
+            raise
+
+        loop = self.loop
+
+        def done(future):
+            if future.exception():
+                msg = Settings.gettext("msg_var_save_fail", store.filename, future.exception())
+                func = self.warning
+            elif not quiet:
+                msg = Settings.gettext("msg_variables_saved", store.filename)
+                func = self.info
+            else:
+                return
+
+            try:
+                if future.exception():
+                    # 写入失败时在事件循环线程中放回变化记录
+                    loop.call_soon_threadsafe(variables.restore_changes, *changes)
+                loop.call_soon_threadsafe(func, msg)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+        future.add_done_callback(done)
+        return future
+
+    def _autosaveVariables(self):
+        "由应用的系统定时器每秒调用。变化的变量个数达到 var_autosave_size，或距上次保存超过 var_autosave_interval 秒时，增量保存变量"
+        interval = Settings.client.get("var_autosave_interval", 60)
+        if (not Settings.client["var_autosave"]) or (not interval) or (interval <= 0):
+            return
+
+        count = self._variables.changes_count()
+        if count and ((count >= Settings.client.get("var_autosave_size", 500)) or (time.monotonic() - self._last_var_save >= interval)):
+            try:
+                self.saveVariables(full = False, quiet = True)
+            except Exception as e:
+                self.warning(Settings.gettext("msg_var_save_fail", self.variable_store.filename, e))
+
     def getVariable(self, name: str, default = None):
         """
         获取一个变量的值。可以使用vars快捷点访问器实现类似效果，但vars访问时，默认值总为None。
@@ -2093,19 +2594,31 @@ class Session:
         self.disconnect()
 
     def getMaxLength(self, iter: Iterable):
-        return wcswidth(sorted(iter, key = lambda s: wcswidth(s), reverse = True)[0])
+        return str_width(sorted(iter, key = lambda s: str_width(s), reverse = True)[0])
 
     def splitByPrintableWidth(self, str, printable_length):
         strlist = []
         startindex = 0
         remain = False
-        split_str = ""
+        # 逐字符累加显示宽度，不再对每个前缀重新计算。与 wcswidth 一致，含有不可打印字符的片段宽度视为 -1
+        # 含有 emoji 序列等无法逐字符累加的字符时，仍对每个片段整体计算宽度
+        sequence = needs_wcswidth(str)
+        width = 0
         for idx in range(1, len(str)):
             remain = True
-            split_str = str[startindex:idx]
-            if wcswidth(split_str) >= printable_length:
-                strlist.append(split_str)
+            if sequence:
+                width = str_width(str[startindex:idx])
+            else:
+                ch_width = char_width(str[idx - 1])
+                if ch_width < 0 or width < 0:
+                    width = -1
+                else:
+                    width += ch_width
+
+            if width >= printable_length:
+                strlist.append(str[startindex:idx])
                 startindex = idx
+                width = 0
                 remain = False
 
         if remain:
@@ -2162,7 +2675,7 @@ class Session:
             value_dis = DStr(vars_simple[key].__repr__())
             var_display = "{0} = {1}".format(name, value_dis)
             
-            if (cursor + wcswidth(var_display) > totalWidth) or (var_count >= vars_per_line):
+            if (cursor + str_width(var_display) > totalWidth) or (var_count >= vars_per_line):
                 display_lines.append(line)
 
                 line = " " * left_margin
@@ -2170,7 +2683,7 @@ class Session:
                 var_count = 0
 
             line += var_display
-            cursor += wcswidth(var_display)
+            cursor += str_width(var_display)
             var_count += 1
 
             # 下一处判定
@@ -2193,7 +2706,7 @@ class Session:
             value_dis = vars_complex[key].__repr__()
             allow_len = totalWidth - left_margin - KEY_WIDTH - 3 - right_margin
             line = "{0}{1} = ".format(" " * left_margin, name.rjust(KEY_WIDTH))
-            if wcswidth(value_dis) > allow_len:
+            if str_width(value_dis) > allow_len:
                 value = vars_complex[key]
                 if isinstance(value, dict):
                     max_len = self.getMaxLength(value.keys())
@@ -2203,7 +2716,7 @@ class Session:
                     for k, v in value.items():
                         subvalue_dis = "{},".format(v.__repr__())
                         allow_len_subvalue = allow_len - max_len - 4
-                        if wcswidth(subvalue_dis) > allow_len_subvalue:
+                        if str_width(subvalue_dis) > allow_len_subvalue:
                             subvalue_lines = self.splitByPrintableWidth(subvalue_dis, allow_len_subvalue)
                             line += "{0}: ".format(DStr(k).ljust(max_len))
                             for subline in subvalue_lines:
@@ -2379,11 +2892,11 @@ class Session:
                 if arg.startswith(">"):
                     arg = arg[1:]
                     title = f"  {type.__name__.upper()} LIST IN GROUP <{arg.upper()}> AND ITS SUBGROUPS IN SESSION {self.name}  "
-                    display_objs = {obj.id: obj for obj in objs.values() if (obj.group == arg) or obj.group.startswith(f"{arg}.")}
+                    display_objs = {obj.id: obj for obj in self._groupMembers(arg, True, type)}
                 elif arg.startswith("="):
                     arg = arg[1:]
                     title = f"  {type.__name__.upper()} LIST IN GROUP <{arg.upper()}> IN SESSION {self.name}  "
-                    display_objs = {obj.id: obj for obj in objs.values() if (obj.group == arg)}
+                    display_objs = {obj.id: obj for obj in self._groupMembers(arg, False, type)}
                 else:
                     title = f"  {type.__name__.upper()} LIST OF ID <{arg.upper()}> IN SESSION {self.name}  "
                     display_objs = {obj.id: obj for obj in objs.values() if (obj.id == arg)}
@@ -2521,7 +3034,7 @@ class Session:
         该函数不应该在代码中直接调用。
 
         使用:
-            - #ti: 显示本会话所有定时器
+            - #ti: 显示本会话所有定时器，运行中的定时器同时显示其下次到期时间（next）
             - #ti {ti_id}: 显示本会话中id为{ti_id}的定时器信息
             - #ti {ti_id} {on/off/del}: 使能/禁用/删除本会话中id为{ti_id}的定时器
             - #ti [>=]{groupname}: 显示本会话中组名为{groupname}（当为=时）及其子组（当为>时）的所有定时器
@@ -2874,6 +3387,8 @@ class Session:
             for tm in self._timers.values():
                 if isinstance(tm, Timer):
                     tm.reset()
+
+            self._timer_scheduler.clear()
             
             for tri in self._triggers.values():
                 if isinstance(tri, Trigger):
@@ -2912,9 +3427,12 @@ class Session:
         self._commands.clear()
         self._triggers.clear()
         self._gmcp.clear()
+        self._gmcp_state.clear_subscriptions()
         self._aliases.clear()
+        self._group_index.clear()
         self._variables.clear()
         self._tasks.clear()
+        self._invalidateDispatch()
 
 
     def load_module(self, module_names):
@@ -3207,33 +3725,17 @@ class Session:
             - #save: 保存当前会话变量
 
         注意:
-            1. 文件保存在当前目录下，文件名为 {会话名}.mud
+            1. 文件保存在 save 子目录下，文件名为 {会话名}.db 。老版本保存的 {会话名}.mud 文件会在会话创建时自动导入
             2. 变量保存使用了python的pickle模块，因此所有变量都应是类型自省的
             3. 虽然变量支持所有的Python类型，但是仍然建议仅在变量中使用可以序列化的类型。
             4. namedtuple不建议使用，因为加载后在类型匹配比较时会失败，不认为两个相同定义的namedtuple是同一种类型。
+            5. var_autosave 打开时，有变化的变量还会每隔 var_autosave_interval 秒自动增量保存。#save 进行完整保存，可以保存直接修改了值内部内容的变量
         
         相关命令:
             - #variable
         '''
 
-        muddir = Path.cwd().joinpath('save')
-        if not muddir.exists() or not muddir.is_dir():
-            muddir.mkdir()
-
-        file = muddir.joinpath(f"{self.name}.mud")
-
-        with open(file, "wb") as fp:
-            saved = dict()
-            saved.update(self._variables)
-            keys = list(saved.keys())
-            for key in keys:
-                if key.startswith("_"):
-                    saved.pop(key)
-            saved.pop("%line", None)
-            saved.pop("%raw", None)
-            saved.pop("%copy", None)
-            pickle.dump(saved, fp)
-            self.info(Settings.gettext("msg_variables_saved", file))
+        self.saveVariables()
 
     def handle_clear(self, code: CodeLine, *args, **kwargs):
         '''
@@ -3246,6 +3748,89 @@ class Session:
 
         self.buffer.clear()
 
+    def handle_buffer(self, code: CodeLine, *args, **kwargs):
+        '''
+        嵌入命令 #buffer 的执行函数，显示各会话缓冲区的存储方式、行数与内存占用情况。
+        该函数不应该在代码中直接调用。
+
+        使用:
+            - #buffer: 显示本应用所有会话缓冲区的信息
+
+        说明:
+            - 缓冲区存储方式由 Settings.client["buffer_compact"] 确定，可用于比较两种存储方式的内存占用情况
+            - 内存占用为估算值，仅包含缓冲区内容本身
+
+        相关命令:
+            - #clear
+        '''
+
+        self.info(Settings.gettext("msg_buffer_title"))
+        for session in self.application.sessions.values():
+            b = session.buffer
+            self.info(Settings.gettext("msg_buffer_info",
+                                       session.name,
+                                       Settings.gettext("buffer_compact") if isinstance(b, CompactSessionBuffer) else Settings.gettext("buffer_ring"),
+                                       b.lineCount,
+                                       b.max_buffered_lines if b.max_buffered_lines > 0 else Settings.gettext("unlimited"),
+                                       b.first_lineno,
+                                       b.memory_usage() / 1024 / 1024))
+
+    async def handle_find(self, code: CodeLine, *args, **kwargs):
+        '''
+        嵌入命令 #find / #grep 的执行函数，在当前会话缓冲区中搜索内容，并使分屏显示跳转到最近的匹配行。
+        该函数不应该在代码中直接调用。
+
+        使用:
+            - #find {pattern}: 搜索与正则表达式 {pattern} 匹配的行，列出最近的20个匹配行，并分屏显示最近的匹配行
+            - #find -n {count} {pattern}: 同上，列出最近的 {count} 个匹配行
+
+        示例:
+            - ``#find 任务`` : 搜索包含“任务”的行
+            - ``#grep -n 5 ^【闲聊】`` : 列出最近5条以“【闲聊】”开头的行
+
+        说明:
+            - 按去除ANSI标记后的纯文本匹配，搜索在后台线程中进行
+            - 行号为会话开始以来的绝对行号
+            - 跳转后可使用 PageUp/PageDown 翻页，或使用 Ctrl+Z 取消分屏
+            - 在记录页中也可以使用该命令搜索当前显示的记录文件
+
+        相关命令:
+            - #log
+            - #buffer
+        '''
+
+        args = list(code.code[2:]) if isinstance(code, CodeLine) else []
+        limit = 20
+        if len(args) >= 2 and args[0] == "-n" and args[1].isdigit():
+            limit = max(1, int(args[1]))
+            args = args[2:]
+
+        if len(args) == 0:
+            self.warning(Settings.gettext("msg_find_usage"))
+            return
+
+        pattern = " ".join(args)
+        try:
+            regex = re.compile(pattern)
+        except re.error as e:
+            self.error(Settings.gettext("msg_find_invalid", pattern, e))
+            return
+
+        buffer = self.buffer
+        hits = await self.search_buffer(regex, limit)
+
+        # 记录结果输出所在的行，之后的搜索将跳过这些行
+        start = buffer.next_lineno
+        if len(hits) == 0:
+            self.info(Settings.gettext("msg_find_nohit", pattern))
+        else:
+            buffer.jump_to(hits[0][0])
+            self.info(Settings.gettext("msg_find_title", pattern, len(hits)))
+            for lineno, line in hits:
+                self.info(f"  {lineno:>8}: {line}")
+
+        self._find_output.append((start, buffer.next_lineno))
+
     @exception
     def handle_test(self, code: CodeLine, *args, **kwargs):
         '''
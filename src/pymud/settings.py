@@ -37,7 +37,7 @@ class Settings:
         "GMCP"              : True,                 # Generic Mud Communication Protocol
         "MSDP"              : True,                 # Mud Server Data Protocol
         "MSSP"              : True,                 # Mud Server Status Protocol
-        "MCCP2"             : False,                # Mud Compress Communication Protocol V2
+        "MCCP2"             : True,                 # Mud Compress Communication Protocol V2
         "MCCP3"             : False,                # Mud Compress Communication Protocol V3
         "MSP"               : False,                # Mud 音频协议
         "MXP"               : False,                # Mud 扩展协议
@@ -55,6 +55,7 @@ class Settings:
     client = {
         "cursor"            : "BLINKING_BEAM",      # 光标形状
         "buffer_lines"      : 5000,                 # 保留缓冲行数
+        "buffer_compact"    : False,                # 缓冲区使用紧凑存储（以UTF-8字节保存各行，减少内存占用）
         
         "naws_width"        : 150,                  # 客户端NAWS宽度
         "naws_height"       : 40,                   # 客户端NAWS高度
@@ -70,6 +71,9 @@ class Settings:
         "reconnect_wait"    : 15,                   # 自动重连等待的时间（秒数）
         "var_autosave"      : True,                 # 断开时自动保存会话变量
         "var_autoload"      : True,                 # 初始化时自动加载会话变量
+        "var_autosave_interval" : 60,               # 定时自动保存有变化的会话变量的间隔（秒），0表示不定时保存
+        "var_autosave_size" : 500,                  # 有变化的会话变量达到该个数时立即自动保存
+        "gmcp_echo_all"     : False,                # 未处理的GMCP数据是否全部打印，为False时每个name仅打印第一次收到的数据
 
         "remain_last_input" : False,
         "echo_input"        : False,
@@ -82,6 +86,10 @@ class Settings:
         "status_height"     : 6,                    # 下侧状态栏的高度
 
         "split_ratio"       : 0.5,                  # 分屏比例
+        "max_fps"           : 30,                   # 界面最大刷新频率（次/秒），0表示不限制
+
+        "log_flush_interval": 0.2,                  # 记录器刷新文件的最长间隔（秒）
+        "log_flush_size"    : 65536,                # 记录器待刷新内容达到该字符数时立即刷新文件
     }
     "客户端的默认配置信息"
 
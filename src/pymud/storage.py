@@ -0,0 +1,129 @@
+import pickle, sqlite3, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+
+class VariableStore:
+    """
+    PyMUD 会话变量的持久化存储。变量保存在 sqlite 数据库（WAL 模式）中，每个变量一行，值使用 pickle 序列化。
+
+    - 每次保存仅写入内容有变化的变量及被删除的变量，各次保存均在一个事务中完成，进程中途退出时不会损坏已保存的数据
+    - 数据库操作均在本存储专用的后台线程中按提交顺序执行，不阻塞事件循环。序列化在调用线程中完成，保存的是调用时刻的变量值
+    - 兼容老版本的整体 pickle 文件（{会话名}.mud），可使用 import_pickle 导入
+
+    :param filename: 数据库文件名
+    """
+
+    SCHEMA = "CREATE TABLE IF NOT EXISTS variables (name TEXT PRIMARY KEY, value BLOB NOT NULL)"
+
+    def __init__(self, filename: Union[str, Path]):
+        self._filename = str(filename)
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "pymud-varstore")
+        self._digests: Dict[str, bytes] = {}        # 已保存变量值的摘要，用于判断变量是否有变化，仅在后台线程中访问
+        self._lock = threading.Lock()
+
+    @property
+    def filename(self) -> str:
+        "数据库文件名，只读"
+        return self._filename
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        "序列化变量值"
+        return pickle.dumps(value)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._filename, check_same_thread = False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute(self.SCHEMA)
+            self._conn.commit()
+
+            # 未读取的已保存变量摘要记为空，保存时总会重新写入
+            for (name, ) in self._conn.execute("SELECT name FROM variables"):
+                self._digests.setdefault(name, b"")
+        return self._conn
+
+    def _submit(self, func, *args) -> Future:
+        with self._lock:
+            return self._executor.submit(func, *args)
+
+    def _load(self) -> Dict[str, Any]:
+        result = {}
+        for name, blob in self._connect().execute("SELECT name, value FROM variables"):
+            result[name] = pickle.loads(blob)
+            self._digests[name] = hashlib.blake2b(blob, digest_size = 16).digest()
+        return result
+
+    def load(self) -> Dict[str, Any]:
+        "读取所有已保存的变量。该函数等待后台线程读取完成后返回"
+        return self._submit(self._load).result()
+
+    def _write(self, blobs: Dict[str, bytes], deleted: Iterable[str], replace: bool) -> int:
+        conn = self._connect()
+        digests = self._digests
+        changed = []
+        for name, blob in blobs.items():
+            digest = hashlib.blake2b(blob, digest_size = 16).digest()
+            if digests.get(name) != digest:
+                changed.append((name, blob, digest))
+
+        removed = set(name for name in deleted if name in digests)
+        if replace:
+            removed.update(name for name in digests.keys() if name not in blobs)
+
+        if changed or removed:
+            with conn:
+                if changed:
+                    conn.executemany("INSERT OR REPLACE INTO variables (name, value) VALUES (?, ?)", [(name, blob) for name, blob, _ in changed])
+                if removed:
+                    conn.executemany("DELETE FROM variables WHERE name = ?", [(name, ) for name in removed])
+
+            for name, _, digest in changed:
+                digests[name] = digest
+            for name in removed:
+                digests.pop(name, None)
+
+        return len(changed) + len(removed)
+
+    def save(self, variables: Dict[str, Any], deleted: Iterable[str] = (), replace: bool = False) -> Future:
+        """
+        保存变量。变量值在调用时序列化，写入在后台线程中进行。
+
+        :param variables: 要保存的变量字典，其中与已保存内容相同的变量不会重复写入
+        :param deleted: 要从存储中删除的变量名
+        :param replace: 为True时，variables 为全部变量，存储中不在 variables 内的变量均被删除
+        :return: 写入完成的 Future，其结果为实际写入（含删除）的变量个数
+        """
+        blobs = {name: self.dumps(value) for name, value in variables.items()}
+        return self._submit(self._write, blobs, tuple(deleted), replace)
+
+    def import_pickle(self, file: Union[str, Path]) -> Dict[str, Any]:
+        """
+        导入老版本 #save 保存的整体 pickle 文件，导入的变量同时写入本存储。
+
+        :param file: pickle 文件名
+        :return: 导入的变量字典
+        """
+        with open(file, "rb") as fp:
+            variables = dict(pickle.load(fp))
+
+        self.save(variables).result()
+        return variables
+
+    def flush(self, timeout: Optional[float] = None):
+        "等待此前提交的保存全部完成"
+        self._submit(lambda: None).result(timeout)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def close(self):
+        "完成此前提交的保存后关闭存储"
+        with self._lock:
+            self._executor.submit(self._close)
+            self._executor.shutdown(wait = True)
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from pymud.logger import SyncLogService
+from pymud.pymud import PyMudApp
+from pymud.session import Session
+from pymud.settings import Settings
+
+
+class _App(PyMudApp):
+    "仅提供会话所需属性的应用，不创建界面"
+
+    def __init__(self):
+        self.sessions = {}
+        self.current_session = None
+        self.loggers = {}
+        self.log_service = SyncLogService()
+        self._onTimerCallbacks = {}
+        self._globals = {}
+        self._plugins = {}
+
+    def invalidate(self, pane = None, session = None):
+        pass
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def session(monkeypatch, loop):
+    monkeypatch.setitem(Settings.client, "auto_connect", False)
+    monkeypatch.setitem(Settings.client, "var_autoload", False)
+    sess = Session(_App(), "pytest", "localhost", 0, loop = loop)
+    yield sess
+    sess.closeLoggers()
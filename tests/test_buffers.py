@@ -0,0 +1,151 @@
+import re
+
+import pytest
+
+from pymud.extras import SessionBuffer, CompactSessionBuffer, LogFileBuffer
+
+
+@pytest.fixture(params = [SessionBuffer, CompactSessionBuffer])
+def buffer_class(request):
+    return request.param
+
+
+def _lines(buffer):
+    return [buffer.getLine(i) for i in range(buffer.lineCount)]
+
+
+def test_eviction(buffer_class):
+    buffer = buffer_class("test", max_buffered_lines = 5)
+    for i in range(8):
+        buffer.append(f"line{i}\n")
+
+    assert buffer.lineCount == 5
+    assert buffer.first_lineno == 3
+    assert _lines(buffer) == [f"line{i}" for i in range(3, 8)]
+
+
+def test_eviction_while_scrolled_back(buffer_class):
+    buffer = buffer_class("test", max_buffered_lines = 5)
+    for i in range(5):
+        buffer.append(f"line{i}\n")
+
+    # 向上翻页，查看 line2
+    buffer.start_lineno = 2
+    buffer.append("line5\n")
+    buffer.append("line6\n")
+    assert buffer.start_lineno == 0
+    assert buffer.getLine(buffer.start_lineno) == "line2"
+
+    # 所看的行本身被移出后，停留在首行
+    buffer.append("line7\n")
+    assert buffer.start_lineno == 0
+    assert buffer.getLine(0) == "line3"
+    assert buffer.lineCount == 5
+
+
+def test_zero_means_unlimited(buffer_class):
+    buffer = buffer_class("test", max_buffered_lines = 0)
+    for i in range(100):
+        buffer.append(f"line{i}\n")
+
+    assert buffer.lineCount == 100
+    assert buffer.first_lineno == 0
+    assert buffer.getLine(99) == "line99"
+
+
+def test_partial_lines(buffer_class):
+    buffer = buffer_class("test", max_buffered_lines = 3)
+    buffer.append("hel")
+    buffer.append("lo\nwor")
+    buffer.append("ld\n")
+    assert _lines(buffer) == ["hello", "world"]
+
+
+def test_compact_buffer_compaction():
+    reference = SessionBuffer("ref", max_buffered_lines = 7)
+    buffer = CompactSessionBuffer("test", max_buffered_lines = 7)
+    regex = re.compile("行")
+
+    for i in range(60):
+        # 含多字节字符、ANSI 颜色与跨多次追加的不完整行
+        text = f"\x1b[3{i % 8}m第{i}行 ✓" if i % 3 else f"plain {i}"
+        parts = [text[:4], text[4:] + "\n"] if i % 5 == 0 else [text + "\n"]
+        for part in parts:
+            reference.append(part)
+            buffer.append(part)
+
+        assert buffer._head < 7
+        assert len(buffer._offsets) - buffer._head == buffer.lineCount
+        assert buffer.first_lineno == reference.first_lineno
+        assert _lines(buffer) == _lines(reference)
+        assert [buffer.getLineColor(n) for n in range(buffer.lineCount)] == [reference.getLineColor(n) for n in range(reference.lineCount)]
+        assert buffer.searcher(regex, 100)() == reference.searcher(regex, 100)()
+
+        # 已移出但尚未压缩的行最多 _head 行，位于 _arena 开头
+        assert buffer._offsets[0] == 0
+        assert len(buffer._arena) - buffer._offsets[buffer._head] == sum(len(line.encode("utf-8")) for line in _lines(buffer))
+
+
+def _file_lines(path):
+    with open(path, encoding = "utf-8") as fp:
+        return fp.read().splitlines()
+
+
+@pytest.fixture
+def small_index(monkeypatch):
+    # 小文件也保存索引，并以较小的块扫描，覆盖块边界
+    monkeypatch.setattr(LogFileBuffer, "INDEX_MIN_SIZE", 1)
+    monkeypatch.setattr(LogFileBuffer, "SCAN_CHUNK", 16)
+
+
+def test_logfile_buffer_growth(tmp_path, small_index):
+    path = tmp_path.joinpath("test.log")
+    path.write_text("".join(f"行{i} line\n" for i in range(20)), encoding = "utf-8")
+    buffer = LogFileBuffer("test", str(path))
+    assert _lines(buffer) == _file_lines(path)
+
+    # 文件末尾的不完整行也作为一行，补全后不重复计数
+    with open(path, "a", encoding = "utf-8") as fp:
+        fp.write("partial")
+        fp.flush()
+        assert buffer.lineCount == 21
+        assert buffer.getLine(20) == "partial"
+
+        fp.write(" done\n" + "".join(f"more{i}\n" for i in range(5)))
+    assert _lines(buffer) == _file_lines(path)
+    assert buffer.lineCount == 26
+
+    # 覆写后重新建立索引
+    path.write_text("new\n", encoding = "utf-8")
+    assert _lines(buffer) == ["new"]
+    buffer.clear()
+
+
+def test_logfile_buffer_index_reuse(tmp_path, small_index, monkeypatch):
+    path = tmp_path.joinpath("test.log")
+    path.write_text("".join(f"line {i}\n" for i in range(50)), encoding = "utf-8")
+    buffer = LogFileBuffer("test", str(path))
+    assert buffer.lineCount == 50
+    buffer.clear()
+    assert tmp_path.joinpath("test.log.idx").exists()
+
+    with open(path, "a", encoding = "utf-8") as fp:
+        fp.write("line 50\n")
+
+    # 再次打开时载入索引，仅扫描新增部分
+    scanned = []
+    scan = LogFileBuffer._scan
+    monkeypatch.setattr(LogFileBuffer, "_scan", lambda self, start, end: (scanned.append((start, end)), scan(self, start, end)))
+    size = path.stat().st_size
+    buffer = LogFileBuffer("test", str(path))
+    assert _lines(buffer) == _file_lines(path)
+    assert scanned == [(size - len("line 50\n"), size)]
+    buffer.clear()
+
+    # 文件开头被覆写时（大小不变）索引失效，重新扫描整个文件
+    path.write_text("".join(f"LINE {i}\n" for i in range(50)) + "LINE 5X\n", encoding = "utf-8")
+    scanned.clear()
+    buffer = LogFileBuffer("test", str(path))
+    assert _lines(buffer) == _file_lines(path)
+    assert scanned == [(0, size)]
+    buffer.clear()
@@ -0,0 +1,84 @@
+import pytest
+
+from pymud.objects import CodeLine
+from pymud.settings import Settings
+
+
+def _replace_expand(code, session, *args, **kwargs):
+    "模板化之前逐项 str.replace 的展开实现，用于对照"
+    new_code_str = code
+    new_code = []
+
+    line = kwargs.get("line", None) or session.getVariable("%line", "None")
+    raw  = kwargs.get("raw", None) or session.getVariable("%raw", "None")
+    wildcards = kwargs.get("wildcards", ())
+
+    for item in CodeLine.create_line(code)[2]:
+        if len(item) == 0: continue
+        if item in (f"%{i}" for i in range(1, 10)):
+            idx = int(item[1:])
+            if idx <= len(wildcards):
+                item_val = wildcards[idx-1]
+            else:
+                item_val = "None"
+            new_code.append(item_val)
+            new_code_str = new_code_str.replace(item, f"{item_val}", 1)
+
+        elif item == "%line":
+            new_code.append(line)
+            new_code_str = new_code_str.replace(item, f"{line}", 1)
+
+        elif item == "%raw":
+            new_code.append(raw)
+            new_code_str = new_code_str.replace(item, f"{raw}", 1)
+
+        elif item[0] == "%":
+            item_val = session.getVariable(item, "")
+            new_code.append(item_val)
+            new_code_str = new_code_str.replace(item, f"{item_val}", 1)
+
+        elif item[0] == Settings.client["var_eval"]:
+            item_val = session.getVariable(item[1:], "")
+            new_code.append(item_val)
+            new_code_str = new_code_str.replace(item, f"{item_val}", 1)
+
+        else:
+            new_code.append(item)
+
+    return new_code_str, new_code
+
+
+CODES = [
+    "look",
+    "#wa 250",
+    "get %1 from %2",
+    "say %3 %1",
+    "#3 get %1 from @bag",
+    "tell @target {%line}",
+    "#info %raw",
+    "say %roomname is here",
+    "say 'hello %1' to @target",
+    "give @count gold to @target",
+    "say %1%2",
+    "#if {@hp<100} {eat}",
+]
+
+
+@pytest.mark.parametrize("code", CODES)
+def test_expand_matches_replace_loop(session, code):
+    session.setVariable("bag", "jinnang")
+    session.setVariable("target", "xiaoming")
+    session.setVariable("count", 10)
+    session.setVariable("hp", 50)
+    session.setVariable("%roomname", "扬州")
+    kwargs = dict(wildcards = ("gem", "bag"), line = "你获得了宝石。", raw = "\x1b[1m你获得了宝石。\x1b[0m")
+
+    assert CodeLine(code).expand(session, **kwargs) == _replace_expand(code, session, **kwargs)
+
+
+def test_expand_does_not_substitute_inside_values(session):
+    # 逐项 replace 时，前面代入的值中若含有后面的变量标记，会被错误替换
+    session.setVariable("target", "xiaoming")
+    line = CodeLine("say %1 @target")
+    assert line.expand(session, wildcards = ("@target", ))[0] == "say @target xiaoming"
+    assert _replace_expand("say %1 @target", session, wildcards = ("@target", ))[0] == "say xiaoming @target"
@@ -0,0 +1,84 @@
+import re
+
+import pytest
+
+from pymud.objects import Alias, Trigger, required_literal
+
+
+@pytest.mark.parametrize("pattern, literal, samples", [
+    (r"^你好(世界|朋友)", "你好", ["你好世界", "你好朋友"]),
+    (r"^(a|b)cde", "cde", ["acde", "bcde"]),
+    (r"(?:abc|abd)", "ab", ["abc", "xabd"]),
+    (r"(foo|bar)", None, ["foo", "bar"]),
+    (r"abc(def)?ghi", "abc", ["abcghi", "abcdefghi"]),
+    (r"你(好)?啊", "你", ["你啊", "你好啊"]),
+    (r"(?i:abc)def", "def", ["ABCdef", "abcdef"]),
+    (r"(?i)abc", None, ["ABC"]),
+    (r"ab{0,3}cd", "cd", ["acd", "abbbcd"]),
+    (r"x(abc){0,2}y", "x", ["xy", "xabcabcy"]),
+    (r"a\.b", "a.b", ["a.b"]),
+])
+def test_required_literal(pattern, literal, samples):
+    assert required_literal(pattern) == literal
+    for sample in samples:
+        assert re.search(pattern, sample)
+        if literal is not None:
+            assert literal in sample
+
+
+def test_required_literal_ignorecase_flag():
+    assert required_literal("abc", re.IGNORECASE) is None
+
+
+def _feed(session, line):
+    session._process_line(line + "\n", line)
+
+
+def test_prefiltered_trigger_state_is_reset(session):
+    tri = Trigger(session, r"^你获得了(\d+)点经验")
+    assert tri.prefilter == "你获得了"
+
+    _feed(session, "你获得了10点经验")
+    assert tri.state.result == Trigger.SUCCESS
+
+    # 行中不含字面字符串，触发器被跳过，状态仍与匹配失败时相同
+    _feed(session, "什么也没有发生")
+    assert tri.state.result == Trigger.NOTSET
+    assert tri.state.wildcards == ("10", )
+
+
+def test_indexed_trigger_state_is_reset(session):
+    tris = [Trigger(session, f"^word{i} (\\S+)$", id = f"tri{i}") for i in range(session.AC_MIN_PATTERNS + 4)]
+    _feed(session, "word3 hello")
+    assert session._tri_matcher is not None
+    assert tris[3].state.result == Trigger.SUCCESS
+
+    _feed(session, "word5 world")
+    assert tris[3].state.result == Trigger.NOTSET
+    assert tris[5].state.result == Trigger.SUCCESS
+
+
+def test_trigger_state_after_stop_is_kept(session):
+    first = Trigger(session, r"^stop here", priority = 10)
+    later = Trigger(session, r"^later", priority = 200)
+
+    _feed(session, "later")
+    assert later.state.result == Trigger.SUCCESS
+
+    # 高优先级触发器匹配成功后停止匹配，之后的触发器不参与匹配，状态不变
+    _feed(session, "stop here")
+    assert first.state.result == Trigger.SUCCESS
+    assert later.state.result == Trigger.SUCCESS
+
+
+def test_alias_state_is_reset(session, monkeypatch):
+    sent = []
+    monkeypatch.setattr(session, "writeline", sent.append)
+    ali = Alias(session, r"^kk (\S+)$", onSuccess = lambda id, line, wildcards: None)
+
+    session.exec_text("kk rat")
+    assert ali.state.result == Alias.SUCCESS
+
+    session.exec_text("look")
+    assert ali.state.result == Alias.NOTSET
+    assert sent == ["look"]
@@ -0,0 +1,105 @@
+import asyncio, copy, pickle, random
+
+import pytest
+
+from pymud.extras import TrackedDotDict, AhoCorasick
+
+
+def test_tracked_dotdict_records_changes():
+    d = TrackedDotDict(a = 1)
+    d.b = 2
+    d["c"] = 3
+    del d["a"]
+
+    changed, deleted = d.take_changes()
+    assert changed == {"b", "c"}
+    assert deleted == {"a"}
+    assert d.changes_count() == 0
+
+
+def test_tracked_dotdict_copy():
+    d = TrackedDotDict(a = [1, 2], b = "x")
+    d.c = 3
+
+    for dup in (copy.copy(d), copy.deepcopy(d), pickle.loads(pickle.dumps(d))):
+        assert isinstance(dup, TrackedDotDict)
+        assert dup == d
+        assert dup.b == "x"
+        # 副本的变化记录为空，且之后的修改照常记录
+        assert dup.changes_count() == 0
+        dup.d = 4
+        assert dup.take_changes() == ({"d"}, set())
+
+    assert copy.copy(d)["a"] is d["a"]
+    assert copy.deepcopy(d)["a"] is not d["a"]
+    # 原对象的变化记录不受复制影响
+    assert d.take_changes() == ({"c"}, set())
+
+
+def test_tracked_dotdict_restore_changes():
+    d = TrackedDotDict(a = 1, b = 2)
+    d["a"] = 3
+    del d["b"]
+    changes = d.take_changes()
+
+    # 取出后又被修改的键以当前记录为准
+    d["b"] = 4
+    d.restore_changes(*changes)
+    assert d.take_changes() == ({"a", "b"}, set())
+
+
+def _session_store(session, tmp_path):
+    from pymud.storage import VariableStore
+    session._variable_store = VariableStore(tmp_path.joinpath("vars.db"))
+    return session._variable_store
+
+
+def test_save_variables_keeps_changes_on_pickle_failure(session, tmp_path):
+    _session_store(session, tmp_path)
+    session.setVariable("hp", 100)
+    session.setVariable("bad", lambda: None)
+
+    with pytest.raises(Exception):
+        session.saveVariables(full = False, quiet = True)
+
+    assert session._variables.changes_count() == 2
+    session.variable_store.close()
+
+
+def test_save_variables_keeps_changes_on_write_failure(session, tmp_path, monkeypatch):
+    store = _session_store(session, tmp_path)
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_write", fail)
+    session.setVariable("hp", 100)
+    future = session.saveVariables(full = False, quiet = True)
+    with pytest.raises(OSError):
+        future.result(5)
+
+    session.loop.run_until_complete(asyncio.sleep(0))
+    assert "hp" in session._variables.take_changes()[0]
+    store.close()
+
+
+@pytest.mark.parametrize("words, text", [
+    (["he", "she", "his", "hers"], "ushers"),
+    (["a", "aa", "aaa", ""], "aaaa"),
+    (["abcd", "bc", "c", "bcx"], "abcx"),
+    (["你好", "好世", "世界", "界"], "你好世界"),
+    (["血量", "精神"], "没有匹配"),
+])
+def test_aho_corasick_examples(words, text):
+    ac = AhoCorasick(words)
+    assert ac.search(text) == {w for w in words if w and w in text}
+
+
+def test_aho_corasick_matches_naive_scan():
+    rnd = random.Random(20240601)
+    for _ in range(200):
+        words = ["".join(rnd.choice("abc") for _ in range(rnd.randint(1, 4))) for _ in range(rnd.randint(1, 12))]
+        ac = AhoCorasick(words)
+        for _ in range(5):
+            text = "".join(rnd.choice("abcd") for _ in range(rnd.randint(0, 30)))
+            assert ac.search(text) == {w for w in words if w in text}
@@ -0,0 +1,139 @@
+from pymud.extras import GMCPState
+from pymud.objects import GMCPTrigger
+
+
+def test_partial_updates_are_merged():
+    state = GMCPState()
+    state.feed("Char.Vitals", '{"hp": 100, "mp": 50, "sp": 3}')
+    state.feed("Char.Vitals", '{"sp": 4}')
+    state.feed("Char.Vitals", '{"hp": 90}')
+
+    assert state["Char.Vitals"] == {"hp": 90, "mp": 50, "sp": 4}
+    assert state.get("Char.Vitals.hp") == 90
+    assert state.get("Char.Vitals.xp", -1) == -1
+    assert "Char.Vitals.mp" in state
+
+    # 非字典内容直接替换
+    state.feed("Char.Vitals", "[1, 2]")
+    state.feed("Char.Vitals", '{"z": 1}')
+    assert state["Char.Vitals"] == {"z": 1}
+
+
+def test_merge_keeps_arrival_order():
+    state = GMCPState()
+    state.feed("Char.Status", '{"a": 1}')
+    state.feed("Char", '{"Status": {"a": 2, "b": 1}}')
+    state.feed("Char.Vitals", '{"x": 1}')
+    state.feed("Char.Status", '{"b": 3}')
+
+    assert state.get("Char.Vitals") == {"x": 1}
+    assert state.get("Char.Status") == {"a": 2, "b": 3}
+
+
+def test_decoding_is_lazy():
+    state = GMCPState()
+    state.feed("Room.Info", '{"num": 1}')
+    msg = state.feed("Room.Info", '{"num": 2}')
+    assert not msg.decoded
+
+    assert state.get("Room.Info.num") == 2
+    assert msg.decoded
+
+
+def test_overflow_keeps_all_deltas():
+    state = GMCPState()
+    state.feed("Char.Vitals", '{"hp": 100, "mp": 50}')
+    state.feed("Char.Vitals", '{"mp": 10}')
+    for i in range(70):
+        state.feed("Char.Vitals", '{"hp": %d}' % i)
+
+    assert len(state._pending.get("Char.Vitals", ())) <= GMCPState.MAX_PENDING
+    assert state.get("Char.Vitals") == {"hp": 69, "mp": 10}
+
+
+def test_overflow_keeps_order_with_overlapping_names():
+    state = GMCPState()
+    state.feed("Char.Vitals", '{"hp": 1, "mp": 1}')
+    state.feed("Char", '{"Vitals": {"mp": 2}}')
+    for i in range(GMCPState.MAX_PENDING + 1):
+        state.feed("Char.Vitals", '{"hp": %d}' % i)
+
+    assert state.get("Char.Vitals") == {"hp": GMCPState.MAX_PENDING, "mp": 2}
+
+
+def test_replacing_payload_drops_pending_without_decoding():
+    state = GMCPState()
+    msgs = [state.feed("Room.Exits", '{"n": %d}' % i) for i in range(10)]
+    state.feed("Room.Exits", '["n", "s"]')
+
+    assert state.get("Room.Exits") == ["n", "s"]
+    assert not any(msg.decoded for msg in msgs)
+
+
+def test_identical_pushes_are_stored_once():
+    state = GMCPState()
+    first = state.feed("Char.Vitals", '{"hp": 5}')
+    assert state.feed("Char.Vitals", '{"hp": 5}') is first
+
+    # 中间有其他消息时仍须保存，以保持合并顺序
+    state.feed("Char", '{"Vitals": {"hp": 1}}')
+    assert state.feed("Char.Vitals", '{"hp": 5}') is not first
+    assert state.get("Char.Vitals.hp") == 5
+
+
+def test_deep_path_subscription():
+    state = GMCPState()
+    got = []
+    state.subscribe("Char.Vitals.hp", lambda path, value: got.append(value))
+
+    msg = state.feed("Char.Vitals", '{"hp": 100, "mp": 5}')
+    assert state.affected(msg) == ["Char.Vitals.hp"]
+    msg = state.feed("Char.Vitals", '{"mp": 4}')
+    assert state.affected(msg) == []
+
+
+def test_watch_and_subscribe_are_independent():
+    state = GMCPState()
+    callback = lambda path, value: None
+    state.watch("Char.Vitals.hp")
+    state.subscribe("Char.Vitals.hp", callback)
+    state.unsubscribe("Char.Vitals.hp", callback)
+
+    msg = state.feed("Char.Vitals", '{"hp": 1}')
+    assert state.affected(msg) == ["Char.Vitals.hp"]
+
+    state.watch("Char.Vitals.hp")
+    state.unwatch("Char.Vitals.hp")
+    assert state.affected(msg) == ["Char.Vitals.hp"]
+
+    state.unwatch("Char.Vitals.hp")
+    assert state.affected(msg) == []
+
+
+def test_session_gmcp_triggers(session):
+    got = []
+    GMCPTrigger(session, "Char.Vitals", onSuccess = lambda name, line, value: got.append((name, value)))
+    hp = GMCPTrigger(session, "Char.Vitals.hp", onSuccess = lambda name, line, value: got.append((name, value)))
+
+    session.feed_gmcp("Char.Vitals", '{"hp": 100, "mp": 50}')
+    session.feed_gmcp("Char.Vitals", '{"mp": 40}')
+    assert got == [
+        ("Char.Vitals", {"hp": 100, "mp": 50}),
+        ("Char.Vitals.hp", 100),
+        ("Char.Vitals", {"mp": 40}),
+    ]
+
+    # 删除深层路径触发器后，不再为其解析消息
+    session.delObject(hp)
+    msg = session.gmcp_state.feed("Char.Vitals", '{"hp": 1}')
+    assert session.gmcp_state.affected(msg) == ["Char.Vitals"]
+    assert not msg.decoded
+
+
+def test_session_replaced_gmcp_trigger_keeps_watch(session):
+    GMCPTrigger(session, "Char.Vitals.hp")
+    GMCPTrigger(session, "Char.Vitals.hp")
+    session.delGMCP("Char.Vitals.hp")
+
+    msg = session.gmcp_state.feed("Char.Vitals", '{"hp": 1}')
+    assert session.gmcp_state.affected(msg) == []
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from pymud.logger import Logger, ThreadedLogService
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    service = ThreadedLogService()
+    yield service
+    service.shutdown(timeout = 5)
+
+
+def _read(name):
+    with open(f"log/{name}.log", encoding = "utf-8") as f:
+        return f.read()
+
+
+def test_failed_write_does_not_stop_worker(service, monkeypatch):
+    bad = Logger("bad", raw = True, service = service)
+    good = Logger("good", raw = True, service = service)
+    bad.enabled = good.enabled = True
+
+    def fail(batch):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(bad, "_write", fail)
+    bad.log("lost\n")
+    good.log("first\n")
+    assert service.flush(timeout = 5)
+
+    good.log("second\n")
+    assert good.flush(timeout = 5)
+    assert bad._dropped == 1
+    assert _read("good").count("first") == 1
+    assert "second" in _read("good")
+
+    bad.enabled = good.enabled = False
+
+
+def test_flush_after_shutdown_timeout(service, monkeypatch):
+    logger = Logger("slow", raw = True, service = service)
+    logger.enabled = True
+
+    blocked = threading.Event()
+    release = threading.Event()
+    write = logger._write
+
+    def slow_write(batch):
+        blocked.set()
+        release.wait(5)
+        return write(batch)
+
+    monkeypatch.setattr(logger, "_write", slow_write)
+    logger.log("first\n")
+    assert blocked.wait(5)
+
+    # 停止超时后线程仍在写入，之后的信息和刷新请求不应无人处理
+    service.shutdown(timeout = 0.05)
+    logger.log("second\n")
+    assert not logger.flush(timeout = 0.05)
+
+    release.set()
+    assert logger.flush(timeout = 5)
+    text = _read("slow")
+    assert text.index("first") < text.index("second")
+
+    logger.enabled = False
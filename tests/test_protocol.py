@@ -0,0 +1,110 @@
+import zlib
+
+import pytest
+
+from pymud.protocol import MudClientProtocol, IAC, WILL, DO, SB, SE, GA, GMCP, MCCP2, DONT
+from pymud.settings import Settings
+
+
+class _Session:
+    "记录协议对象调用的会话"
+
+    def __init__(self):
+        self.text = b""
+        self.gmcp = []
+        self.written = []
+
+    def feed_lines(self, lines):
+        self.text += b"\n".join(lines)
+
+    def feed_gmcp(self, name, value):
+        self.gmcp.append((name, value))
+
+    def go_ahead(self):
+        pass
+
+    def write(self, data):
+        self.written.append(data)
+
+
+class _Transport:
+    def get_extra_info(self, name, default = None):
+        return default
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse = True)
+def _options(monkeypatch):
+    monkeypatch.setitem(Settings.server, "GMCP", True)
+    monkeypatch.setitem(Settings.server, "MCCP2", True)
+
+
+def _protocol():
+    session = _Session()
+    protocol = MudClientProtocol(session, encoding = "utf-8")
+    protocol.connection_made(_Transport())
+    return protocol, session
+
+
+STREAM = (
+    b"hello\n"
+    + IAC + WILL + GMCP
+    + "中文\n".encode("utf-8")
+    + IAC + SB + GMCP + b'Char.Vitals {"hp": 100}' + IAC + SE
+    + b"prompt>" + IAC + GA
+    + b"end\n"
+)
+
+
+def _feed(protocol, data, chunk_size):
+    for pos in range(0, len(data), chunk_size):
+        protocol.data_received(data[pos:pos + chunk_size])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, len(STREAM)])
+def test_iac_sequences_split_across_packets(chunk_size):
+    protocol, session = _protocol()
+    _feed(protocol, STREAM, chunk_size)
+
+    assert session.text == "hello\n中文\nprompt>end\n".encode("utf-8")
+    assert session.gmcp == [("Char.Vitals", '{"hp": 100}')]
+    assert session.written == [IAC + DO + GMCP]
+    assert protocol._state_machine == "normal"
+
+
+def _compress(data):
+    compressor = zlib.compressobj()
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH)
+
+
+def test_mccp2_start_with_trailing_compressed_data():
+    protocol, session = _protocol()
+    compressed = _compress(b"zipped\n" + IAC + SB + GMCP + b"Room.Info {}" + IAC + SE + b"more\n")
+
+    # 压缩开始的子协商与其后的压缩数据在同一个数据包中
+    protocol.data_received(b"plain\n" + IAC + SB + MCCP2 + IAC + SE + compressed[:10])
+    protocol.data_received(compressed[10:] + b"after\n")
+
+    assert session.text == b"plain\nzipped\nmore\nafter\n"
+    assert session.gmcp == [("Room.Info", "{}")]
+    assert protocol._mccp2_decompressor is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 64])
+def test_mccp2_stream_split_across_packets(chunk_size):
+    protocol, session = _protocol()
+    body = b"".join(b"line %d\n" % i for i in range(50))
+    _feed(protocol, IAC + SB + MCCP2 + IAC + SE + _compress(body) + b"tail\n", chunk_size)
+
+    assert session.text == body + b"tail\n"
+    assert protocol._bytes_inflated_count == len(body)
+
+
+def test_mccp2_corrupt_stream_stops_compression():
+    protocol, session = _protocol()
+    protocol.data_received(IAC + SB + MCCP2 + IAC + SE + b"not zlib data")
+
+    assert protocol._mccp2_decompressor is None
+    assert session.written == [IAC + DONT + MCCP2]
@@ -0,0 +1,39 @@
+from pymud.objects import Trigger
+
+
+def _lines(session):
+    buffer = session.buffer
+    return [buffer.getLine(i) for i in range(buffer.lineCount)]
+
+
+def test_partial_lines_across_packets(session):
+    got = []
+    Trigger(session, r"^你好，(\S+)$", onSuccess = lambda id, line, wildcards: got.append(wildcards[0]))
+
+    session.feed_data(b"line one\nhel")
+    assert got == []
+    session.feed_data(b"lo\n")
+    session.feed_data("你好，世界".encode("utf-8"))
+    assert got == []
+    session.feed_data(b"\n")
+
+    assert got == ["世界"]
+    assert _lines(session)[:3] == ["line one", "hello", "你好，世界"]
+
+
+def test_multibyte_character_split_across_packets(session):
+    data = "中文测试\n".encode("utf-8")
+    for i in range(len(data)):
+        session.feed_data(data[i:i + 1])
+
+    assert _lines(session)[0] == "中文测试"
+
+
+def test_encoding_change_rebuilds_decoder(session):
+    session.feed_data("第一行\n".encode("utf-8"))
+    session.encoding = "gbk"
+    data = "第二行\n".encode("gbk")
+    session.feed_data(data[:3])
+    session.feed_data(data[3:])
+
+    assert _lines(session)[:2] == ["第一行", "第二行"]
@@ -0,0 +1,31 @@
+from pymud.objects import Timer
+
+
+def test_timer_fires_when_called_early(session, monkeypatch):
+    loop = session.loop
+    got = []
+    timer = Timer(session, timeout = 10, onSuccess = lambda id: got.append(id))
+    deadline = timer._deadline
+
+    # 事件循环在时钟分辨率范围内提前执行回调时，定时器应当触发而不是重新安排同一时间
+    monkeypatch.setattr(loop, "time", lambda: deadline - loop._clock_resolution / 2)
+    session._timer_scheduler._fire()
+
+    assert got == [timer.id]
+    assert timer._deadline == deadline + 10
+    assert session._timer_scheduler._handle_when == deadline + 10
+    timer.reset()
+
+
+def test_timer_not_fired_before_deadline(session, monkeypatch):
+    loop = session.loop
+    got = []
+    timer = Timer(session, timeout = 10, onSuccess = lambda id: got.append(id))
+    deadline = timer._deadline
+
+    monkeypatch.setattr(loop, "time", lambda: deadline - 1)
+    session._timer_scheduler._fire()
+
+    assert got == []
+    assert timer._deadline == deadline
+    timer.reset()
@@ -0,0 +1,53 @@
+import pytest
+from wcwidth import wcswidth
+
+from pymud.extras import DStr, str_width, char_width
+
+
+SAMPLES = [
+    "hello",
+    "中文字符",
+    "ａｂｃ全角",
+    "─┼│",
+    "a\tb",
+    "\x1b[1m",
+    "❤️",                       # VS16
+    "✈︎",                       # VS15
+    "👍",                        # 非BMP
+    "👨‍👩",                # ZWJ 序列
+    "👨‍👩‍👧‍👦",
+    "a‍b",
+    "中️文",
+    "血量❤️: 100 👍",
+]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_str_width_matches_wcswidth(text):
+    assert str_width(text) == wcswidth(text)
+    if wcswidth(text) >= 0:
+        assert len(DStr(text)) == wcswidth(text)
+
+
+def test_char_width_matches_wcswidth():
+    for text in SAMPLES:
+        for ch in text:
+            assert char_width(ch) == wcswidth(ch)
+
+
+@pytest.mark.parametrize("text", ["血量❤️❤️❤️状态", "👨‍👩👨‍👩👨‍👩", "中文字符串中文字符串"])
+def test_split_by_printable_width(session, text):
+    # 与逐前缀调用 wcswidth 的原实现结果相同
+    def naive(s, printable_length):
+        result, start, remain = [], 0, False
+        for idx in range(1, len(s)):
+            remain = True
+            if wcswidth(s[start:idx]) >= printable_length:
+                result.append(s[start:idx])
+                start, remain = idx, False
+        if remain:
+            result.append(s[start:])
+        return result
+
+    for size in (1, 2, 3, 4, 5):
+        assert session.splitByPrintableWidth(text, size) == naive(text, size)